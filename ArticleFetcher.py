@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+from urllib3.util.retry import Retry  # type: ignore
+
+from FileUtils import atomic_output
+from PipelineMetrics import metrics
+
+
+class ArticleFetcher:
+    def __init__(self, cache_path, max_workers=4, timeout=(5, 30), retries=3,
+                 backoff=0.5, user_agent="Mozilla/5.0"):
+        """
+        Download article pages concurrently through one pooled session.
+        Pages are cached on disk with their ETag / Last-Modified headers and
+        revalidated with a conditional GET, so an unchanged page costs a
+        304 answer instead of a full download.
+        :param timeout: (connect, read) timeout in seconds.
+        :param retries: Retries on connection errors and 429/5xx answers,
+                        with exponential backoff (backoff * 2 ** retry).
+        """
+        self.cache_path = cache_path
+        os.makedirs(cache_path, exist_ok=True)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        retry = Retry(total=retries, backoff_factor=backoff,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=max_workers,
+                              pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"downloaded": 0, "not_modified": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def cache_files(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return (f"{self.cache_path}/{digest}.html",
+                f"{self.cache_path}/{digest}.json")
+
+    def fetch(self, url):
+        """
+        :return: The page html, or None if it can't be fetched and isn't
+                 cached.
+        """
+        # Its own stage, the pages are fetched by worker threads
+        with metrics.stage("fetch_article", url=url):
+            return self.fetch_page(url)
+
+    def fetch_page(self, url):
+        html_path, meta_path = self.cache_files(url)
+        meta = {}
+        if os.path.exists(meta_path) and os.path.exists(html_path):
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers,
+                                        timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"   +-- Failed to fetch {url}: {e}")
+            self.count("failed")
+            return self.read_cache(html_path) if meta else None
+        if response.status_code == 304 and meta:
+            self.count("not_modified")
+            metrics.add("cache_hits")
+            return self.read_cache(html_path)
+        if response.status_code != 200:
+            print(f"   +-- Failed to fetch {url}: {response.status_code}")
+            self.count("failed")
+            return None
+        self.count("downloaded")
+        metrics.add("bytes", len(response.content))
+        html = response.text
+        with atomic_output(html_path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(html)
+        meta = {"url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")}
+        with atomic_output(meta_path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(meta, file)
+        return html
+
+    def read_cache(self, html_path):
+        with open(html_path, 'r', encoding='utf-8') as file:
+            return file.read()
+
+    def fetch_all(self, urls):
+        """
+        Fetch urls concurrently.
+        :return: Generator of (url, html) pairs, in the order the pages
+                 arrive, so each page can be processed while the others
+                 are still downloading.
+        """
+        urls = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def feed_urls(self, feed):
+        """
+        Article urls of a feed: a list of urls, a text file with one url
+        per line, or the url of an RSS / Atom feed.
+        """
+        if isinstance(feed, (list, tuple)):
+            return list(feed)
+        if os.path.exists(feed):
+            with open(feed, 'r', encoding='utf-8') as file:
+                return [line.strip() for line in file
+                        if line.strip() and not line.startswith("#")]
+        xml = self.fetch(feed)
+        if xml is None:
+            return []
+        urls = []
+        for item in ET.fromstring(xml).iter():
+            if item.tag.rsplit("}", 1)[-1] not in ("item", "entry"):
+                continue
+            for link in item:
+                if link.tag.rsplit("}", 1)[-1] == "link":
+                    # RSS: <link>url</link>, Atom: <link href="url"/>
+                    urls.append(link.get("href") or (link.text or "").strip())
+                    break
+        return [url for url in urls if url]
@@ -1,14 +1,20 @@
-from TTS.api import TTS  # type: ignore
 import json
 import re
 import os
 import shutil
+import wave
+
+from PipelineMetrics import metrics
+from Profiler import profiler
+from Backends import make_backend
 
 
 class AudioGenerator:
-    def __init__(self, base_path, json_path):
+    def __init__(self, base_path, json_path, backends=None):
         # Sentence Splitter
         self.base_path = base_path
+        # "backends" entry of config.json, see Backends.make_backend
+        self.backends = backends
         self.json_file_path = f"{base_path}/{json_path}"
         with open(self.json_file_path, 'r') as file:
             self.fun_facts = json.load(file)
@@ -42,18 +48,58 @@ class AudioGenerator:
         audio_file_path = f"{audio_folder_path}/audio.wav"
         self.recreate_folder(audio_folder_path)
         # Load a multi-speaker model
-        tts = TTS(model_name="tts_models/en/vctk/vits",
-                  progress_bar=False,
-                  gpu=False)
+        with metrics.stage("tts_load"):
+            tts = make_backend("tts", self.backends)
 
         # List available speakers (optional)
         print("Available speakers:", tts.speakers)
 
-        self.process_script(fact_key)
+        with metrics.stage("tts", fact_key, speaker=speaker_id):
+            self.process_script(fact_key)
+
+            sections = self.fun_facts["fun_facts"][fact_key].get(
+                "video_script_sections")
+            if not sections:
+                # Generate audio with a specific speaker ID
+                with profiler.section("tts_to_file"):
+                    tts.tts_to_file(
+                        text=self.processed_script,
+                        speaker=speaker_id,  # Specify the speaker ID
+                        file_path=audio_file_path
+                    )
+                metrics.add("bytes", os.path.getsize(audio_file_path))
+                return
+
+            # Synthesize section by section to know where each one ends in the
+            # narration, then join the parts into a single audio file
+            part_paths = []
+            for s_id, section in enumerate(sections):
+                part_path = f"{audio_folder_path}/part_{s_id}.wav"
+                with profiler.section("tts_to_file"):
+                    tts.tts_to_file(text=section, speaker=speaker_id,
+                                    file_path=part_path)
+                metrics.add("bytes", os.path.getsize(part_path))
+                part_paths.append(part_path)
+            durations = self.concatenate_wav(part_paths, audio_file_path)
+            for part_path in part_paths:
+                os.remove(part_path)
 
-        # Generate audio with a specific speaker ID
-        tts.tts_to_file(
-            text=self.processed_script,
-            speaker=speaker_id,  # Specify the speaker ID
-            file_path=audio_file_path
-        )
+        self.fun_facts["fun_facts"][fact_key]["audio_section_durations"] = durations
+        with open(self.json_file_path, "w", encoding="utf-8") as f:
+            json.dump(self.fun_facts, f, indent=4, ensure_ascii=False)
+
+    def concatenate_wav(self, part_paths, output_path):
+        """
+        Join WAV files with the same format.
+        :return: Duration in seconds of each part.
+        """
+        durations = []
+        with wave.open(output_path, "wb") as out:
+            for i, part_path in enumerate(part_paths):
+                with wave.open(part_path, "rb") as part:
+                    if i == 0:
+                        out.setparams(part.getparams())
+                    frames = part.readframes(part.getnframes())
+                    durations.append(part.getnframes() / part.getframerate())
+                out.writeframes(frames)
+        return durations
@@ -0,0 +1,464 @@
+import io
+import os
+import json
+import time
+import base64
+import zlib
+import typing
+import inspect
+import urllib.error
+import urllib.request
+
+import numpy as np  # type: ignore
+
+from SyntheticMedia import write_synthetic_video, write_synthetic_wav
+
+# Backend used for each kind when config.json doesn't name one
+DEFAULT_BACKENDS = {
+    "llm": "ollama",
+    "vision": "moondream",
+    "tts": "coqui",
+    "video_source": "youtube",
+}
+
+# Default address of a ModelServer (the "server" vision and tts backends)
+SERVER_URL = "http://127.0.0.1:8765"
+
+
+@typing.runtime_checkable
+class LLMBackend(typing.Protocol):
+    """Text / vision LLM, same calls as the ollama module."""
+
+    def chat(self, model, messages, **kwargs): ...
+
+    def generate(self, model, prompt, **kwargs): ...
+
+    def embed(self, model, input, **kwargs): ...
+
+
+@typing.runtime_checkable
+class VisionBackend(typing.Protocol):
+    """Frame scoring model, same calls as a moondream model."""
+
+    def encode_image(self, image): ...
+
+    def query(self, encoded_image, prompt, stream=False, settings=None): ...
+
+
+@typing.runtime_checkable
+class TTSBackend(typing.Protocol):
+    """Speech synthesis, same calls as TTS.api.TTS."""
+
+    speakers: typing.List[str]
+
+    def tts_to_file(self, text, speaker=None, file_path="output.wav",
+                    **kwargs): ...
+
+
+@typing.runtime_checkable
+class VideoSourceBackend(typing.Protocol):
+    """Video search and download."""
+
+    def search(self, query, max_results=5): ...
+
+    def details(self, video_url): ...
+
+    def download(self, video_url, output_dir): ...
+
+
+def seed_of(*parts):
+    """Stable seed of strings / bytes (hash() changes between runs)."""
+    return zlib.crc32(b"\0".join(
+        p if isinstance(p, bytes) else str(p).encode("utf-8")
+        for p in parts))
+
+
+class StubLLM:
+    def __init__(self, latency=0.02, dim=64, chunk_size=8):
+        """
+        In-process stand-in for Ollama: answers at a fixed latency per
+        call, the same request always gets the same answer.
+        - format=<JSON schema> answers an instance of the schema,
+        - messages with images (LLaVA) answer "good" or "bad",
+        - other chats answer a script of [visuals] "narration" lines,
+        - embed gives unit vectors seeded by the text.
+        Streamed answers come in chunks of chunk_size characters.
+        """
+        self.latency = latency
+        self.dim = dim
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def answer(self, messages, format=None):
+        message = messages[-1]
+        seed = seed_of(message.get("content", ""))
+        if isinstance(format, dict):
+            return json.dumps(self.sample(format, seed))
+        if message.get("images"):
+            return "bad" if seed_of(*message["images"]) % 3 == 0 else "good"
+        return "\n".join(f'[Stub visuals {seed % 100}-{i}]\n'
+                         f'"Stub narration sentence {i} of the fact."'
+                         for i in range(6))
+
+    def sample(self, schema, seed, name="value"):
+        """
+        Deterministic instance of a JSON schema (objects, arrays, scalars),
+        arrays get minItems items (3 by default, at most maxItems).
+        """
+        kind = schema.get("type")
+        if kind == "object":
+            return {key: self.sample(value, seed, key)
+                    for key, value in schema.get("properties", {}).items()}
+        if kind == "array":
+            size = schema.get("minItems", 3)
+            size = min(size, schema.get("maxItems", size))
+            return [self.sample(schema["items"], seed + i, f"{name} {i}")
+                    for i in range(size)]
+        if kind == "integer":
+            return seed % 3
+        if kind == "number":
+            return float(seed % 3)
+        if kind == "boolean":
+            return seed % 2 == 0
+        return f"Stub {name} {seed % 1000}."
+
+    def reply(self, key, text, stream):
+        nanoseconds = int(self.latency * 1e9)
+        done = {"done": True, "load_duration": 0,
+                "prompt_eval_duration": nanoseconds // 2,
+                "eval_duration": nanoseconds - nanoseconds // 2}
+
+        def chunk(piece):
+            if key == "message":
+                return {"message": {"role": "assistant", "content": piece}}
+            return {key: piece}
+
+        if not stream:
+            return dict(chunk(text), **done)
+
+        def chunks():
+            for start in range(0, len(text), self.chunk_size):
+                yield dict(chunk(text[start:start + self.chunk_size]),
+                           done=False)
+            yield dict(chunk(""), **done)
+        return chunks()
+
+    def chat(self, model, messages, format=None, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.reply("message", self.answer(messages, format), stream)
+
+    def generate(self, model, prompt="", format=None, stream=False,
+                 **kwargs):
+        if not prompt:
+            # Load / unload request
+            return self.reply("response", "", stream)
+        self.calls += 1
+        time.sleep(self.latency)
+        text = self.answer([{"content": prompt}], format)
+        return self.reply("response", text, stream)
+
+    def embed(self, model, input, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        texts = [input] if isinstance(input, str) else list(input)
+        vectors = [np.random.default_rng(seed_of(text))
+                   .standard_normal(self.dim).tolist() for text in texts]
+        return {"embeddings": vectors}
+
+
+class StubVision:
+    def __init__(self, latency=0.005, yes_ratio=2 / 3):
+        """
+        Stand-in for moondream: "yes" for about yes_ratio of the frames,
+        decided by the frame content and the prompt.
+        """
+        self.latency = latency
+        self.yes_ratio = yes_ratio
+        self.calls = 0
+
+    def encode_image(self, image):
+        return seed_of(image.tobytes())
+
+    def text(self, answer, stream):
+        return iter([answer]) if stream else answer
+
+    def query(self, encoded_image, prompt, stream=False, settings=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        draw = seed_of(encoded_image, prompt) % 1000 / 1000
+        return {"answer": self.text("yes" if draw < self.yes_ratio else "no",
+                                    stream)}
+
+    def caption(self, encoded_image, length="normal", stream=False,
+                settings=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"caption": self.text(f"Stub frame {encoded_image % 1000}.",
+                                     stream)}
+
+
+class StubTTS:
+    def __init__(self, latency=0.01, words_per_second=2.5, rate=22050):
+        """Stand-in for Coqui TTS: a sine wave as long as the speech."""
+        self.latency = latency
+        self.words_per_second = words_per_second
+        self.rate = rate
+        self.speakers = ["p314"]
+
+    def tts_to_file(self, text, speaker=None, file_path="output.wav",
+                    **kwargs):
+        time.sleep(self.latency)
+        seconds = max(0.5, len(text.split()) / self.words_per_second)
+        write_synthetic_wav(file_path, seconds, self.rate)
+        return file_path
+
+
+class StubVideoSource:
+    def __init__(self, latency=0.05, seconds=20, width=640, height=360,
+                 fps=24):
+        """
+        Stand-in for YouTube: search results derived from the query,
+        downloads are synthetic videos of colour blocks scrolling across
+        the frame, busy enough to pass FramePreFilter.
+        """
+        self.latency = latency
+        self.seconds = seconds
+        self.size = (width, height)
+        self.fps = fps
+
+    def entry(self, video_id, title):
+        return {
+            'title': title,
+            'video_id': video_id,
+            'description': f"Synthetic video {video_id}",
+            'duration': self.seconds,
+            'view_count': seed_of(video_id) % 100000,
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+            'thumbnail': '',
+            'channel': 'Stub channel',
+            'upload_date': '20240101'
+        }
+
+    def search(self, query, max_results=5):
+        time.sleep(self.latency)
+        return [self.entry(f"stub{seed_of(query, i):08x}",
+                           f"Stub video {i} for {query}")
+                for i in range(max_results)]
+
+    def details(self, video_url):
+        video_id = video_url.rsplit("=", 1)[-1]
+        return dict(self.entry(video_id, f"Stub video {video_id}"),
+                    id=video_id)
+
+    def download(self, video_url, output_dir):
+        time.sleep(self.latency)
+        os.makedirs(output_dir, exist_ok=True)
+        video_id = video_url.rsplit("=", 1)[-1]
+        path = os.path.join(output_dir, f"{video_id}.mp4")
+        if not os.path.exists(path):
+            write_synthetic_video(path, *self.size, self.seconds, self.fps,
+                                  seed=seed_of(video_id))
+        return path
+
+
+class YouTubeSource:
+    def __init__(self, min_interval=1):
+        """
+        Search and download with yt_dlp.
+        :param min_interval: Minimum seconds between search requests.
+        """
+        self.ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': True,  # Don't download videos
+        }
+        self.last_request_time = 0
+        self.min_interval = min_interval
+
+    def _rate_limit(self):
+        """Simple rate limiting"""
+        current_time = time.time()
+        time_passed = current_time - self.last_request_time
+        if time_passed < self.min_interval:
+            time.sleep(self.min_interval - time_passed)
+        self.last_request_time = time.time()
+
+    def search(self, query, max_results=5):
+        from yt_dlp import YoutubeDL  # type: ignore
+
+        self._rate_limit()
+        with YoutubeDL(self.ydl_opts) as ydl:
+            search_results = ydl.extract_info(
+                f"ytsearch{max_results}:{query}", download=False)
+        videos = []
+        for entry in search_results.get('entries') or []:
+            videos.append({
+                'title': entry.get('title', 'No title'),
+                'video_id': entry.get('id', 'No ID'),
+                'description': entry.get('description', 'No desc'),
+                'duration': entry.get('duration', 0),
+                'view_count': entry.get('view_count', 0),
+                'url': f"https://www.youtube.com/watch?v={entry.get('id')}",
+                'thumbnail': entry.get('thumbnail', ''),
+                'channel': entry.get('channel', 'Unknown channel'),
+                'upload_date': entry.get('upload_date', 'No date')
+            })
+        return videos
+
+    def details(self, video_url):
+        from yt_dlp import YoutubeDL  # type: ignore
+
+        with YoutubeDL(self.ydl_opts) as ydl:
+            return ydl.extract_info(video_url, download=False)
+
+    def download(self, video_url, output_dir):
+        from yt_dlp import YoutubeDL  # type: ignore
+
+        os.makedirs(output_dir, exist_ok=True)
+        download_opts = {
+            'format': 'best',  # Download the best quality available
+            'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+            'quiet': True,
+            'no_warnings': True,
+        }
+        with YoutubeDL(download_opts) as ydl:
+            info = ydl.extract_info(video_url, download=True)
+            return ydl.prepare_filename(info)
+
+
+class ServerClient:
+    def __init__(self, url=SERVER_URL, timeout=600, retries=5):
+        """
+        Client of a ModelServer, the models stay loaded in the server
+        process between pipeline runs.
+        :param retries: Attempts left when the server queue is full (503),
+                        one second apart, then two, four...
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+
+    def request(self, path, payload=None):
+        """:return: Response body, GET without payload, POST with one."""
+        data = None if payload is None else json.dumps(payload).encode()
+        for attempt in range(self.retries + 1):
+            request = urllib.request.Request(
+                self.url + path, data=data,
+                headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request,
+                                            timeout=self.timeout) as response:
+                    return response.read()
+            except urllib.error.HTTPError as e:
+                if e.code == 503 and attempt < self.retries:
+                    time.sleep(2 ** attempt)
+                    continue
+                raise RuntimeError(f"Model server {self.url}{path}: "
+                                   f"{e.code} {e.read().decode()}") from e
+            except urllib.error.URLError as e:
+                raise RuntimeError(f"No model server at {self.url}, start "
+                                   f"one with python ModelServer.py") from e
+
+    def health(self):
+        return json.loads(self.request("/health"))
+
+    def metrics(self):
+        return json.loads(self.request("/metrics"))
+
+
+class ServerVision(ServerClient):
+    """Vision model of a ModelServer, same calls as a moondream model."""
+
+    def encode_image(self, image):
+        # The model encoding runs in the server, send the pixels
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    def answer(self, path, payload, key, stream):
+        text = json.loads(self.request(path, payload))[key]
+        return {key: iter([text]) if stream else text}
+
+    def query(self, encoded_image, prompt, stream=False, settings=None):
+        return self.answer("/vision/query", {
+            "image": encoded_image, "prompt": prompt, "settings": settings},
+            "answer", stream)
+
+    def caption(self, encoded_image, length="normal", stream=False,
+                settings=None):
+        return self.answer("/vision/caption", {
+            "image": encoded_image, "length": length, "settings": settings},
+            "caption", stream)
+
+
+class ServerTTS(ServerClient):
+    """TTS model of a ModelServer, same calls as TTS.api.TTS."""
+
+    @property
+    def speakers(self):
+        return self.health()["speakers"]
+
+    def tts_to_file(self, text, speaker=None, file_path="output.wav",
+                    **kwargs):
+        wav = self.request("/tts", {"text": text, "speaker": speaker})
+        with open(file_path, "wb") as file:
+            file.write(wav)
+        return file_path
+
+
+def ollama_llm(host=None):
+    import ollama  # type: ignore
+
+    return ollama.Client(host=host) if host else ollama
+
+
+def moondream_vision(model_path):
+    import moondream as md  # type: ignore
+
+    return md.vl(model=model_path)
+
+
+def coqui_tts(model_name="tts_models/en/vctk/vits", gpu=False):
+    from TTS.api import TTS  # type: ignore
+
+    return TTS(model_name=model_name, progress_bar=False, gpu=gpu)
+
+
+# {kind: {name: factory}}, the real backends import their library lazily
+BACKENDS = {
+    "llm": {"ollama": ollama_llm, "stub": StubLLM},
+    "vision": {"moondream": moondream_vision, "stub": StubVision,
+               "server": ServerVision},
+    "tts": {"coqui": coqui_tts, "stub": StubTTS, "server": ServerTTS},
+    "video_source": {"youtube": YouTubeSource, "stub": StubVideoSource},
+}
+
+
+def make_backend(kind, backends=None, **defaults):
+    """
+    Backend of kind selected by the "backends" entry of config.json:
+    "stub" for stubs everywhere, or {kind: name} or
+    {kind: {"name": name, **options}}, e.g.
+    {"vision": {"name": "stub", "latency": 0.05}, "llm": "ollama"}.
+    "server" vision and tts are clients of a ModelServer, e.g.
+    {"vision": {"name": "server", "url": "http://127.0.0.1:8765"}}.
+    :param defaults: Arguments from the caller (e.g. model_path), the
+                     config options override them. The stubs and server
+                     clients ignore the ones they don't take.
+    """
+    if isinstance(backends, str):
+        backends = {kind: backends}
+    settings = (backends or {}).get(kind, DEFAULT_BACKENDS[kind])
+    if isinstance(settings, str):
+        settings = {"name": settings}
+    options = dict(settings)
+    name = options.pop("name", DEFAULT_BACKENDS[kind])
+    if name not in BACKENDS[kind]:
+        raise ValueError(f"Unknown {kind} backend {name!r}, expected one of "
+                         f"{sorted(BACKENDS[kind])}")
+    factory = BACKENDS[kind][name]
+    if name in ("stub", "server"):
+        accepted = inspect.signature(factory).parameters
+        defaults = {k: v for k, v in defaults.items() if k in accepted}
+    return factory(**dict(defaults, **options))
@@ -0,0 +1,194 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np  # type: ignore
+
+from FileUtils import file_lock
+
+
+def file_hash(path):
+    """SHA-1 of the content of path."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ClipLibrary:
+    def __init__(self, library_path, nb_planes=12, seed=0):
+        """
+        Persistent library of every relevant clip extracted so far.
+        Clip files are copied into the library, their embeddings are
+        appended to a float32 matrix read through a memory map, and the
+        metadata (source video, time range, keywords...) to a JSON lines
+        file, so inserts are incremental and nothing is loaded up front.
+        Search is approximate: random hyperplane LSH buckets select the
+        candidates, which are then ranked by exact cosine similarity.
+        A clip file already in the library (same content) isn't added
+        again. The metadata line is written last, so a clip only counts
+        once it is complete, rows left by an interrupted insert are
+        dropped on load.
+        Several processes can share a library (JobQueue workers): inserts
+        and loads hold a lock file, and an insert first loads the clips the
+        other processes added.
+        :param nb_planes: Bits of the LSH signature.
+        """
+        self.library_path = library_path
+        self.clips_path = f"{library_path}/clips"
+        self.vectors_path = f"{library_path}/vectors.f32"
+        self.meta_path = f"{library_path}/meta.jsonl"
+        self.lock_path = f"{library_path}/.lock"
+        os.makedirs(self.clips_path, exist_ok=True)
+        self.nb_planes = nb_planes
+        self.seed = seed
+
+        self.meta = []
+        self.dim = None
+        self.hashes = {}
+        self.planes = None
+        self.buckets = {}
+        self.vectors = None
+        with file_lock(self.lock_path):
+            self.refresh()
+
+    def refresh(self):
+        """Index the clips added since the last load, under the lock."""
+        meta = self.align_vectors(*self.load_meta())
+        start = len(self.meta)
+        if len(meta) <= start:
+            return
+        self.meta = meta
+        self.dim = meta[0]["dim"]
+        if self.planes is None:
+            self.init_planes(self.dim)
+        # Reopened with the new size
+        self.vectors = None
+        signatures = self.signatures(self.load_vectors()[start:])
+        for clip_id, signature in enumerate(signatures, start):
+            self.buckets.setdefault(int(signature), []).append(clip_id)
+            self.hashes[meta[clip_id].get("clip_hash")] = clip_id
+
+    def load_meta(self):
+        """
+        :return: (metadata records, False when the file ends with a line
+                 cut by an interrupted write, dropped from the records)
+        """
+        meta = []
+        if not os.path.exists(self.meta_path):
+            return meta, True
+        with open(self.meta_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    meta.append(json.loads(line))
+                except json.JSONDecodeError:
+                    return meta, False
+        return meta, True
+
+    def align_vectors(self, meta, complete=True):
+        """
+        Keep the vectors and metadata rows aligned: drop the vectors
+        written after the last complete metadata line, and the metadata
+        lines without a vector.
+        :return: The metadata records kept.
+        """
+        row_bytes = 4 * meta[0]["dim"] if meta else 0
+        size = (os.path.getsize(self.vectors_path)
+                if os.path.exists(self.vectors_path) else 0)
+        nb_vectors = size // row_bytes if row_bytes else 0
+        if nb_vectors < len(meta) or not complete:
+            meta = meta[:nb_vectors]
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record, ensure_ascii=False) + "\n"
+                             for record in meta)
+        if size != len(meta) * row_bytes:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(len(meta) * row_bytes)
+        return meta
+
+    def init_planes(self, dim):
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.nb_planes, dim)).astype(np.float32)
+
+    def signatures(self, vectors):
+        bits = (vectors @ self.planes.T) > 0
+        return bits @ (1 << np.arange(self.nb_planes))
+
+    def load_vectors(self):
+        if self.vectors is None:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32,
+                                     mode="r", shape=(len(self.meta), self.dim))
+        return self.vectors
+
+    def __len__(self):
+        return len(self.meta)
+
+    def insert(self, vector, clip_path, meta):
+        """
+        Copy clip_path into the library and index it.
+        :param vector: Embedding describing the clip.
+        :param meta: JSON-serialisable metadata of the clip.
+        :return: Id of the clip in the library (of the same clip when it
+                 is already there).
+        """
+        clip_hash = file_hash(clip_path)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with file_lock(self.lock_path):
+            # Ids follow the clips inserted by the other processes
+            self.refresh()
+            if clip_hash in self.hashes:
+                return self.hashes[clip_hash]
+            return self.append(vector, clip_path, meta, clip_hash)
+
+    def append(self, vector, clip_path, meta, clip_hash):
+        if self.dim is None:
+            self.dim = len(vector)
+            self.init_planes(self.dim)
+        clip_id = len(self.meta)
+        library_clip = f"{self.clips_path}/{clip_id}.mp4"
+        shutil.copyfile(clip_path, library_clip)
+
+        with open(self.vectors_path, "ab") as f:
+            f.write(vector.tobytes())
+        record = dict(meta, clip_path=library_clip, clip_hash=clip_hash,
+                      dim=self.dim)
+        # Last, the clip is in the library once this line is written
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.meta.append(record)
+        self.hashes[clip_hash] = clip_id
+        signature = int(self.signatures(vector[None, :])[0])
+        self.buckets.setdefault(signature, []).append(clip_id)
+        # The memory map is reopened with the new size on the next search
+        self.vectors = None
+        return clip_id
+
+    def candidates(self, vector, min_candidates):
+        """Ids in the query bucket, then in buckets one bit away."""
+        signature = int(self.signatures(vector[None, :])[0])
+        ids = list(self.buckets.get(signature, []))
+        if len(ids) < min_candidates:
+            for bit in range(self.nb_planes):
+                ids.extend(self.buckets.get(signature ^ (1 << bit), []))
+        return ids
+
+    def search(self, vector, k=3, min_similarity=0.0):
+        """
+        :return: Up to k (similarity, metadata) pairs, best first.
+        """
+        if not self.meta:
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        vectors = self.load_vectors()
+        ids = self.candidates(vector, k)
+        if len(ids) < k:
+            # Small library or empty neighbourhood: exact search
+            ids = range(len(self.meta))
+        ids = np.array(sorted(set(ids)))
+        similarities = vectors[ids] @ vector
+        order = np.argsort(-similarities, kind="stable")[:k]
+        return [(float(similarities[i]), self.meta[ids[i]]) for i in order
+                if similarities[i] >= min_similarity]
@@ -0,0 +1,52 @@
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+video_file_clip = lazy_import("moviepy.video.io.VideoFileClip")
+ffmpeg_reader = lazy_import("moviepy.video.io.ffmpeg_reader")
+
+
+class ClipReaderCache:
+    def __init__(self):
+        """
+        Keep one ffmpeg reader per distinct clip file for a render batch.
+        Every use of a clip (repetitions, loops, other variants) is a
+        view on the same reader instead of a new subprocess.
+        """
+        self.readers = {}
+        self.infos = {}
+        self.requests = 0
+
+    def get(self, clip_path):
+        """Return the shared (audio-less) clip for clip_path."""
+        self.requests += 1
+        if clip_path not in self.readers:
+            self.readers[clip_path] = video_file_clip.VideoFileClip(clip_path, audio=False)
+        return self.readers[clip_path]
+
+    def info(self, clip_path):
+        """
+        ffmpeg metadata (duration, video_size, ...) of clip_path. Probed
+        with ffmpeg -i, so planning doesn't keep readers alive.
+        """
+        if clip_path not in self.infos:
+            self.infos[clip_path] = ffmpeg_reader.ffmpeg_parse_infos(clip_path)
+        return self.infos[clip_path]
+
+    def duration(self, clip_path):
+        """Duration of clip_path in seconds."""
+        if clip_path in self.readers:
+            return self.readers[clip_path].duration
+        return self.info(clip_path)["duration"]
+
+    def cut(self, clip_path, t_in, t_out):
+        """Return the [t_in, t_out] part of clip_path."""
+        return self.get(clip_path).subclip(t_in, t_out)
+
+    def stats(self):
+        return {"open_readers": len(self.readers),
+                "requests": self.requests}
+
+    def close(self):
+        for clip in self.readers.values():
+            clip.close()
+        self.readers = {}
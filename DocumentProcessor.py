@@ -1,12 +1,23 @@
-import ollama  # type: ignore
-from bs4 import BeautifulSoup  # type: ignore
 import requests  # type: ignore
-import re
 import os
 import json
 import logging
 from contextlib import contextmanager
 
+from StructuredLLM import StructuredLLM, FunFacts, YoutubeQueries, Keywords
+from StructuredLLM import FactAssets
+from ModelSessions import ModelSessions
+from Backends import make_backend
+from ArticleFetcher import ArticleFetcher
+from HtmlExtractor import HtmlExtractor, lxml
+from TextCleaner import TextCleaner
+from PassageSelector import PassageSelector
+from PipelineMetrics import metrics
+from LazyImport import lazy_import
+
+# Only needed without lxml, imported on first use (see LazyImport)
+bs4 = lazy_import("bs4")
+
 
 @contextmanager
 def suppress_logging():
@@ -18,8 +29,31 @@ def suppress_logging():
         logging.disable(logging.NOTSET)  # Re-enable logging
 
 
+# Used when the prompts file has no "fact_assets" prompt
+FACT_ASSETS_PROMPT = (
+    "Based on the following fun fact:\n{fact}\n\n"
+    "1. youtube_queries: a list of {nb_queries} varied YouTube search "
+    "queries to find interesting videos on this topic (documentaries, "
+    "expert talks, analysis...).\n"
+    "2. sections: a short voiceover video script narrating the fun fact as "
+    "an engaging story, split into exactly {num_parts} consecutive "
+    "sections. For each section give the visual directions, the narrated "
+    "text and a few keywords describing what the footage should show."
+)
+
+# Longest answer of each stage, in tokens (Ollama's num_predict).
+# JSON answers end with the schema, these limits only stop runaway answers.
+GENERATION_LIMITS = {
+    "fun_facts": {"num_predict": 1024},
+    "youtube_queries": {"num_predict": 400},
+    "video_script": {"num_predict": 700},
+    "fact_assets": {"num_predict": 1200},
+    "keywords": {"num_predict": 80},
+}
+
+
 class DocumentProcessor:
-    def __init__(self, config_file_path):
+    def __init__(self, config_file_path, sessions=None):
         # load config
         with open(config_file_path, 'r') as file:
             self.config = json.load(file)
@@ -34,58 +68,81 @@ class DocumentProcessor:
         prompt_file_path = self.config["prompts_file"]
         with open(prompt_file_path, 'r') as file:
             self.prompts = json.load(file)
-        # load create log file
+        # JSON lines log, shared with the other stages
         self.log_file = self.config["log_file"]
-        log_dir = os.path.dirname(self.log_file)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir, exist_ok=True)
+        if metrics.path is None:
+            metrics.open(self.log_file)
         self.process_id = "DocumentProcessor"
+        # Ollama calls, shared with the other stages when given
+        self.sessions = sessions or ModelSessions(
+            client=make_backend("llm", self.config.get("backends")),
+            keep_alive=self.config.get("keep_alive", "5m"))
+        self.llm = StructuredLLM(self.sessions)
+        # lxml extraction when available, BeautifulSoup otherwise
+        self.html_extractor = HtmlExtractor() if lxml is not None else None
+        # Noise patterns per site, config.json can add some
+        self.cleaner = TextCleaner(self.config.get("noise_patterns"))
+        # Only the most fact-dense passages go into the fun facts prompt
+        self.passages = PassageSelector(
+            self.config.get("article_token_budget", 1500))
+        # Per stage generation limits, config.json can override them
+        self.limits = {stage: dict(options, **self.config.get(
+            "generation_limits", {}).get(stage, {}))
+            for stage, options in GENERATION_LIMITS.items()}
+        # Why the last fetch_webpage_content returned None
+        self.fetch_error = None
         self.log("ready to process")
         print("\n DocumentProcessor: Ready \n ")
 
     def log(self, text):
-        # Create directory if it doesn't exist
-        # Format the log entry
-        log_entry = f"------- {self.process_id} -------\n{text}\n"
-
-        # Write to the log file (create if doesn't exist, append if it does)
-        with open(self.log_file, 'a') as log_file:
-            log_file.write(log_entry)
+        metrics.log(self.process_id, text)
 
     def get_pompt(self, prompt_id, var_dict):
         prompt = self.prompts[prompt_id]
         return prompt.format(**var_dict)
 
     def fetch_webpage_content(self, url):
-        """Fetch cleaner text from a webpage."""
+        """
+        Fetch cleaner text from a webpage.
+        :return: The text, None on failure, with the error in fetch_error.
+        """
+        self.fetch_error = None
         try:
-            response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+            with metrics.stage("fetch_article", url=url) as record:
+                response = requests.get(url,
+                                        headers={"User-Agent": "Mozilla/5.0"},
+                                        timeout=(5, 30))
+                record["bytes"] = len(response.content)
             if response.status_code != 200:
+                self.fetch_error = requests.HTTPError(
+                    f"{response.status_code} fetching {url}",
+                    response=response)
                 self.log(f"Failed to fetch {url}")
                 print(f"\n DocumentProcessor: Failed to fetch {url} \n ")
                 return None
-            soup = BeautifulSoup(response.text, "html.parser")
-            # Remove common non-content elements before extraction
-            self.remove_unwanted_elements(soup)
-            # Try to extract the main content with more targeted selectors
-            main_content = (
-                soup.find("article") or
-                soup.find("main") or
-                soup.find(class_=lambda c: c and any(
-                    x in str(c).lower() for x in ["content", "post", "entry", "article", "main"])) or
-                soup.find("div", {"id": lambda i: i and any(x in str(i).lower() for x in ["content", "post", "entry", "article", "main"])}) or
-                soup.find("div", {"class": lambda c: c and any(x in str(c).lower() for x in ["content", "post", "entry", "article", "main"])})
-            )
-            if not main_content:  # Fallback if no content is found
-                main_content = soup.body
-            # Get text with better formatting
-            text = main_content.get_text(separator="\n", strip=True) if main_content else ""
-            # Clean the extracted text
-            text = self.clean_text(text)
-            # Apply density-based filtering to favor content paragraphs
-            text = self.filter_by_text_density(text)
-            self.log(f"Text extracted from: {url}")
-            self.log(f"Text content: \n - \n {text} \n - \n")
+            text = self.extract_text(response.text, url)
+            if not text:
+                self.fetch_error = ValueError(f"No article text in {url}")
+                return None
+            return text
+        except Exception as e:
+            self.fetch_error = e
+            self.log(f"Error processing {url}: {str(e)}")
+            print(f"\n DocumentProcessor: Error processing {url}: {str(e)} \n")
+            return None
+
+    def extract_text(self, html, url):
+        """Cleaner text from the html of a webpage."""
+        try:
+            with metrics.stage("extract_text", bytes=len(html)):
+                if self.html_extractor is not None:
+                    lines = self.html_extractor.iter_lines(html)
+                else:
+                    lines = [self.extract_text_soup(html)]
+                # Drop noise, menus, repeated and low density lines
+                text = "\n".join(self.cleaner.clean_lines(lines, url))
+            metrics.log(self.process_id, f"Text extracted from: {url}",
+                        html_bytes=len(html), text_bytes=len(text))
             print(f"\n DocumentProcessor: Text extracted from: {url} \n ")
             return text
         except Exception as e:
@@ -93,6 +150,25 @@ class DocumentProcessor:
             print(f"\n DocumentProcessor: Error processing {url}: {str(e)} \n")
             return None
 
+    def extract_text_soup(self, html):
+        """Main content text with BeautifulSoup, used without lxml."""
+        soup = bs4.BeautifulSoup(html, "html.parser")
+        # Remove common non-content elements before extraction
+        self.remove_unwanted_elements(soup)
+        # Try to extract the main content with more targeted selectors
+        main_content = (
+            soup.find("article") or
+            soup.find("main") or
+            soup.find(class_=lambda c: c and any(
+                x in str(c).lower() for x in ["content", "post", "entry", "article", "main"])) or
+            soup.find("div", {"id": lambda i: i and any(x in str(i).lower() for x in ["content", "post", "entry", "article", "main"])}) or
+            soup.find("div", {"class": lambda c: c and any(x in str(c).lower() for x in ["content", "post", "entry", "article", "main"])})
+        )
+        if not main_content:  # Fallback if no content is found
+            main_content = soup.body
+        # Get text with better formatting
+        return main_content.get_text(separator="\n", strip=True) if main_content else ""
+
     def remove_unwanted_elements(self, soup):
         """Remove unwanted elements from the soup before text extraction."""
         # Common selectors for non-content elements
@@ -109,103 +185,41 @@ class DocumentProcessor:
             for element in soup.select(selector):
                 element.decompose()
 
-    def clean_text(self, text):
-        """Clean extracted text by removing noise patterns."""
-        # Expanded list of noise patterns
-        noise_patterns = [
-            # Original patterns
-            r"Table of Contents", r"Quick Facts", r"Read Next", r"Discover",
-            r"Feedback", r"References & Edit History",
-            r"Share to social media", r"Copy Citation",
-            r"Ask the Chatbot a Question", r"External Websites",
-            r"Related Topics", r"Images",
-            r"verified", r"Last Updated:", r"Select Citation Style",
-            r"Show\xa0more", r"Print", r"Cite", r"More Actions",
-            
-            # Added patterns for common web pollution
-            r"Subscribe", r"Newsletter", r"Sign up", r"Follow us", 
-            r"Share this", r"Like us", r"Connect with us",
-            r"Sponsored", r"Advertisement", r"Promoted", r"Recommended",
-            r"You might also like", r"Popular", r"Trending",
-            r"Copyright ©", r"All rights reserved", r"Terms", r"Privacy Policy",
-            r"Cookie Policy", r"More from", r"View all", r"Load more",
-            r"See also", r"Related articles", r"Top stories",
-            r"Join our community", r"Skip to content"
-        ]
-        
-        # Join patterns into a single regex
-        noise_regex = re.compile("|".join(noise_patterns), re.IGNORECASE)
-        
-        # Remove lines that match any of the noise patterns
-        cleaned_lines = [line for line in text.split("\n") if not noise_regex.search(line)]
-        
-        # Filter out very short lines (likely menu items, buttons, etc.)
-        cleaned_lines = [line for line in cleaned_lines if len(line.strip()) > 3]
-        
-        # Remove duplicate lines (often happens with repeated elements)
-        unique_lines = []
-        for line in cleaned_lines:
-            if line not in unique_lines:
-                unique_lines.append(line)
-
-        # Reconstruct the cleaned text
-        cleaned_text = "\n".join(unique_lines)
-
-        return cleaned_text
-
-    def filter_by_text_density(self, text):
-        """Filter text based on character density to favor content paragraphs."""
-        lines = text.split("\n")
-        filtered_lines = []
-        for line in lines:
-            line = line.strip()
-            # Skip empty lines
-            if not line:
-                continue
-            # Check for text density - content usually has higher density
-            # This helps filter out menu items, headings, etc. while keeping paragraphs
-            if len(line) > 40 or (len(line) > 20 and "." in line):
-                filtered_lines.append(line)
-        return "\n".join(filtered_lines)
+    def clean_text(self, text, url=None):
+        """Clean extracted text by removing noise, short and repeated lines."""
+        return self.cleaner.clean(text, url)
 
     def extract_fun_facts(self, article_text):
         self.log(f"Generating fun facts")
         print(f"\n DocumentProcessor: Generating fun facts. \n ")
-        prompt = self.get_pompt("extract_fun_facts",
-                                {"article_text": article_text})
-        with suppress_logging():
-            response = ollama.chat(
-                model="llama3.2:3B",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": (prompt),
-                    }
-                ],
-            )
-        self.log(f"Fun facts generated: {response['message']['content']}")
+        with metrics.stage("fun_facts"):
+            if self.passages.token_budget:
+                article_text, stats = self.passages.select(article_text)
+                self.log(f"Passages kept: {stats}")
+                print(f"\n DocumentProcessor: {stats['kept_passages']}/"
+                      f"{stats['passages']} passages kept, "
+                      f"{stats['prompt_tokens']}/{stats['article_tokens']} "
+                      f"tokens ({stats['saved_tokens']} saved) \n ")
+            prompt = self.get_pompt("extract_fun_facts",
+                                    {"article_text": article_text})
+            with suppress_logging():
+                fun_facts = self.llm.generate("llama3.2:3B", prompt, FunFacts,
+                                              self.limits["fun_facts"])
+        self.log(f"Fun facts generated: {fun_facts.facts}")
         print(f"\n DocumentProcessor: Fun facts generated. \n ")
-        return response["message"]["content"]
-
-    def parse_fun_facts(self, response_text):
-        facts = re.findall(r"\d+\.\s(.+)", response_text)
-        return facts
+        return fun_facts.facts
 
-    def generate_youtube_queries(self, fact):
-        """Generate a list of YouTube search queries related to a fun fact."""
+    def generate_youtube_queries(self, fact, nb_queries=10):
+        """
+        Generate a list of YouTube search queries related to a fun fact.
+        The answer is streamed and stops after nb_queries queries.
+        """
         with suppress_logging():
             prompt = self.get_pompt("youtube_queries",
                                     {"fact": fact})
-            response = ollama.chat(
-                model="llama3.2:3B",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": (prompt),
-                    }
-                ],
-            )
-        return re.findall(r"\d+\.\s(.+)", response["message"]["content"])
+            return self.llm.generate_items(
+                "llama3.2:3B", prompt, YoutubeQueries, "queries", nb_queries,
+                self.limits["youtube_queries"])
 
     def generate_video_script(self, fun_fact):
         """Generate a short video script narrating
@@ -213,7 +227,7 @@ class DocumentProcessor:
         with suppress_logging():
             prompt = self.get_pompt("voiceover_script",
                                     {"fun_fact": fun_fact})
-            response = ollama.chat(
+            response = self.sessions.chat(
                 model="llama3.2:3B",
                 messages=[
                     {
@@ -221,53 +235,94 @@ class DocumentProcessor:
                         "content": (prompt),
                     }
                 ],
+                options=self.limits["video_script"],
             )
         return response["message"]["content"]
 
-    def process_article(self, article_url, output_file):
-        """Full pipeline: Extract fun facts, generate YouTube querie
-        and video scripts for each, then save to JSON."""
-        article_text = self.fetch_webpage_content(article_url)
-        fun_facts_text = self.extract_fun_facts(article_text)
-        fun_facts = self.parse_fun_facts(fun_facts_text)
-        result = {
-            "article_url": article_url,  # Save article URL at the top level
-            "fun_facts": {}
-        }
+    def generate_fact_assets(self, fact_id, num_parts=3, nb_queries=10):
+        """
+        Fused alternative to generate_queries_script + get_script_sentences:
+        one generation gives the YouTube queries, the script split into
+        num_parts sections and the keywords of each section. Saves the
+        same fields in the fact record.
+        """
+        fact = self.fun_facts["fun_facts"][fact_id]
         print("+--+")
         print("   |")
-        for i, fact in enumerate(fun_facts, 1):
-            fact_key = f"fact{i}"
-            print(f"   +-- {fact_key}")
-            print("   |")
-            print("   | Generating youtube queries")
-            print("   |")
-            youtube_queries = self.generate_youtube_queries(fact)
-            print("   | ")
-            print("   | Generating video script")
-            print("   |")
-            video_script = self.generate_video_script(fact)
-            print("   | ")
-            result["fun_facts"][fact_key] = {
-                "text": fact,
-                "youtube_queries": youtube_queries,
-                "video_script": video_script
-            }
+        print(f"   +-- {fact_id}")
+        print("   |")
+        print("   | Generating queries, script, sections and keywords")
+        print("   |")
+        prompt = self.prompts.get("fact_assets", FACT_ASSETS_PROMPT)
+        prompt = prompt.format(fact=fact["text"], nb_queries=nb_queries,
+                               num_parts=num_parts)
+        with suppress_logging(), metrics.stage("fact_assets", fact_id):
+            assets = self.llm.generate(
+                "llama3.2:3B", prompt, FactAssets, self.limits["fact_assets"],
+                constraints={"sections": {"minItems": num_parts,
+                                          "maxItems": num_parts}})
+        sections = [s.narration.strip().strip('"') for s in assets.sections]
+        # Same layout as generate_video_script: [visuals] "narration"
+        video_script = "\n".join(f'[{s.visuals}]\n"{narration}"'
+                                  for s, narration in zip(assets.sections,
+                                                          sections))
+        self.sentences = sections
+        fact["youtube_queries"] = assets.youtube_queries
+        fact["video_script"] = video_script
+        fact["video_script_clean"] = sections
+        fact["video_script_sections"] = sections
+        fact["keywords_sections"] = {str(i): s.keywords
+                                     for i, s in enumerate(assets.sections)}
+        self.fun_facts["fun_facts"][fact_id] = fact
+        # Save results to a JSON file
+        with open(self.json_file_path, "w", encoding="utf-8") as f:
+            json.dump(self.fun_facts, f, indent=4, ensure_ascii=False)
+        print(f"   +--> Results saved at {self.json_file_path}")
+        print("   |")
         print("+--+")
         print("|")
+
+    def process_article(self, article_url, output_file, num_parts=3):
+        """Full pipeline: Extract fun facts, then the YouTube queries, the
+        script sections and their keywords of each fact in a single
+        generation (see generate_fact_assets), saved to JSON.
+        :return: {"article_url", "fun_facts"}, None when the article
+                 couldn't be fetched (see fetch_error)."""
+        article_text = self.fetch_webpage_content(article_url)
+        if article_text is None:
+            return None
+        fun_facts = self.extract_fun_facts(article_text)
+        result = {
+            "article_url": article_url,  # Save article URL at the top level
+            "fun_facts": {f"fact{i}": {"text": fact}
+                          for i, fact in enumerate(fun_facts, 1)}
+        }
+        # generate_fact_assets completes the facts of fun_facts and saves
+        # them to json_file_path
+        self.fun_facts = result
+        self.json_file_path = output_file
+        for fact_key in result["fun_facts"]:
+            self.generate_fact_assets(fact_key, num_parts)
         # Save results to a JSON file
         with open(output_file, "w", encoding="utf-8") as f:
             json.dump(result, f, indent=4, ensure_ascii=False)
-        print("+--> Results saved at {output_file}")
+        print(f"+--> Results saved at {output_file}")
         print("|")
         return result
 
     def get_fun_facts(self):
+        """
+        Fun facts of the config article_url, saved in output_file.
+        :return: {"article_url", "fun_facts"}, None when the article
+                 couldn't be fetched (see fetch_error).
+        """
         article_url = self.config["article_url"]
         output_file = self.config["output_file"]
         article_text = self.fetch_webpage_content(article_url)
-        fun_facts_text = self.extract_fun_facts(article_text)
-        fun_facts = self.parse_fun_facts(fun_facts_text)
+        if article_text is None:
+            # fetch_webpage_content logged why
+            return None
+        fun_facts = self.extract_fun_facts(article_text)
         result = {
             "article_url": article_url,  # Save article URL at the top level
             "fun_facts": {}
@@ -281,6 +336,42 @@ class DocumentProcessor:
         with open(output_file, "w", encoding="utf-8") as f:
             json.dump(result, f, indent=4, ensure_ascii=False)
         self.fun_facts = result
+        return result
+
+    def get_fun_facts_batch(self, feed=None, output_file=None):
+        """
+        get_fun_facts for many articles: config "article_feed" is a list of
+        urls, a text file with one url per line or an RSS / Atom feed url.
+        Pages are downloaded concurrently (cached, see ArticleFetcher) and
+        each one goes through the fun facts extraction as soon as it
+        arrives. Results are saved after each article.
+        :return: {article_url: {"article_url": ..., "fun_facts": {...}}}
+        """
+        output_dir = os.path.dirname(self.config["output_file"]) or "."
+        feed = feed or self.config["article_feed"]
+        output_file = output_file or self.config.get(
+            "batch_output_file", f"{output_dir}/articles_fun_facts.json")
+        fetcher = ArticleFetcher(
+            self.config.get("article_cache", f"{output_dir}/article_cache"),
+            max_workers=self.config.get("fetch_workers", 4))
+        urls = fetcher.feed_urls(feed)
+        print(f"\n DocumentProcessor: Fetching {len(urls)} articles \n ")
+        results = {}
+        # Each article has its own extract_text / fun_facts stages
+        for article_url, html in fetcher.fetch_all(urls):
+            article_text = self.extract_text(html, article_url) if html else None
+            if not article_text:
+                continue
+            result = {"article_url": article_url, "fun_facts": {}}
+            for i, fact in enumerate(self.extract_fun_facts(article_text), 1):
+                result["fun_facts"][f"fact{i}"] = {"text": fact}
+            results[article_url] = result
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=4, ensure_ascii=False)
+        self.log(f"Articles fetched: {fetcher.stats}")
+        print(f"\n DocumentProcessor: {len(results)} articles processed "
+              f"({fetcher.stats}) \n ")
+        return results
 
     def generate_queries_script(self, fact_id, output_file):
         fact_key = fact_id
@@ -291,12 +382,17 @@ class DocumentProcessor:
         print("   |")
         print("   | Generating youtube queries")
         print("   |")
-        youtube_queries = self.generate_youtube_queries(fact)
-        print("   | ")
-        print("   | Generating video script")
-        print("   |")
-        video_script = self.generate_video_script(fact)
-        print("   | ")
+        with metrics.stage("queries_script", fact_key):
+            youtube_queries = self.generate_youtube_queries(fact)
+            print("   | ")
+            print("   | Generating video script")
+            print("   |")
+            video_script = self.generate_video_script(fact)
+            # Last llama call done, the keywords of the sections come next
+            # from Zephyr (preloading it earlier could evict llama before
+            # the script is generated)
+            self.sessions.preload("Zephyr")
+            print("   | ")
 
         self.fun_facts["fun_facts"][fact_key] = {
             "text": fact,
@@ -314,24 +410,24 @@ class DocumentProcessor:
 
     def get_script_sentences(self, fact_key, num_parts=3):
         text = self.fun_facts["fun_facts"][fact_key]["video_script"]
-        # Step 1: Remove all text between []
-        cleaned_text = re.sub(r"\[.*?\]", "", text)
-        # Step 2: Extract all text between ""
-        self.sentences = re.findall(r'"(.*?)"', cleaned_text)
+        # Narrated text between "", without the [] directions
+        self.sentences = self.cleaner.script_sentences(text)
         # Calculate the approximate number of sentences per part
         total_sentences = len(self.sentences)
         part_size = total_sentences // num_parts
         # Split sentences into parts
         parts = []
-        keywords = {}
         for i in range(num_parts):
             start = i * part_size
             # Ensure last part gets any remaining sentences
             end = (start + part_size) if i < num_parts - 1 else total_sentences
-            sent = " ".join(self.sentences[start:end])
-            kw = self.get_keywords(sent)
-            parts.append(sent)
-            keywords[str(i)] = kw
+            parts.append(" ".join(self.sentences[start:end]))
+        with metrics.stage("keywords", fact_key):
+            # All the Zephyr calls in a row
+            section_keywords = self.sessions.run_grouped(
+                [("Zephyr", lambda sent=sent: self.get_keywords(sent))
+                 for sent in parts])
+        keywords = {str(i): kw for i, kw in enumerate(section_keywords)}
         self.sentences = parts
 
         fact = self.fun_facts["fun_facts"][fact_key]
@@ -348,14 +444,6 @@ class DocumentProcessor:
     def get_keywords(self, section):
         with suppress_logging():
             prompt = self.get_pompt("keywords", {"section": section})
-            response = ollama.chat(
-                model="Zephyr",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": (prompt),
-                    }
-                ],
-            )
-            keywords = response["message"]["content"].strip().split(",")
-            return keywords
+            keywords = self.llm.generate("Zephyr", prompt, Keywords,
+                                         self.limits["keywords"])
+            return keywords.keywords
@@ -0,0 +1,45 @@
+import numpy as np  # type: ignore
+
+from PipelineMetrics import metrics
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+ollama = lazy_import("ollama")
+
+
+class EmbeddingIndex:
+    def __init__(self, model="nomic-embed-text", client=ollama):
+        """
+        Rank texts by cosine similarity of their embeddings, computed by a
+        local Ollama embedding model (CPU friendly).
+        Embeddings are cached per text, so each text is embedded once.
+        :param client: Anything with ollama's embed() signature.
+        """
+        self.model = model
+        self.client = client
+        self.cache = {}
+
+    def embed(self, texts):
+        """
+        :return: (len(texts), dim) array of L2 normalised embeddings.
+        """
+        missing = [t for t in dict.fromkeys(texts) if t not in self.cache]
+        metrics.add("cache_hits", len(set(texts)) - len(missing))
+        if missing:
+            response = self.client.embed(model=self.model, input=missing)
+            for text, vector in zip(missing, response["embeddings"]):
+                self.cache[text] = vector
+        matrix = np.array([self.cache[t] for t in texts], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def top_k(self, queries, documents, k):
+        """
+        Best k documents for each query.
+        :return: (indices, similarities), both of shape (len(queries), k).
+                 Ties keep the document order, so results are deterministic.
+        """
+        k = min(k, len(documents))
+        similarities = self.embed(queries) @ self.embed(documents).T
+        indices = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+        return indices, np.take_along_axis(similarities, indices, axis=1)
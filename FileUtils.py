@@ -0,0 +1,37 @@
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_output(output_path):
+    """
+    Yield a temporary path next to output_path and move it into place
+    only once the block finishes without error.
+    The temporary name keeps the extension so ffmpeg picks the same muxer,
+    and is unique to the process and thread, so that two workers writing
+    the same output don't clobber each other's temporary file.
+    """
+    folder, name = os.path.split(output_path)
+    tmp_path = os.path.join(
+        folder, f".partial_{os.getpid()}_{threading.get_ident()}_{name}")
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive lock on lock_path, between processes."""
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,116 @@
+import os
+import json
+import numpy as np  # type: ignore
+
+from PipelineMetrics import metrics
+from FileUtils import atomic_output, file_lock
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+cv2 = lazy_import("cv2")
+
+
+class FrameHashIndex:
+    def __init__(self, index_path, max_distance=6):
+        """
+        Persistent index of perceptual hashes (64 bit dHash) of the scored
+        frames and of the extracted clips.
+        :param index_path: JSON file the index is loaded from and saved to.
+        :param max_distance: Largest Hamming distance between the hashes
+                             of two images considered duplicates.
+        """
+        self.index_path = index_path
+        self.max_distance = max_distance
+        self.frames = []
+        self.clips = {}
+        self.load()
+        self.reused = 0
+
+    def load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as file:
+                data = json.load(file)
+            self.frames = data.get("frames", [])
+            self.clips = data.get("clips", {})
+        self.frame_hashes = np.array([int(f["hash"], 16) for f in self.frames],
+                                     dtype=np.uint64)
+
+    def dhash(self, frame):
+        """Difference hash of a BGR (or grayscale) frame, as a hex string."""
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+    def distances(self, image_hash, hashes):
+        """Hamming distance between image_hash and an array of hashes."""
+        xor = np.bitwise_xor(hashes, np.uint64(int(image_hash, 16)))
+        return np.unpackbits(xor.view(np.uint8).reshape(-1, 8),
+                             axis=1).sum(axis=1)
+
+    def nearest_frame(self, image_hash):
+        """Index of the closest known frame within max_distance, or None."""
+        if len(self.frame_hashes) == 0:
+            return None
+        dist = self.distances(image_hash, self.frame_hashes)
+        best = int(np.argmin(dist))
+        return best if dist[best] <= self.max_distance else None
+
+    def lookup_score(self, image_hash, prompt):
+        """Score given to a near-duplicate frame for this prompt, or None."""
+        best = self.nearest_frame(image_hash)
+        if best is None:
+            return None
+        score = self.frames[best]["scores"].get(prompt)
+        if score is not None:
+            self.reused += 1
+            metrics.add("cache_hits")
+        return score
+
+    def add_score(self, image_hash, prompt, score):
+        self.add_frame(image_hash, {prompt: score})
+
+    def add_frame(self, image_hash, scores):
+        best = self.nearest_frame(image_hash)
+        if best is None:
+            self.frames.append({"hash": image_hash, "scores": {}})
+            self.frame_hashes = np.append(self.frame_hashes,
+                                          np.uint64(int(image_hash, 16)))
+            best = len(self.frames) - 1
+        self.frames[best]["scores"].update(scores)
+
+    def add_clip(self, clip_path, image_hash):
+        self.clips[os.path.normpath(clip_path)] = image_hash
+
+    def clip_hash(self, clip_path):
+        return self.clips.get(os.path.normpath(clip_path))
+
+    def is_duplicate(self, image_hash, other_hashes):
+        """True if image_hash is within max_distance of any other_hashes."""
+        if image_hash is None or not other_hashes:
+            return False
+        hashes = np.array([int(h, 16) for h in other_hashes], dtype=np.uint64)
+        return bool(self.distances(image_hash, hashes).min()
+                    <= self.max_distance)
+
+    def save(self):
+        """
+        Merge the index into the file, which other jobs may have saved to
+        since it was loaded.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)),
+                    exist_ok=True)
+        with file_lock(f"{self.index_path}.lock"):
+            frames, clips = self.frames, self.clips
+            self.frames, self.clips = [], {}
+            self.load()
+            for frame in frames:
+                self.add_frame(frame["hash"], frame["scores"])
+            self.clips.update(clips)
+            # Clips are recreated on every run, forget the ones that are gone
+            self.clips = {path: h for path, h in self.clips.items()
+                          if os.path.exists(path)}
+            with atomic_output(self.index_path) as tmp_path:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"frames": self.frames, "clips": self.clips}, f)
@@ -0,0 +1,84 @@
+import numpy as np  # type: ignore
+
+
+DEFAULT_THRESHOLDS = {
+    "min_luma": 20,            # darker frames are black frames / fades
+    "max_luma": 235,           # brighter frames are white flashes
+    "min_contrast": 12,        # std of the luminance, flat frames below
+    "min_sharpness": 25,       # variance of the Laplacian, blurry below
+    "min_edge_density": 0.01,  # share of edge pixels, empty frames below
+    "max_flat_ratio": 0.65,    # share of background pixels of a title card
+    "edge_threshold": 40,      # gradient magnitude of an edge pixel
+    "max_width": 160,          # frames are subsampled to this width
+}
+
+
+class FramePreFilter:
+    def __init__(self, thresholds=None):
+        """
+        Cheap NumPy checks that reject frames not worth a vision model call:
+        black frames, fades, blurred frames and title cards.
+        :param thresholds: Overrides of DEFAULT_THRESHOLDS.
+        """
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        self.thresholds.update(thresholds or {})
+        self.checked = 0
+        self.rejected = {}
+
+    def to_gray(self, frame):
+        """Subsampled float luminance of an RGB/BGR or grayscale frame."""
+        frame = np.asarray(frame)
+        step = max(1, frame.shape[1] // self.thresholds["max_width"])
+        frame = frame[::step, ::step].astype(np.float32)
+        if frame.ndim == 3:
+            frame = frame[:, :, :3].mean(axis=2)
+        return frame
+
+    def measure(self, frame):
+        gray = self.to_gray(frame)
+        laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2]
+                     + gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1])
+        gradient = np.hypot(gray[1:-1, 2:] - gray[1:-1, :-2],
+                            gray[2:, 1:-1] - gray[:-2, 1:-1])
+        median = np.median(gray)
+        return {
+            "luma": float(gray.mean()),
+            "contrast": float(gray.std()),
+            "sharpness": float(laplacian.var()),
+            "edge_density": float(
+                (gradient > self.thresholds["edge_threshold"]).mean()),
+            # Text on a plain background: most pixels close to the median
+            "flat_ratio": float((np.abs(gray - median) < 12).mean()),
+        }
+
+    def check(self, frame):
+        """
+        :return: The reason the frame is rejected, or None if it is worth
+                 scoring with the vision model.
+        """
+        t = self.thresholds
+        m = self.measure(frame)
+        self.checked += 1
+        if m["luma"] < t["min_luma"]:
+            reason = "dark"
+        elif m["luma"] > t["max_luma"]:
+            reason = "bright"
+        elif m["contrast"] < t["min_contrast"]:
+            reason = "flat"
+        elif m["sharpness"] < t["min_sharpness"]:
+            reason = "blurry"
+        elif m["edge_density"] < t["min_edge_density"]:
+            reason = "empty"
+        elif m["flat_ratio"] > t["max_flat_ratio"]:
+            reason = "title_card"
+        else:
+            return None
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return reason
+
+    def report(self):
+        avoided = sum(self.rejected.values())
+        print(f"+--> Pre-filter: {avoided}/{self.checked} vision model calls "
+              f"avoided {self.rejected}")
+        print("|")
+        return avoided
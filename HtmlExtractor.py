@@ -0,0 +1,134 @@
+import re
+try:
+    import lxml.html  # type: ignore
+    from lxml import etree  # type: ignore
+except ImportError:  # BeautifulSoup fallback in DocumentProcessor
+    lxml = None
+
+# Same rules as DocumentProcessor.remove_unwanted_elements
+UNWANTED_TAGS = frozenset(["nav", "header", "footer", "aside", "script",
+                           "style", "noscript", "iframe"])
+UNWANTED_CLASSES = frozenset(["sidebar", "ads", "advertisement", "banner",
+                              "menu", "navigation", "social", "share",
+                              "comments", "related"])
+UNWANTED_IDS = frozenset(["comments", "sidebar"])
+UNWANTED_CLASS_PART = re.compile(r"ad-|advertisement")
+UNWANTED_ID_PART = re.compile(r"ad-")
+# Class / id hinting at the main content of the page
+CONTENT_HINT = re.compile(r"content|post|entry|article|main", re.IGNORECASE)
+
+
+class HtmlExtractor:
+    def __init__(self):
+        """
+        Main text of an article page, parsed with lxml (C parser).
+        Unwanted elements are dropped and the main content candidates are
+        found in a single traversal of the tree, the text is then read
+        from the main content only.
+        Same rules as the BeautifulSoup implementation
+        (DocumentProcessor.extract_text_soup).
+        """
+        if lxml is None:
+            raise ImportError("HtmlExtractor needs lxml")
+
+    def is_unwanted(self, element):
+        if element.tag in UNWANTED_TAGS:
+            return True
+        classes = element.get("class")
+        if classes:
+            if UNWANTED_CLASSES.intersection(classes.split()):
+                return True
+            if UNWANTED_CLASS_PART.search(classes):
+                return True
+        element_id = element.get("id")
+        if element_id:
+            if element_id in UNWANTED_IDS:
+                return True
+            if UNWANTED_ID_PART.search(element_id):
+                return True
+        return False
+
+    def find_main_content(self, root):
+        """
+        Drop the unwanted elements and return the main content element:
+        the first <article>, else <main>, else the first element with a
+        content-like class, else the first <div> with a content-like id,
+        else <body>.
+        """
+        unwanted = []
+        article = main = by_class = by_id = body = None
+        stack = [root]
+        while stack:
+            element = stack.pop()
+            if not isinstance(element.tag, str):
+                continue  # Comments and processing instructions
+            if self.is_unwanted(element):
+                unwanted.append(element)
+                continue
+            tag = element.tag
+            if tag == "article":
+                if article is None:
+                    article = element
+            elif tag == "main":
+                if main is None:
+                    main = element
+            elif tag == "body":
+                if body is None:
+                    body = element
+            if by_class is None and CONTENT_HINT.search(
+                    element.get("class") or ""):
+                by_class = element
+            if by_id is None and tag == "div" and CONTENT_HINT.search(
+                    element.get("id") or ""):
+                by_id = element
+            # Children in reverse so they're popped in document order
+            stack.extend(reversed(element))
+        for element in unwanted:
+            element.drop_tree()
+        # Elements with no children are falsy, compare with None
+        return next((element for element in (article, main, by_class, by_id,
+                                              body) if element is not None),
+                    None)
+
+    def text_lines(self, element):
+        """
+        Generator of the stripped, non empty text pieces of element, in
+        document order.
+        """
+        # (element, True) reads the element, (element, False) its tail
+        stack = [(element, True)]
+        while stack:
+            node, opening = stack.pop()
+            if opening:
+                if node is not element:
+                    stack.append((node, False))
+                if not isinstance(node.tag, str):
+                    continue
+                text = node.text
+                stack.extend((child, True) for child in reversed(node))
+            else:
+                text = node.tail
+            if text:
+                text = text.strip()
+                if text:
+                    yield text
+
+    def iter_lines(self, html):
+        """Text pieces of the main content, as a generator."""
+        if not html or not html.strip():
+            return iter(())
+        try:
+            root = lxml.html.fromstring(html)
+        except (etree.ParserError, ValueError):
+            # Bytes-only declarations, empty documents...
+            root = lxml.html.fromstring(html.encode("utf-8"))
+        main_content = self.find_main_content(root)
+        if main_content is None:
+            return iter(())
+        return self.text_lines(main_content)
+
+    def extract(self, html):
+        """
+        :return: Text of the main content, one text piece per line.
+        """
+        return "\n".join(self.iter_lines(html))
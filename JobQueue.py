@@ -0,0 +1,452 @@
+import os
+import re
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import urllib.error
+
+import requests  # type: ignore
+
+from PipelineMetrics import metrics, metrics_file
+
+# "job_queue" entry of config.json
+JOB_QUEUE = {
+    "path": "data/jobs.sqlite",
+    "max_attempts": 4,      # Runs of a job before it fails for good
+    "backoff": 60,          # Seconds before the first retry, then x2
+    "max_backoff": 3600,
+    "poll_interval": 5,     # Seconds between polls of an idle worker
+    "stale_after": 6 * 3600,  # Running jobs older than this are requeued
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    article_url TEXT NOT NULL,
+    fact_id TEXT NOT NULL,
+    speaker TEXT NOT NULL,
+    nb_shorts INTEGER NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    worker TEXT,
+    error TEXT,
+    shorts TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_next
+    ON jobs (status, priority DESC, not_before, id);
+"""
+
+
+class TransientError(Exception):
+    """Failure worth retrying later, e.g. a download that failed."""
+
+
+def is_transient_status(status):
+    """Server errors and rate limiting, a 404 won't get better."""
+    return status is not None and (status >= 500 or status == 429)
+
+
+def is_transient(error):
+    """
+    Connection errors, timeouts, server errors (5xx) and rate limiting
+    (429), retried with backoff. Other HTTP errors (e.g. 404) and empty
+    articles fail at once.
+    """
+    if isinstance(error, TransientError):
+        return True
+    if isinstance(error, urllib.error.HTTPError):
+        return is_transient_status(error.code)
+    if isinstance(error, requests.HTTPError):
+        return is_transient_status(getattr(error.response, "status_code",
+                                           None))
+    if isinstance(error, (ConnectionError, TimeoutError,
+                          urllib.error.URLError, requests.ConnectionError,
+                          requests.Timeout)):
+        return True
+    # yt_dlp is only imported by the YouTube backend, its messages hold
+    # the HTTP status (e.g. "HTTP Error 403: Forbidden") or the network
+    # error
+    if type(error).__name__ == "DownloadError":
+        status = re.search(r"HTTP Error (\d{3})", str(error))
+        if status is not None:
+            return is_transient_status(int(status.group(1)))
+        return re.search(r"timed out|urlopen error|Connection",
+                         str(error)) is not None
+    return False
+
+
+class JobQueue:
+    def __init__(self, path=JOB_QUEUE["path"], max_attempts=4, backoff=60,
+                 max_backoff=3600):
+        """
+        Persistent queue of short production jobs in a local SQLite file,
+        shared by any number of worker processes (see JobWorker).
+        Jobs run by decreasing priority, then in order of arrival.
+        :param max_attempts: Runs of a job before it fails for good,
+                             transient failures only, others fail at once.
+        :param backoff: Seconds before the first retry, doubled at each
+                        retry up to max_backoff.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # Autocommit, transactions are explicit
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, settings=None):
+        """:param settings: "job_queue" entry of config.json."""
+        settings = dict(JOB_QUEUE, **(settings or {}))
+        return cls(settings["path"], settings["max_attempts"],
+                   settings["backoff"], settings["max_backoff"])
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, article_url, fact_id="fact1", speaker="p314",
+                nb_shorts=3, priority=0):
+        """:return: Job id."""
+        cursor = self.db.execute(
+            "INSERT INTO jobs (article_url, fact_id, speaker, nb_shorts, "
+            "priority, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (article_url, fact_id, speaker, nb_shorts, priority, time.time()))
+        return cursor.lastrowid
+
+    def claim(self, worker):
+        """
+        Next job ready to run, marked as running by worker.
+        :return: Job dict, None when no job is ready.
+        """
+        now = time.time()
+        # Write lock from the start, two workers can't claim the same job
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND "
+                "not_before <= ? ORDER BY priority DESC, id LIMIT 1",
+                (now,)).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, "
+                    "worker = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, worker, row["id"]))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return None if row is None else self.get(row["id"])
+
+    def complete(self, job_id, shorts):
+        """:param shorts: Paths of the shorts produced."""
+        self.db.execute(
+            "UPDATE jobs SET status = 'done', finished = ?, error = NULL, "
+            "shorts = ? WHERE id = ?",
+            (time.time(), json.dumps(shorts), job_id))
+
+    def fail(self, job_id, error, transient):
+        """
+        Requeue the job after a backoff delay when the failure is transient
+        and attempts are left, else mark it failed.
+        :return: New status, 'queued' or 'failed'.
+        """
+        job = self.get(job_id)
+        now = time.time()
+        if transient and job["attempts"] < self.max_attempts:
+            delay = min(self.max_backoff,
+                        self.backoff * 2 ** (job["attempts"] - 1))
+            self.db.execute(
+                "UPDATE jobs SET status = 'queued', not_before = ?, "
+                "error = ? WHERE id = ?", (now + delay, error, job_id))
+            return "queued"
+        self.db.execute(
+            "UPDATE jobs SET status = 'failed', finished = ?, error = ? "
+            "WHERE id = ?", (now, error, job_id))
+        return "failed"
+
+    def requeue_stale(self, stale_after):
+        """
+        Requeue the jobs running for more than stale_after seconds, left
+        by a worker that died, or fail them when they used all their
+        attempts (a job killing its worker would be retried forever).
+        :return: Number of jobs requeued.
+        """
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, error = ? "
+                "WHERE status = 'running' AND started < ? AND attempts >= ?",
+                (now, "Stale: worker stopped on the last attempt",
+                 now - stale_after, self.max_attempts))
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = 'queued', not_before = 0 "
+                "WHERE status = 'running' AND started < ?",
+                (now - stale_after,))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def get(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?",
+                              (job_id,)).fetchone()
+        return None if row is None else job_dict(row)
+
+    def jobs(self, status=None, limit=50):
+        """Last jobs, most recent first."""
+        query = "SELECT * FROM jobs"
+        args = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            args = (status,)
+        rows = self.db.execute(query + " ORDER BY id DESC LIMIT ?",
+                               args + (limit,)).fetchall()
+        return [job_dict(row) for row in rows]
+
+    def stats(self, window=3600):
+        """
+        :return: Jobs per status, shorts and jobs done in the last window
+                 seconds, shorts per hour over that window and since the
+                 first job started, mean run time of the jobs done.
+        """
+        now = time.time()
+        counts = {status: 0 for status in
+                  ("queued", "running", "done", "failed")}
+        for row in self.db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[row[0]] = row[1]
+        done = self.db.execute(
+            "SELECT finished, started, shorts FROM jobs "
+            "WHERE status = 'done'").fetchall()
+        first = self.db.execute(
+            "SELECT MIN(started) FROM jobs").fetchone()[0]
+        recent = [row for row in done if row["finished"] >= now - window]
+        recent_shorts = sum(len(json.loads(row["shorts"])) for row in recent)
+        total_shorts = sum(len(json.loads(row["shorts"])) for row in done)
+        hours = (now - first) / 3600 if first else 0
+        return {
+            "jobs": counts,
+            "window": window,
+            "jobs_done_window": len(recent),
+            "shorts_window": recent_shorts,
+            "shorts_per_hour": round(recent_shorts * 3600 / window, 2),
+            "shorts_done": total_shorts,
+            "shorts_per_hour_overall": round(total_shorts / hours, 2)
+            if hours else 0.0,
+            "mean_job_seconds": round(
+                sum(r["finished"] - r["started"] for r in done) / len(done),
+                1) if done else None,
+        }
+
+    def print_stats(self, window=3600):
+        stats = self.stats(window)
+        jobs = stats["jobs"]
+        # No job done yet, no duration
+        mean = stats["mean_job_seconds"]
+        mean = "n/a" if mean is None else f"{mean}s"
+        print("+--+")
+        print(f"   | Jobs: {jobs['queued']} queued, {jobs['running']} "
+              f"running, {jobs['done']} done, {jobs['failed']} failed")
+        print(f"   +-- last {window / 3600:g}h: {stats['shorts_window']} "
+              f"shorts ({stats['shorts_per_hour']} shorts/hour)")
+        print(f"   +-- overall: {stats['shorts_done']} shorts "
+              f"({stats['shorts_per_hour_overall']} shorts/hour), "
+              f"{mean} per job")
+        print("+--+")
+        print("|")
+
+
+def job_dict(row):
+    job = dict(row)
+    job["shorts"] = json.loads(job["shorts"]) if job["shorts"] else []
+    return job
+
+
+class JobWorker:
+    def __init__(self, queue, run, name=None, poll_interval=5,
+                 stale_after=6 * 3600):
+        """
+        Pulls jobs from a JobQueue and runs them one at a time. Start one
+        worker process per job to run at the same time, they share the
+        clip library and caches on disk, and the models when the vision
+        and tts backends are a ModelServer.
+        :param run: run(job) -> paths of the shorts, raises TransientError
+                    (or a network error) for failures worth a retry.
+        """
+        self.queue = queue
+        self.run = run
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+
+    def run_once(self):
+        """:return: The job run, None when no job was ready."""
+        job = self.queue.claim(self.name)
+        if job is None:
+            return None
+        print(f"+--> Job {job['id']}: {job['article_url']} {job['fact_id']}"
+              f" (attempt {job['attempts']})")
+        print("|")
+        try:
+            with metrics.stage("job", job["fact_id"], job_id=job["id"],
+                               attempt=job["attempts"]):
+                shorts = self.run(job)
+        except Exception as e:
+            status = self.queue.fail(job["id"], f"{type(e).__name__}: {e}",
+                                     is_transient(e))
+            print(f"+--> Job {job['id']} {status}: {e}")
+        else:
+            self.queue.complete(job["id"], shorts)
+            print(f"+--> Job {job['id']} done, {len(shorts)} shorts")
+        print("|")
+        return self.queue.get(job["id"])
+
+    def run_forever(self, max_jobs=None):
+        """Run jobs until max_jobs were run (forever if None)."""
+        nb_jobs = 0
+        while max_jobs is None or nb_jobs < max_jobs:
+            self.queue.requeue_stale(self.stale_after)
+            if self.run_once() is None:
+                time.sleep(self.poll_interval)
+                continue
+            nb_jobs += 1
+            metrics.flush()
+
+
+def short_job_runner(config, sessions):
+    """
+    run(job) of a JobWorker making the shorts with generate_short, each
+    job in its own folder {output_path}/jobs/job_<id>. The frame hashes,
+    clip library and preview proxies are shared by all the jobs, in
+    config "cache_path" ({output_path}/cache by default).
+    """
+    from generate_short import generate_short
+
+    cache_path = config.get("cache_path") or os.path.join(
+        config["output_path"], "cache")
+
+    def run(job):
+        job_path = os.path.join(config["output_path"], "jobs",
+                                f"job_{job['id']}")
+        os.makedirs(job_path, exist_ok=True)
+        job_config = dict(config, article_url=job["article_url"],
+                          fact_id=job["fact_id"], output_path=job_path,
+                          output_file="fun_facts.json",
+                          cache_path=cache_path)
+        # DocumentProcessor reads output_file as a path, the other stages as
+        # a file of output_path
+        config_path = os.path.join(job_path, "config.json")
+        with open(config_path, "w", encoding="utf-8") as file:
+            json.dump(dict(job_config,
+                           output_file=f"{job_path}/fun_facts.json"),
+                      file, indent=4)
+        return generate_short(job_config, config_path, sessions,
+                              job["speaker"], job["nb_shorts"])
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Queue of short production jobs")
+    parser.add_argument("--config", default="data/inputs/config.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="Add a job")
+    enqueue.add_argument("article_url")
+    enqueue.add_argument("--fact-id", default="fact1")
+    enqueue.add_argument("--speaker", default="p314")
+    enqueue.add_argument("--nb-shorts", type=int, default=3)
+    enqueue.add_argument("--priority", type=int, default=0,
+                         help="Higher runs first")
+    feed = commands.add_parser(
+        "enqueue-feed", help="Add a job per article of a feed")
+    feed.add_argument("feed", nargs="?",
+                      help="RSS / Atom url or file of urls, config "
+                           "\"article_feed\" by default")
+    for option, default in (("--fact-id", "fact1"), ("--speaker", "p314"),
+                            ("--nb-shorts", 3), ("--priority", 0)):
+        feed.add_argument(option, default=default, type=type(default))
+    work = commands.add_parser("work", help="Run jobs")
+    work.add_argument("--max-jobs", type=int)
+    status = commands.add_parser("status", help="Jobs and throughput")
+    status.add_argument("--window", type=float, default=1,
+                        help="Hours of the throughput window")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    settings = dict(JOB_QUEUE, **config.get("job_queue", {}))
+    queue = JobQueue.from_config(settings)
+
+    if args.command == "enqueue":
+        job_id = queue.enqueue(args.article_url, args.fact_id, args.speaker,
+                               args.nb_shorts, args.priority)
+        print(f"+--> Job {job_id} queued")
+    elif args.command == "enqueue-feed":
+        from DocumentProcessor import DocumentProcessor
+
+        # The pages are fetched once (cached in {output_path}/article_cache)
+        # and only the articles with fun facts get a job
+        output_path = config["output_path"]
+        os.makedirs(output_path, exist_ok=True)
+        metrics.open(metrics_file(config))
+        config_path = os.path.join(output_path, "feed_config.json")
+        with open(config_path, "w", encoding="utf-8") as file:
+            json.dump(dict(config,
+                           output_file=f"{output_path}/fun_facts.json"),
+                      file, indent=4)
+        articles = DocumentProcessor(config_path).get_fun_facts_batch(
+            args.feed)
+        for article_url, article in articles.items():
+            if args.fact_id not in article["fun_facts"]:
+                continue
+            job_id = queue.enqueue(article_url, args.fact_id, args.speaker,
+                                   args.nb_shorts, args.priority)
+            print(f"+--> Job {job_id} queued for {article_url}")
+    elif args.command == "status":
+        for job in queue.jobs():
+            print(f"   | {job['id']:>5} {job['status']:<8} "
+                  f"p{job['priority']} {job['fact_id']} "
+                  f"{job['article_url']} {job['error'] or ''}")
+        queue.print_stats(args.window * 3600)
+    else:
+        from ModelSessions import ModelSessions
+        from Backends import make_backend
+
+        output_path = config["output_path"]
+        os.makedirs(output_path, exist_ok=True)
+        metrics.open(metrics_file(config))
+        # Kept for all the jobs of this worker
+        sessions = ModelSessions(
+            client=make_backend("llm", config.get("backends")),
+            keep_alive=config.get("keep_alive", "5m"))
+        worker = JobWorker(queue, short_job_runner(config, sessions),
+                           poll_interval=settings["poll_interval"],
+                           stale_after=settings["stale_after"])
+        try:
+            worker.run_forever(args.max_jobs)
+        finally:
+            queue.print_stats()
+            metrics.print_summary()
+    queue.close()
+
+
+if __name__ == "__main__":
+    # Through the module, so generate_short raises the same TransientError
+    from JobQueue import main
+    main()
@@ -0,0 +1,40 @@
+import importlib
+
+
+class LazyModule:
+    def __init__(self, name):
+        """
+        Stand-in for a module, imported on first attribute access.
+        The pipeline modules import their heavy libraries (cv2, moviepy,
+        ffmpeg, PIL...) this way, so a script only pays for the libraries
+        of the stages it actually runs.
+        :param name: Full module name, e.g. "moviepy.editor".
+        """
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            # importlib caches in sys.modules and locks concurrent imports
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    """Module name, imported when one of its attributes is first used."""
+    return LazyModule(name)
@@ -0,0 +1,301 @@
+import io
+import os
+import sys
+import json
+import time
+import queue
+import base64
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PipelineMetrics import metrics
+from Backends import make_backend, DEFAULT_BACKENDS
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+Image = lazy_import("PIL.Image")
+
+# "model_server" entry of config.json
+MODEL_SERVER = {
+    "host": "127.0.0.1",    # Local only, the requests aren't authenticated
+    "port": 8765,
+    "max_concurrency": 1,   # Requests running at the same time
+    "max_queue": 64,        # Requests waiting, more are refused (503)
+    "model_path": None,     # moondream .mf file of the vision model
+    "metrics_file": None,   # JSON lines of the served requests
+}
+
+
+class Job:
+    def __init__(self, name, run):
+        """One request waiting for a worker thread."""
+        self.name = name
+        self.run = run
+        self.queued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ModelServer:
+    def __init__(self, settings=None, backends=None):
+        """
+        Keeps the vision and TTS models loaded and serves frame scoring and
+        speech synthesis to any number of pipeline runs over HTTP on
+        localhost, see the "server" backends of Backends.py.
+        Requests go through a queue of at most max_queue jobs, run by
+        max_concurrency worker threads. A model serves one request at a
+        time, so more than one worker lets vision and TTS run together.
+        :param settings: "model_server" entry of config.json.
+        :param backends: "backends" entry of config.json, the kinds set to
+                         "server" use their default backend here.
+        """
+        self.settings = dict(MODEL_SERVER, **(settings or {}))
+        self.backends = local_backends(backends)
+        self.jobs = queue.Queue(self.settings["max_queue"])
+        self.models = {}
+        self.model_locks = {}
+        self.loads = {}
+        self.stats = {}
+        self.running = 0
+        self.lock = threading.Lock()
+        self.workers = []
+        self.httpd = None
+        self.started = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load_models(self):
+        for kind, defaults in (
+                ("vision", {"model_path": self.settings["model_path"]}),
+                ("tts", {})):
+            start = time.perf_counter()
+            with metrics.stage("model_load", model=kind):
+                self.models[kind] = make_backend(kind, self.backends,
+                                                 **defaults)
+            self.model_locks[kind] = threading.Lock()
+            self.loads[kind] = round(time.perf_counter() - start, 3)
+            print(f"|  +-- {kind} model loaded in {self.loads[kind]:.1f}s")
+
+    def start(self):
+        """Load the models and serve in background threads."""
+        if self.settings["metrics_file"]:
+            metrics.open(self.settings["metrics_file"])
+        print("+--> Loading the models")
+        self.load_models()
+        self.httpd = ThreadingHTTPServer(
+            (self.settings["host"], self.settings["port"]), RequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.model_server = self
+        for _ in range(self.settings["max_concurrency"]):
+            worker = threading.Thread(target=self.work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.started = time.time()
+        print(f"+--> Serving the models on {self.url}")
+        print("|")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        metrics.flush()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("+--> Stopping")
+            self.stop()
+
+    def stat(self, name):
+        return self.stats.setdefault(name, {
+            "requests": 0, "errors": 0, "rejected": 0,
+            "wait": 0.0, "run": 0.0, "max_run": 0.0})
+
+    def submit(self, name, run):
+        """
+        Queue run() and wait for its result.
+        :raise queue.Full: When max_queue requests are already waiting.
+        """
+        job = Job(name, run)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.stat(name)["rejected"] += 1
+            raise
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            wait = time.perf_counter() - job.queued
+            with self.lock:
+                self.running += 1
+            start = time.perf_counter()
+            try:
+                with metrics.stage(f"serve_{job.name}", wait=round(wait, 3)):
+                    metrics.add("model_calls")
+                    job.result = job.run()
+            except Exception as e:
+                job.error = e
+            run = time.perf_counter() - start
+            with self.lock:
+                self.running -= 1
+                stat = self.stat(job.name)
+                stat["requests"] += 1
+                stat["errors"] += job.error is not None
+                stat["wait"] += wait
+                stat["run"] += run
+                stat["max_run"] = max(stat["max_run"], run)
+            job.done.set()
+
+    def vision(self, task, request):
+        """
+        :param task: "query" or "caption".
+        :param request: {"image": base64 image file, "prompt" or "length",
+                         "settings"}
+        """
+        image = Image.open(io.BytesIO(base64.b64decode(request["image"])))
+        model = self.models["vision"]
+        with self.model_locks["vision"]:
+            encoded_image = model.encode_image(image)
+            if task == "caption":
+                return model.caption(encoded_image,
+                                     request.get("length", "normal"),
+                                     settings=request.get("settings"))
+            return model.query(encoded_image, request["prompt"],
+                               settings=request.get("settings"))
+
+    def tts(self, request):
+        """
+        :param request: {"text", "speaker"}
+        :return: WAV file content.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "speech.wav")
+            with self.model_locks["tts"]:
+                self.models["tts"].tts_to_file(
+                    text=request["text"], speaker=request.get("speaker"),
+                    file_path=file_path)
+            with open(file_path, "rb") as file:
+                return file.read()
+
+    def health(self):
+        return {"status": "ok", "models": dict(self.loads),
+                "speakers": list(getattr(self.models["tts"], "speakers",
+                                         None) or [])}
+
+    def report(self):
+        """Queue state and per request type counts and mean times."""
+        with self.lock:
+            requests = {}
+            for name, stat in self.stats.items():
+                done = max(stat["requests"], 1)
+                requests[name] = dict(
+                    stat, wait=round(stat["wait"], 3),
+                    run=round(stat["run"], 3),
+                    max_run=round(stat["max_run"], 3),
+                    mean_wait=round(stat["wait"] / done, 3),
+                    mean_run=round(stat["run"] / done, 3))
+            return {
+                "uptime": round(time.time() - self.started, 1),
+                "queued": self.jobs.qsize(),
+                "running": self.running,
+                "max_concurrency": self.settings["max_concurrency"],
+                "max_queue": self.settings["max_queue"],
+                "model_load": dict(self.loads),
+                "requests": requests,
+            }
+
+
+def local_backends(backends):
+    """backends without the kinds served by a ModelServer."""
+    if not isinstance(backends, dict):
+        return backends
+    local = {}
+    for kind, settings in backends.items():
+        name = settings if isinstance(settings, str) else settings.get("name")
+        local[kind] = DEFAULT_BACKENDS[kind] if name == "server" else settings
+    return local
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health, GET /metrics,
+    POST /vision/query, /vision/caption: JSON in, {"answer"} /
+    {"caption"} out,
+    POST /tts: JSON in, WAV out.
+    """
+
+    def log_message(self, format, *args):
+        # One line per request would drown the progress output
+        pass
+
+    def send(self, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server.model_server
+        if self.path == "/health":
+            self.send(200, server.health())
+        elif self.path == "/metrics":
+            self.send(200, server.report())
+        else:
+            self.send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        server = self.server.model_server
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path in ("/vision/query", "/vision/caption"):
+                task = self.path.rsplit("/", 1)[1]
+                result = server.submit(
+                    "vision", lambda: server.vision(task, request))
+                self.send(200, result)
+            elif self.path == "/tts":
+                wav = server.submit("tts", lambda: server.tts(request))
+                self.send(200, wav, "audio/wav")
+            else:
+                self.send(404, {"error": f"Unknown path {self.path}"})
+        except queue.Full:
+            self.send(503, {"error": "Queue full, retry later"})
+        except (ValueError, KeyError) as e:
+            self.send(400, {"error": f"Bad request: {e!r}"})
+        except Exception as e:
+            self.send(500, {"error": repr(e)})
+
+
+if __name__ == "__main__":
+    # python ModelServer.py [config.json], then set the vision and tts
+    # backends of the pipeline config to "server"
+    config_path = sys.argv[1] if len(sys.argv) > 1 else \
+        "data/inputs/config.json"
+    with open(config_path, 'r') as file:
+        config = json.load(file)
+    ModelServer(config.get("model_server"),
+                config.get("backends")).serve_forever()
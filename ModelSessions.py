@@ -0,0 +1,197 @@
+import time
+import threading
+
+from PipelineMetrics import metrics
+from Profiler import profiler
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+ollama = lazy_import("ollama")
+
+
+class ModelSessions:
+    def __init__(self, client=None, host=None, keep_alive="5m"):
+        """
+        Single entry point to Ollama for the pipeline stages.
+        On a RAM limited machine Ollama evicts a model to load the next one,
+        so every model switch costs a reload. ModelSessions keeps track of
+        the loaded model, runs calls grouped by model, frees a model
+        (keep_alive=0) with the last call of its group and preloads the
+        model of the next group as soon as that call is done.
+        Every call records its wall time and the load / prompt / generation
+        durations reported by Ollama.
+        :param client: Anything with ollama's chat(), generate() and embed().
+        :param host: Ollama server, used when no client is given.
+        :param keep_alive: How long Ollama keeps a model between calls.
+        """
+        if client is None:
+            client = ollama.Client(host=host) if host else ollama
+        self.client = client
+        self.keep_alive = keep_alive
+        self.current = None
+        self.last_model = None
+        self.switches = 0
+        self.calls = []
+        self.preloads = {}
+        self.release_next = False
+        self.lock = threading.Lock()
+
+    def record(self, kind, model, start, response):
+        def seconds(key):
+            value = response.get(key) if response is not None else None
+            return (value or 0) / 1e9
+
+        entry = {
+            "kind": kind,
+            "model": model,
+            "wall": time.perf_counter() - start,
+            "load": seconds("load_duration"),
+            "prompt_eval": seconds("prompt_eval_duration"),
+            "eval": seconds("eval_duration"),
+        }
+        entry["inference"] = entry["prompt_eval"] + entry["eval"]
+        if kind != "preload":
+            metrics.add("model_calls")
+        with self.lock:
+            self.calls.append(entry)
+        return entry
+
+    def call(self, kind, model, **kwargs):
+        # Wait for a running preload instead of loading the model twice
+        preload = self.preloads.pop(model, None)
+        if preload is not None:
+            preload.join()
+        if self.last_model not in (None, model):
+            self.switches += 1
+        self.current = self.last_model = model
+        keep_alive = 0 if self.release_next else self.keep_alive
+        self.release_next = False
+        kwargs.setdefault("keep_alive", keep_alive)
+        start = time.perf_counter()
+        with profiler.section(f"ollama_{kind}"):
+            response = getattr(self.client, kind)(model=model, **kwargs)
+        if kwargs["keep_alive"] == 0:
+            self.current = None
+        if kwargs.get("stream"):
+            return self.timed_stream(kind, model, start, response)
+        self.record(kind, model, start, response)
+        return response
+
+    def timed_stream(self, kind, model, start, chunks):
+        """
+        Pass the streamed chunks through and record the call when the
+        stream ends or is closed early (Ollama only reports its durations
+        in the last chunk, so an interrupted call only has its wall time).
+        """
+        last = None
+        try:
+            for chunk in chunks:
+                last = chunk
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            done = last is not None and last.get("done")
+            self.record(kind, model, start, last if done else None)
+
+    def chat(self, model, messages, **kwargs):
+        """Same as ollama.chat."""
+        return self.call("chat", model, messages=messages, **kwargs)
+
+    def generate(self, model, prompt, **kwargs):
+        """Same as ollama.generate."""
+        return self.call("generate", model, prompt=prompt, **kwargs)
+
+    def embed(self, model, input, **kwargs):
+        """Same as ollama.embed."""
+        return self.call("embed", model, input=input, **kwargs)
+
+    def preload(self, model):
+        """
+        Load model in the background (an empty generate request loads the
+        model without generating), the next call to it waits for the end of
+        the load.
+        """
+        if model == self.current or model in self.preloads:
+            return
+
+        def load():
+            start = time.perf_counter()
+            response = self.client.generate(model=model, prompt="",
+                                            keep_alive=self.keep_alive)
+            self.record("preload", model, start, response)
+
+        thread = threading.Thread(target=load, daemon=True)
+        self.preloads[model] = thread
+        thread.start()
+
+    def release(self, model=None):
+        """Ask Ollama to unload model (the current one by default)."""
+        model = model or self.current
+        if model is None:
+            return
+        preload = self.preloads.pop(model, None)
+        if preload is not None:
+            preload.join()
+        self.client.generate(model=model, prompt="", keep_alive=0)
+        if model == self.current:
+            self.current = None
+
+    def run_grouped(self, calls, next_model=None):
+        """
+        Run calls grouped by model, starting with the loaded model.
+        The last call of a group frees its model, then the model of the
+        next group is preloaded (not before, it could evict the model of
+        the running call).
+        :param calls: List of (model, function) pairs, each function making
+                      one call through this object.
+        :param next_model: Model needed after these calls, preloaded after
+                           the last group and kept loaded.
+        :return: The results of the functions, in the order of calls.
+        """
+        groups = {}
+        for i, (model, function) in enumerate(calls):
+            groups.setdefault(model, []).append(i)
+        order = sorted(groups, key=lambda m: m != self.current)
+        results = [None] * len(calls)
+        for g, model in enumerate(order):
+            following = order[g + 1] if g + 1 < len(order) else next_model
+            ids = groups[model]
+            for n, i in enumerate(ids):
+                last = n == len(ids) - 1
+                if last:
+                    self.release_next = following not in (None, model)
+                try:
+                    results[i] = calls[i][1]()
+                finally:
+                    self.release_next = False
+            if following is not None:
+                self.preload(following)
+        return results
+
+    def report(self):
+        """
+        :return: {model: {calls, wall, load, inference}} with times in
+                 seconds, preloads included.
+        """
+        summary = {}
+        with self.lock:
+            calls = list(self.calls)
+        for entry in calls:
+            model = summary.setdefault(entry["model"], {
+                "calls": 0, "wall": 0.0, "load": 0.0, "inference": 0.0})
+            model["calls"] += entry["kind"] != "preload"
+            for key in ("wall", "load", "inference"):
+                model[key] += entry[key]
+        return summary
+
+    def print_report(self):
+        print("+--+")
+        print(f"   | Ollama: {self.switches} model switches")
+        for model, stats in self.report().items():
+            print(f"   +-- {model}: {stats['calls']} calls, "
+                  f"{stats['wall']:.1f}s wall, {stats['load']:.1f}s loading, "
+                  f"{stats['inference']:.1f}s inference")
+        print("+--+")
+        print("|")
@@ -0,0 +1,172 @@
+import re
+import math
+from collections import Counter
+
+# Words announcing surprising / factual statements, the BM25 query
+FACT_CUES = [
+    "first", "only", "largest", "biggest", "smallest", "fastest", "oldest",
+    "youngest", "longest", "highest", "most", "record", "records", "never",
+    "ever", "unique", "rare", "surprising", "surprisingly", "unusual",
+    "famous", "discovered", "invented", "won", "champion", "history",
+    "historic", "million", "billion", "percent", "century", "years",
+    "born", "died", "known", "secret", "despite", "although", "actually",
+    "<num>",
+]
+WORD = re.compile(r"[a-z]+|\d[\d,.]*")
+NUMBER = re.compile(r"\d")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Rough LLM token count (about 4 characters per token in English)."""
+    return math.ceil(len(text) / 4)
+
+
+def truncate_words(text, max_chars, all_parts=False):
+    """
+    Cut text between words into parts of at most max_chars (words longer
+    than that are cut).
+    :return: The parts, only the first one unless all_parts.
+    """
+    parts = []
+    current = ""
+    for word in text.split():
+        while len(word) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current} {word}" if current else word
+        if parts and not all_parts:
+            return parts[:1]
+    if current:
+        parts.append(current)
+    return parts if all_parts else parts[:1]
+
+
+class PassageSelector:
+    def __init__(self, token_budget=1500, passage_tokens=120, k1=1.5,
+                 b=0.75, query=None):
+        """
+        Keep the most fact-dense passages of an article under a token
+        budget, so the LLM prompt stays short (prefill time on CPU) and
+        within the context window.
+        Passages are scored with BM25 against a query of fact cue words
+        (numbers count as one "<num>" term), the best ones are kept and put
+        back in article order.
+        :param token_budget: Largest estimated size of the kept text.
+        :param passage_tokens: Target size of a passage. Lines are grouped
+                               into passages up to this size, longer lines
+                               are split between sentences.
+        """
+        self.token_budget = token_budget
+        self.passage_tokens = passage_tokens
+        self.k1 = k1
+        self.b = b
+        self.query = query or FACT_CUES
+
+    def split_line(self, line):
+        """
+        Parts of line of at most passage_tokens, cut between sentences (or
+        between words for sentences longer than that).
+        """
+        if estimate_tokens(line) <= self.passage_tokens:
+            return [line]
+        max_chars = 4 * self.passage_tokens
+        parts = []
+        current = ""
+        for sentence in SENTENCE_END.split(line):
+            pieces = [sentence]
+            if len(sentence) > max_chars:
+                pieces = truncate_words(sentence, max_chars, all_parts=True)
+            for piece in pieces:
+                if current and len(current) + 1 + len(piece) > max_chars:
+                    parts.append(current)
+                    current = ""
+                current = f"{current} {piece}" if current else piece
+        if current:
+            parts.append(current)
+        return parts
+
+    def split_passages(self, text):
+        passages = []
+        current = []
+        size = 0
+        lines = (part for line in text.split("\n")
+                 for part in self.split_line(line.strip()))
+        for line in lines:
+            if not line:
+                continue
+            tokens = estimate_tokens(line)
+            if current and size + tokens > self.passage_tokens:
+                passages.append("\n".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += tokens
+        if current:
+            passages.append("\n".join(current))
+        return passages
+
+    def terms(self, passage):
+        return ["<num>" if NUMBER.match(word) else word
+                for word in WORD.findall(passage.lower())]
+
+    def scores(self, passages):
+        """BM25 score of each passage for the query."""
+        documents = [Counter(self.terms(p)) for p in passages]
+        lengths = [sum(d.values()) for d in documents]
+        average = max(sum(lengths) / max(len(documents), 1), 1e-9)
+        idf = {}
+        for term in set(self.query):
+            with_term = sum(term in d for d in documents)
+            idf[term] = math.log(1 + (len(documents) - with_term + 0.5) /
+                                 (with_term + 0.5))
+        scores = []
+        for document, length in zip(documents, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / average)
+            score = 0.0
+            for term, weight in idf.items():
+                frequency = document.get(term, 0)
+                if frequency:
+                    score += (weight * frequency * (self.k1 + 1) /
+                              (frequency + norm))
+            scores.append(score)
+        return scores
+
+    def select(self, text):
+        """
+        :return: (kept text, stats) with stats the estimated tokens of the
+                 article and of the kept text, and the number of passages.
+        """
+        passages = self.split_passages(text)
+        article_tokens = estimate_tokens(text)
+        if article_tokens <= self.token_budget:
+            kept = list(range(len(passages)))
+        else:
+            scores = self.scores(passages)
+            ranked = sorted(range(len(passages)), key=lambda i: -scores[i])
+            kept = []
+            used = 0
+            for i in ranked:
+                tokens = estimate_tokens(passages[i])
+                if used + tokens <= self.token_budget:
+                    kept.append(i)
+                    used += tokens
+            kept.sort()
+        selected = "\n".join(passages[i] for i in kept)
+        if passages and not kept:
+            # Every passage is over budget: the best one, cut to fit
+            kept = ranked[:1]
+            selected = truncate_words(passages[ranked[0]],
+                                      4 * self.token_budget)[0]
+        prompt_tokens = estimate_tokens(selected)
+        stats = {"article_tokens": article_tokens,
+                 "prompt_tokens": prompt_tokens,
+                 "saved_tokens": article_tokens - prompt_tokens,
+                 "passages": len(passages),
+                 "kept_passages": len(kept)}
+        return selected, stats
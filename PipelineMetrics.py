@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+# Counters every stage record starts with
+COUNTERS = ("bytes", "frames_decoded", "model_calls", "cache_hits")
+
+
+class PipelineMetrics:
+    def __init__(self, path=None, flush_every=100):
+        """
+        Structured events of the pipeline, written as JSON lines.
+        Events are buffered and written flush_every events at a time (and
+        at exit), so logging doesn't open the file on every call.
+        A stage record holds its duration and counters (bytes processed,
+        frames decoded, model calls, cache hits), the counters added while
+        a stage runs go to every stage open in the same thread (stages of
+        other threads run concurrently, they don't share counters).
+        :param path: JSON lines file, None keeps the events in memory only.
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.buffer = []
+        self.stages = []
+        # Per thread stack of the open stages
+        self.local = threading.local()
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def open(self, path):
+        """Write the events to path from now on (and the buffered ones)."""
+        self.flush()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+
+    def emit(self, event):
+        event = dict(event, time=round(time.time(), 3))
+        with self.lock:
+            self.buffer.append(event)
+            full = len(self.buffer) >= self.flush_every
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events, self.buffer = self.buffer, []
+            if self.path is None or not events:
+                # Nowhere to write yet, keep the last ones for open()
+                self.buffer = (events + self.buffer)[-10 * self.flush_every:]
+                return
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.writelines(json.dumps(e, ensure_ascii=False) + "\n"
+                                for e in events)
+
+    def log(self, source, message, **fields):
+        """Free text log line (kept short, not whole documents)."""
+        self.emit(dict(fields, type="log", source=source,
+                       message=str(message)[:500]))
+
+    def open_stages(self):
+        """Stages open in this thread, innermost last."""
+        if not hasattr(self.local, "stages"):
+            self.local.stages = []
+        return self.local.stages
+
+    def add(self, counter, value=1):
+        """Add value to counter of the stages running in this thread."""
+        for record in self.open_stages():
+            record[counter] = record.get(counter, 0) + value
+
+    @contextmanager
+    def stage(self, name, fact_id=None, **fields):
+        """
+        Time a stage. The yielded record can be updated directly, e.g.
+        record["bytes"] += size.
+        """
+        record = {counter: 0 for counter in COUNTERS}
+        record.update(fields, type="stage", stage=name, fact_id=fact_id)
+        stages = self.open_stages()
+        stages.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration"] = round(time.perf_counter() - start, 3)
+            stages[:] = [r for r in stages if r is not record]
+            with self.lock:
+                self.stages.append(record)
+            self.emit(record)
+
+    def summary(self):
+        """
+        :return: {stage: {"count", "duration", counters...}}, in order of
+                 first run.
+        """
+        summary = {}
+        with self.lock:
+            stages = list(self.stages)
+        for record in stages:
+            total = summary.setdefault(record["stage"], dict(
+                {"count": 0, "duration": 0.0}, **{c: 0 for c in COUNTERS}))
+            total["count"] += 1
+            for key in ("duration",) + COUNTERS:
+                total[key] += record.get(key, 0)
+        return summary
+
+    def print_summary(self):
+        wall = time.perf_counter() - self.start
+        print("+--+")
+        print(f"   | Where the time went ({wall:.1f}s in total)")
+        for name, total in self.summary().items():
+            counters = ", ".join(f"{total[c]} {c.replace('_', ' ')}"
+                                 for c in COUNTERS if total[c])
+            print(f"   +-- {name}: {total['duration']:.1f}s "
+                  f"({100 * total['duration'] / max(wall, 1e-9):.0f}%)"
+                  f"{', ' + counters if counters else ''}")
+        print("+--+")
+        print("|")
+        self.flush()
+
+
+def metrics_file(config):
+    """
+    JSON lines file of a run, for the stage records and the logs:
+    config "metrics_file" first, then the "log_file" that DocumentProcessor
+    opens when nothing is open yet, else {output_path}/metrics.jsonl.
+    """
+    return (config.get("metrics_file") or config.get("log_file") or
+            f"{config['output_path']}/metrics.jsonl")
+
+
+# Shared by all the pipeline classes
+metrics = PipelineMetrics()
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from io import StringIO
+from functools import wraps
+from contextlib import contextmanager
+
+from PipelineMetrics import metrics
+
+# Defaults of the "profiling" entry of config.json
+PROFILING = {
+    "enabled": False,
+    "output_dir": None,      # Defaults to <output_path>/profiles
+    "cprofile": True,        # Deterministic profile of each section
+    "tracemalloc": False,    # Memory growth and peak of each section
+    "sample_interval": 0.01, # Stack sampling period (s), 0 disables it
+    "top": 40,               # Functions listed in the text reports
+}
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Opt-in profiling of the hot sections of the pipeline, off by default
+        and switched on from the "profiling" entry of config.json.
+        Each section (a method decorated with @profiled or a
+        profiler.section block) gets its own cProfile profile, exclusive of
+        the nested sections, and optionally its tracemalloc memory growth
+        and peak (process wide, so approximate when threads overlap).
+        A sampling thread records the stacks of the threads inside a
+        section, written as collapsed stacks for flamegraph.pl / speedscope.
+        Work sent to other processes (render pool) isn't profiled.
+        When disabled a section costs one attribute check.
+        """
+        self.enabled = False
+        self.settings = dict(PROFILING)
+        self.output_dir = None
+        self.lock = threading.Lock()
+        # {thread id: [open section entries]}, innermost last
+        self.active = {}
+        # {(section, thread id): cProfile.Profile}
+        self.profiles = {}
+        self.sections = {}
+        self.stacks = {}
+        self.sampler = None
+        self.stopped = threading.Event()
+
+    def configure(self, settings=None, output_dir=None):
+        """
+        :param settings: The "profiling" entry of config.json (see
+                         PROFILING), or True to use the defaults.
+        :param output_dir: Used when settings has no output_dir.
+        """
+        if settings is True:
+            settings = {"enabled": True}
+        self.settings = dict(PROFILING, **(settings or {}))
+        self.enabled = bool(self.settings["enabled"])
+        if not self.enabled:
+            return
+        self.output_dir = (self.settings["output_dir"] or output_dir
+                           or "profiles")
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.settings["tracemalloc"] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.settings["sample_interval"] and self.sampler is None:
+            self.stopped.clear()
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+        atexit.register(self.write)
+        print(f"   +-- Profiling on, reports in {self.output_dir}")
+
+    @contextmanager
+    def section(self, name):
+        """Profile the block as section name."""
+        if not self.enabled:
+            yield
+            return
+        thread_id = threading.get_ident()
+        with self.lock:
+            stack = self.active.setdefault(thread_id, [])
+        entry = self.enter(name, thread_id, stack)
+        try:
+            yield
+        finally:
+            self.exit(entry, stack)
+
+    def enter(self, name, thread_id, stack):
+        parent = stack[-1] if stack else None
+        entry = {"name": name, "profile": None, "start": time.perf_counter()}
+        if parent is not None and parent["profile"] is not None:
+            # cProfile hooks one profile per thread: pause the parent one
+            parent["profile"].disable()
+        if self.settings["cprofile"]:
+            with self.lock:
+                profile = self.profiles.setdefault(
+                    (name, thread_id), cProfile.Profile())
+            try:
+                profile.enable()
+                entry["profile"] = profile
+            except ValueError:
+                pass  # Another profiling tool is active
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            for opened in stack:
+                opened["peak"] = max(opened["peak"], peak)
+            tracemalloc.reset_peak()
+            entry["memory"] = entry["peak"] = current
+        stack.append(entry)
+        return entry
+
+    def exit(self, entry, stack):
+        if entry["profile"] is not None:
+            entry["profile"].disable()
+        wall = time.perf_counter() - entry["start"]
+        stack.pop()
+        with self.lock:
+            total = self.sections.setdefault(entry["name"], {
+                "calls": 0, "wall": 0.0, "memory_growth": 0,
+                "memory_peak": 0})
+            total["calls"] += 1
+            total["wall"] += wall
+        if "memory" in entry and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            entry["peak"] = max(entry["peak"], peak)
+            with self.lock:
+                total["memory_growth"] += current - entry["memory"]
+                total["memory_peak"] = max(total["memory_peak"],
+                                           entry["peak"] - entry["memory"])
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], entry["peak"])
+        if stack and stack[-1]["profile"] is not None:
+            stack[-1]["profile"].enable()
+
+    def sample(self):
+        """Sampling thread: count the stacks of the profiled threads."""
+        interval = self.settings["sample_interval"]
+        while not self.stopped.wait(interval):
+            frames = sys._current_frames()
+            with self.lock:
+                threads = [(thread_id, stack[0]["name"])
+                           for thread_id, stack in self.active.items()
+                           if stack]
+            for thread_id, name in threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    function = getattr(code, "co_qualname", code.co_name)
+                    calls.append(f"{os.path.basename(code.co_filename)}:"
+                                 f"{function}")
+                    frame = frame.f_back
+                calls.append(name)
+                key = ";".join(reversed(calls)).replace(" ", "_")
+                with self.lock:
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def write(self):
+        """
+        Write to output_dir:
+        - <section>.prof: pstats file (snakeviz, pstats.Stats...),
+        - <section>.txt: its functions sorted by cumulative time,
+        - stacks.collapsed: sampled stacks, one "a;b;c count" per line,
+        - sections.json: calls, wall time and memory of each section.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            profiles = dict(self.profiles)
+            sections = {name: dict(total)
+                        for name, total in self.sections.items()}
+            stacks = dict(self.stacks)
+        by_section = {}
+        for (name, _), profile in profiles.items():
+            by_section.setdefault(name, []).append(profile)
+        for name, section_profiles in by_section.items():
+            stats = None
+            for profile in section_profiles:
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+                except TypeError:
+                    pass  # Nothing recorded in this thread
+            if stats is None:
+                continue
+            stats.dump_stats(f"{self.output_dir}/{name}.prof")
+            report = StringIO()
+            stats.stream = report
+            stats.sort_stats("cumulative").print_stats(self.settings["top"])
+            with open(f"{self.output_dir}/{name}.txt", "w",
+                      encoding="utf-8") as file:
+                file.write(report.getvalue())
+        with open(f"{self.output_dir}/stacks.collapsed", "w",
+                  encoding="utf-8") as file:
+            for key, count in sorted(stacks.items()):
+                file.write(f"{key} {count}\n")
+        with open(f"{self.output_dir}/sections.json", "w",
+                  encoding="utf-8") as file:
+            json.dump(sections, file, indent=4)
+        for name, total in sections.items():
+            metrics.emit(dict(total, type="profile", section=name))
+        print(f"   +-- Profiles of {len(sections)} sections written to "
+              f"{self.output_dir}")
+
+    def stop(self):
+        """Stop sampling, the reports are no longer written at exit."""
+        atexit.unregister(self.write)
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+
+
+# Shared by all the pipeline classes
+profiler = Profiler()
+
+
+def profiled(name=None):
+    """Decorator profiling each call of the function as a section."""
+    def decorate(function):
+        section = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.section(section):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
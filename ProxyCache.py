@@ -0,0 +1,62 @@
+import os
+
+from ClipLibrary import file_hash
+from FileUtils import atomic_output
+from PipelineMetrics import metrics
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+ffmpeg = lazy_import("ffmpeg")
+
+
+class ProxyCache:
+    def __init__(self, base_path, width=270, height=480):
+        """
+        Low resolution 9:16 copies of the clips, used for preview renders.
+        Proxies are keyed on the content of the clip, so the jobs sharing
+        base_path convert each clip only once, wherever it was copied.
+        """
+        self.proxy_folder = f"{base_path}/proxies"
+        os.makedirs(self.proxy_folder, exist_ok=True)
+        self.width = width
+        self.height = height
+        # (path, size, mtime) -> content hash, to read each clip only once
+        self.hashes = {}
+
+    def proxy_path(self, clip_path):
+        stat = os.stat(clip_path)
+        key = (os.path.abspath(clip_path), stat.st_size, stat.st_mtime_ns)
+        if key not in self.hashes:
+            self.hashes[key] = file_hash(clip_path)[:16]
+        return f"{self.proxy_folder}/{self.hashes[key]}_{self.height}p.mp4"
+
+    def get(self, clip_path):
+        """Return the proxy of clip_path, creating it if needed."""
+        proxy_path = self.proxy_path(clip_path)
+        if os.path.exists(proxy_path):
+            metrics.add("cache_hits")
+            return proxy_path
+        # Scale into the 9:16 frame and pad, like change_format does
+        with atomic_output(proxy_path) as tmp_path:
+            try:
+                (
+                    ffmpeg
+                    .input(clip_path)
+                    .filter("scale", w=self.width, h=self.height,
+                            force_original_aspect_ratio="decrease")
+                    .filter("pad", self.width, self.height,
+                            "(ow-iw)/2", "(oh-ih)/2")
+                    .output(tmp_path, vcodec="libx264", preset="ultrafast",
+                            crf=32, pix_fmt="yuv420p", an=None)
+                    .run(quiet=True, overwrite_output=True)
+                )
+            except ffmpeg.Error as e:
+                print("FFmpeg error occurred:", e)
+                print("STDERR:", e.stderr.decode())
+                raise
+        return proxy_path
+
+    def get_all(self, clip_paths):
+        """Map each clip path to its proxy."""
+        return {clip_path: self.get(clip_path)
+                for clip_path in set(clip_paths)}
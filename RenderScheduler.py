@@ -0,0 +1,69 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from FileUtils import atomic_output
+
+
+class RenderScheduler:
+    def __init__(self, max_workers=None):
+        """
+        Run render jobs in a process pool sized to the available cores.
+        :param max_workers: Upper bound on parallel renders (default: cores).
+        """
+        self.cores = os.cpu_count() or 1
+        self.max_workers = max(1, min(max_workers or self.cores, self.cores))
+
+    def split_jobs(self, jobs):
+        """
+        Spread the jobs round-robin over the workers and give each job
+        its share of the encoder threads.
+        """
+        nb_workers = max(1, min(self.max_workers, len(jobs)))
+        threads = max(1, self.cores // nb_workers)
+        batches = [[] for _ in range(nb_workers)]
+        for i, job in enumerate(jobs):
+            job["threads"] = threads
+            batches[i % nb_workers].append(job)
+        return batches
+
+    def prepare_audio(self, audio_clip, output_folder, bitrate="192k"):
+        """
+        Encode the narration once so every variant only has to mux it
+        instead of decoding and re-encoding the same WAV.
+        """
+        audio_path = os.path.join(output_folder, ".narration.m4a")
+        with atomic_output(audio_path) as tmp_path:
+            audio_clip.write_audiofile(tmp_path, fps=44100,
+                                       codec="aac", bitrate=bitrate)
+        return audio_path
+
+    def run(self, render_fn, jobs):
+        """
+        Render all jobs. render_fn must be a module level function taking
+        a list of jobs, so it can be sent to the worker processes.
+        """
+        if not jobs:
+            return
+        batches = self.split_jobs(jobs)
+        print(f"+--> Rendering {len(jobs)} videos on {len(batches)} workers "
+              f"({jobs[0]['threads']} encoder threads each)")
+        print("|")
+        if len(batches) == 1:
+            render_fn(batches[0])
+            return
+        with ProcessPoolExecutor(max_workers=len(batches)) as pool:
+            futures = [pool.submit(render_fn, batch) for batch in batches]
+            for future in as_completed(futures):
+                # Re-raise the first worker error in the parent process
+                future.result()
+
+    def cleanup(self, output_folder):
+        """Remove leftovers of interrupted renders."""
+        for name in os.listdir(output_folder):
+            if name.startswith(".partial_") or name == ".narration.m4a":
+                path = os.path.join(output_folder, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
@@ -0,0 +1,224 @@
+import re
+import json
+import typing
+from dataclasses import dataclass, fields, is_dataclass
+
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+ollama = lazy_import("ollama")
+
+
+@dataclass
+class FunFacts:
+    facts: typing.List[str]
+
+
+@dataclass
+class YoutubeQueries:
+    queries: typing.List[str]
+
+
+@dataclass
+class Keywords:
+    keywords: typing.List[str]
+
+
+@dataclass
+class VideoMatch:
+    indices: typing.List[int]
+
+
+@dataclass
+class ScriptSection:
+    visuals: str
+    narration: str
+    keywords: typing.List[str]
+
+
+@dataclass
+class FactAssets:
+    youtube_queries: typing.List[str]
+    sections: typing.List[ScriptSection]
+
+
+class StructuredOutputError(ValueError):
+    """The model answer doesn't match the requested result type."""
+
+
+def json_schema(result_type):
+    """
+    JSON schema of a dataclass made of str, int, float, bool, lists and
+    nested dataclasses.
+    """
+    scalars = {str: "string", int: "integer", float: "number",
+               bool: "boolean"}
+
+    def field_schema(field_type):
+        if typing.get_origin(field_type) in (list, typing.List):
+            (item_type,) = typing.get_args(field_type)
+            return {"type": "array", "items": field_schema(item_type)}
+        if is_dataclass(field_type):
+            return json_schema(field_type)
+        return {"type": scalars[field_type]}
+
+    hints = typing.get_type_hints(result_type)
+    return {
+        "type": "object",
+        "properties": {f.name: field_schema(hints[f.name])
+                       for f in fields(result_type)},
+        "required": [f.name for f in fields(result_type)],
+    }
+
+
+def from_json(data, result_type):
+    """Build result_type (and its nested dataclasses) from parsed JSON."""
+    if typing.get_origin(result_type) in (list, typing.List):
+        (item_type,) = typing.get_args(result_type)
+        return [from_json(item, item_type) for item in data]
+    if is_dataclass(result_type):
+        hints = typing.get_type_hints(result_type)
+        return result_type(**{f.name: from_json(data[f.name], hints[f.name])
+                              for f in fields(result_type)})
+    return data
+
+
+def json_items(text, field):
+    """
+    Complete items of the array field found so far in a partial JSON answer
+    (incremental parser for streamed answers).
+    """
+    match = re.search(rf'"{re.escape(field)}"\s*:\s*\[', text)
+    if match is None:
+        return []
+    decoder = json.JSONDecoder()
+    items = []
+    position = match.end()
+    while True:
+        position = re.compile(r"[\s,]*").match(text, position).end()
+        if position >= len(text) or text[position] == "]":
+            return items
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            # Item still being generated
+            return items
+        items.append(item)
+
+
+def first_word(text, words):
+    """
+    First word of a streamed answer, once complete (followed by another
+    character), if it's one of words.
+    :return: The word, "" for any other complete word, None if incomplete.
+    """
+    match = re.match(r"\s*([a-zA-Z]+)[^a-zA-Z]", text)
+    if match is None:
+        return None
+    word = match.group(1).lower()
+    return word if word in words else ""
+
+
+def read_stream(tokens, parse):
+    """
+    Accumulate streamed text until parse(text) returns something other
+    than None, then close the stream so the generation stops.
+    :param tokens: Iterable of text pieces.
+    :return: (parse result, or None if never reached, text read).
+    """
+    text = ""
+    result = None
+    try:
+        for token in tokens:
+            text += token
+            result = parse(text)
+            if result is not None:
+                break
+    finally:
+        close = getattr(tokens, "close", None)
+        if close is not None:
+            close()
+    return result, text
+
+
+def chat_tokens(chunks):
+    """Text pieces of a streamed ollama.chat answer."""
+    try:
+        for chunk in chunks:
+            yield chunk["message"]["content"]
+    finally:
+        # Closing the HTTP stream makes Ollama stop generating
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class StructuredLLM:
+    def __init__(self, client=ollama, options=None):
+        """
+        Ollama chat calls constrained to a JSON schema and parsed into
+        typed results in a single call.
+        :param client: Anything with ollama's chat() signature.
+        :param options: Default Ollama options (temperature 0 by default,
+                        so the same prompt gives the same result).
+        """
+        self.client = client
+        self.options = {"temperature": 0}
+        self.options.update(options or {})
+
+    def generate(self, model, prompt, result_type, options=None,
+                 constraints=None):
+        """
+        :param constraints: Extra JSON schema keywords per top level field,
+                            e.g. {"sections": {"minItems": 3, "maxItems": 3}}.
+        :return: An instance of the result_type dataclass.
+        :raises StructuredOutputError: If the answer doesn't fit the schema.
+        """
+        schema = json_schema(result_type)
+        for name, keywords in (constraints or {}).items():
+            schema["properties"][name].update(keywords)
+        content = (f"{prompt}\n\nAnswer only with JSON following this schema:"
+                   f"\n{json.dumps(schema)}")
+        response = self.client.chat(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            format=schema,
+            options=dict(self.options, **(options or {})),
+        )
+        return self.parse(response["message"]["content"], result_type)
+
+    def generate_items(self, model, prompt, result_type, field, nb_items,
+                       options=None):
+        """
+        Streamed generate() for a result whose field is a list, stopping
+        the generation as soon as nb_items items are complete.
+        :return: Up to nb_items items of field.
+        :raises StructuredOutputError: If fewer items come with an answer
+                                       that doesn't fit the schema.
+        """
+        schema = json_schema(result_type)
+        content = (f"{prompt}\n\nAnswer only with JSON following this schema:"
+                   f"\n{json.dumps(schema)}")
+        chunks = self.client.chat(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            format=schema,
+            options=dict(self.options, **(options or {})),
+            stream=True,
+        )
+
+        def enough_items(text):
+            items = json_items(text, field)
+            return items if len(items) >= nb_items else None
+
+        items, text = read_stream(chat_tokens(chunks), enough_items)
+        if items is None:
+            items = getattr(self.parse(text, result_type), field)
+        return items[:nb_items]
+
+    def parse(self, text, result_type):
+        try:
+            return from_json(json.loads(text), result_type)
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise StructuredOutputError(
+                f"Invalid {result_type.__name__} answer: {text[:200]!r}") from e
@@ -0,0 +1,49 @@
+import wave
+
+import numpy as np  # type: ignore
+
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+cv2 = lazy_import("cv2")
+
+
+def write_synthetic_video(path, width, height, seconds, fps=24,
+                          shot_seconds=None, seed=0, block=16):
+    """
+    Write an mp4 (mp4v) of random colour blocks scrolling across the frame,
+    busy enough to pass FramePreFilter. Same seed, same file.
+    :param shot_seconds: A new texture (a hard cut) every shot_seconds,
+                         a single shot when None.
+    :return: Number of frames written.
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                             (width, height))
+    nb_frames = int(round(seconds * fps))
+    shot_frames = (max(1, int(round(shot_seconds * fps)))
+                   if shot_seconds else nb_frames)
+    texture = None
+    for i in range(nb_frames):
+        if i % shot_frames == 0:
+            # Twice as wide as the frame so it can scroll
+            small = (rng.random((height // block + 1,
+                                 2 * width // block + 1, 3))
+                     * 255).astype(np.uint8)
+            texture = small.repeat(block, axis=0).repeat(block, axis=1)
+            texture = texture[:height]
+        offset = (i % shot_frames) * 4 % width
+        writer.write(np.ascontiguousarray(texture[:, offset:offset + width]))
+    writer.release()
+    return nb_frames
+
+
+def write_synthetic_wav(path, seconds, rate=22050, frequency=220.0):
+    """Write a mono 16 bit sine wave of seconds."""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (0.3 * np.sin(2 * np.pi * frequency * t) * 32767).astype("<i2")
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(samples.tobytes())
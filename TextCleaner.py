@@ -0,0 +1,110 @@
+import io
+import re
+from urllib.parse import urlparse
+
+# Web pollution found on most sites
+COMMON_NOISE = [
+    r"Subscribe", r"Newsletter", r"Sign up", r"Follow us",
+    r"Share this", r"Like us", r"Connect with us",
+    r"Sponsored", r"Advertisement", r"Promoted", r"Recommended",
+    r"You might also like", r"Popular", r"Trending",
+    r"Copyright ©", r"All rights reserved", r"Terms", r"Privacy Policy",
+    r"Cookie Policy", r"More from", r"View all", r"Load more",
+    r"See also", r"Related articles", r"Top stories",
+    r"Join our community", r"Skip to content"
+]
+
+# Site specific noise, applied to the pages of the domain and subdomains
+DOMAIN_NOISE = {
+    "britannica.com": [
+        r"Table of Contents", r"Quick Facts", r"Read Next", r"Discover",
+        r"Feedback", r"References & Edit History",
+        r"Share to social media", r"Copy Citation",
+        r"Ask the Chatbot a Question", r"External Websites",
+        r"Related Topics", r"Images",
+        r"verified", r"Last Updated:", r"Select Citation Style",
+        r"Show\xa0more", r"Print", r"Cite", r"More Actions",
+    ],
+}
+
+# Video scripts: [visual directions] and "narrated text"
+SCRIPT_DIRECTIONS = re.compile(r"\[.*?\]")
+SCRIPT_QUOTES = re.compile(r'"(.*?)"')
+
+
+class TextCleaner:
+    def __init__(self, domain_noise=None, min_line=3, dense_line=40,
+                 sentence_line=20):
+        """
+        Line by line cleaning of extracted page text: noise lines, short
+        lines (menus, buttons), repeated lines and low density lines are
+        dropped in a single pass.
+        Noise patterns are compiled once per domain and reused, lines are
+        processed as a stream and only the hashes of the lines already seen
+        are kept, so very large pages are cleaned in bounded memory.
+        :param domain_noise: Extra {domain: [patterns]}, added to
+                             DOMAIN_NOISE.
+        :param min_line: Lines up to this length are dropped.
+        :param dense_line: Lines longer than this are kept...
+        :param sentence_line: ...as well as lines longer than this with a
+                              period.
+        """
+        self.domain_noise = {domain: list(patterns)
+                             for domain, patterns in DOMAIN_NOISE.items()}
+        for domain, patterns in (domain_noise or {}).items():
+            self.domain_noise.setdefault(domain, []).extend(patterns)
+        self.min_line = min_line
+        self.dense_line = dense_line
+        self.sentence_line = sentence_line
+        self.compiled = {}
+
+    def domain(self, url):
+        """Entry of domain_noise matching the host of url, if any."""
+        host = (urlparse(url).hostname or "") if url else ""
+        for domain in self.domain_noise:
+            if host == domain or host.endswith(f".{domain}"):
+                return domain
+        return None
+
+    def noise_regex(self, url=None):
+        domain = self.domain(url)
+        if domain not in self.compiled:
+            patterns = COMMON_NOISE + self.domain_noise.get(domain, [])
+            self.compiled[domain] = re.compile("|".join(patterns),
+                                               re.IGNORECASE)
+        return self.compiled[domain]
+
+    def is_dense(self, line):
+        """Content paragraphs are long, or sentences."""
+        return len(line) > self.dense_line or (
+            len(line) > self.sentence_line and "." in line)
+
+    def clean_lines(self, lines, url=None):
+        """
+        :param lines: Iterable of text pieces, split on their line breaks.
+        :param url: Page url, selects the domain noise patterns.
+        :return: Generator of the kept lines, stripped.
+        """
+        noise_regex = self.noise_regex(url)
+        seen = set()
+        for piece in lines:
+            for line in piece.split("\n"):
+                if noise_regex.search(line):
+                    continue
+                if len(line.strip()) <= self.min_line:
+                    continue
+                key = hash(line)
+                if key in seen:
+                    continue
+                seen.add(key)
+                line = line.strip()
+                if self.is_dense(line):
+                    yield line
+
+    def clean(self, text, url=None):
+        """Cleaned text, read line by line from a string."""
+        return "\n".join(self.clean_lines(io.StringIO(text), url))
+
+    def script_sentences(self, script):
+        """Narrated text of a video script, without the directions."""
+        return SCRIPT_QUOTES.findall(SCRIPT_DIRECTIONS.sub("", script))
@@ -0,0 +1,106 @@
+import json
+from collections import namedtuple
+
+
+# One entry of the edit decision list: play clip from t_in to t_out
+# (seconds in the source) for the given script section.
+Cut = namedtuple("Cut", ["section", "clip", "t_in", "t_out"])
+
+
+class TimelinePlanner:
+    def __init__(self, fps=24, min_cut=0.25):
+        """
+        Plan exact clip in/out points so the video sections line up with
+        the narration. Works on durations only, no media is opened.
+        :param fps: Frame rate the section boundaries are snapped to.
+        :param min_cut: Shortest piece (seconds) worth cutting from a clip.
+        """
+        self.fps = fps
+        self.min_cut = min_cut
+
+    def section_durations(self, audio_duration, sections, timing="equal",
+                          durations=None):
+        """
+        Split the narration between the script sections.
+        :param timing: 'equal' (same length for every section),
+                       'sentences' (proportional to the words of each
+                       section) or 'audio' (measured durations).
+        :param durations: Measured duration of each section (timing='audio').
+        :raise ValueError: When durations doesn't have one duration per
+                           section, e.g. audio made for another script.
+        """
+        if timing == "audio" and durations:
+            if len(durations) != len(sections):
+                raise ValueError(f"{len(durations)} section durations for "
+                                 f"{len(sections)} sections")
+            weights = list(durations)
+        elif timing == "sentences":
+            weights = [max(1, len(s.split())) for s in sections]
+        else:
+            weights = [1] * len(sections)
+        total = sum(weights)
+
+        # Snap the cumulative boundaries to the frame grid so the rounding
+        # error never accumulates from one section to the next
+        boundaries = [0.0]
+        cumulative = 0
+        for w in weights[:-1]:
+            cumulative += w
+            t = audio_duration * cumulative / total
+            boundaries.append(round(t * self.fps) / self.fps)
+        boundaries.append(audio_duration)
+        return [end - start for start, end in zip(boundaries, boundaries[1:])]
+
+    def plan_section(self, section, duration, clips, clip_durations):
+        """
+        Fill one section with the given clips in turn, trimming the last
+        piece so the section lasts exactly duration seconds. A clip that
+        comes around again resumes where it stopped, then wraps to 0.
+        """
+        clips = [clip for clip in clips if clip_durations[clip] > 0]
+        if not clips:
+            raise ValueError(f"No usable clip for section {section}")
+        cuts = []
+        offsets = {clip: 0.0 for clip in clips}
+        remaining = duration
+        i = 0
+        while remaining > 1e-6:
+            clip = clips[i % len(clips)]
+            clip_duration = clip_durations[clip]
+            if clip_duration - offsets[clip] < self.min_cut:
+                offsets[clip] = 0.0
+            t_in = offsets[clip]
+            piece = min(clip_duration - t_in, remaining)
+            # Don't leave a sliver for the next piece, shorten this one
+            leftover = remaining - piece
+            if 0 < leftover < self.min_cut and piece - self.min_cut >= self.min_cut:
+                piece = remaining - self.min_cut
+            cuts.append(Cut(section, clip, round(t_in, 3),
+                            round(t_in + piece, 3)))
+            remaining -= piece
+            offsets[clip] = t_in + piece
+            i += 1
+        return cuts
+
+    def plan(self, section_clips, clip_durations, section_durations):
+        """
+        Build the edit decision list of one video.
+        :param section_clips: List (one item per section) of clip paths.
+        :param clip_durations: Dict clip path -> duration in seconds.
+        :param section_durations: Target duration of each section.
+        :return: List of Cut.
+        """
+        edl = []
+        for s_id, (clips, duration) in enumerate(zip(section_clips,
+                                                     section_durations)):
+            edl.extend(self.plan_section(s_id, duration, clips,
+                                         clip_durations))
+        return edl
+
+    def save_edl(self, edl, edl_path):
+        with open(edl_path, "w", encoding="utf-8") as f:
+            json.dump([list(cut) for cut in edl], f)
+
+    def load_edl(self, edl_path):
+        with open(edl_path, "r", encoding="utf-8") as f:
+            return [Cut(*cut) for cut in json.load(f)]
@@ -3,25 +3,114 @@ import shutil
 import json
 import random
 
-from moviepy.editor import VideoFileClip  # type: ignore
-from moviepy.editor import AudioFileClip  # type: ignore
-from moviepy.editor import concatenate_videoclips  # type: ignore
-from moviepy.editor import CompositeVideoClip  # type: ignore
-from moviepy.editor import ColorClip  # type: ignore
-from moviepy.editor import TextClip  # type: ignore
+from RenderScheduler import RenderScheduler
+from FileUtils import atomic_output
+from ClipReaderCache import ClipReaderCache
+from TimelinePlanner import TimelinePlanner
+from ProxyCache import ProxyCache
+from FrameHashIndex import FrameHashIndex
+from PipelineMetrics import metrics
+from Profiler import profiled
+from LazyImport import lazy_import
+
+# Imported on first use (moviepy.editor alone takes ~0.5 s), see LazyImport
+mpy = lazy_import("moviepy.editor")
+
+
+# Encoding settings of the final shorts and of the quick previews
+RENDER_PROFILES = {
+    "final": {"fps": 24, "bitrate": "8000k", "preset": "medium",
+              "audio_bitrate": "192k"},
+    "preview": {"fps": 12, "bitrate": "500k", "preset": "ultrafast",
+                "audio_bitrate": "64k"},
+}
+
+
+def is_short_format(video_size):
+    """True when video_size is the 9:16 frame change_format produces."""
+    width, height = video_size
+    return abs(height - width * 16 / 9) < 2
+
+
+def render_shorts(jobs):
+    """
+    Render a batch of shorts. Runs inside a RenderScheduler worker, so it
+    only relies on the job dicts and not on the VideoEditor state.
+    Each job carries its edit decision list (see TimelinePlanner); source
+    clips are opened once per batch through a ClipReaderCache.
+    job["sources"] optionally maps EDL clips to the files actually read
+    (the proxies of a preview render).
+    """
+    cache = ClipReaderCache()
+    for job in jobs:
+        sources = job.get("sources", {})
+        profile = job["profile"]
+        selected_clips = [
+            cache.cut(sources.get(cut.clip, cut.clip), cut.t_in, cut.t_out)
+            for cut in job["edl"]]
+        final_video = mpy.concatenate_videoclips(selected_clips,
+                                             method="chain")
+
+        # Get video dimensions
+        video_width, video_height = final_video.size
+        # 40px on a full resolution short, scaled down for proxies
+        bar_height = max(8, 2 * round(20 * video_width / job["reference_width"]))
+
+        # Create a sequence of subtitle clips (just black bars)
+        subtitle_clips = []
+
+        for start, end, _ in job["subtitles"]:
+            duration = end - start
+            # Create a black bar at the bottom as a subtitle background
+            subtitle_bg = (mpy.ColorClip(size=(video_width, bar_height),
+                                     color=(0, 0, 0))
+                           .set_opacity(0.8)  # Semi-transparent
+                           .set_position((0, video_height-bar_height))  # Bottom of the video
+                           .set_start(start)
+                           .set_duration(duration))
+            subtitle_clips.append(subtitle_bg)
+
+        # First, create the video with subtitle backgrounds
+        video_with_backgrounds = mpy.CompositeVideoClip([final_video] + subtitle_clips)
+
+        # Write next to the target and rename, so a crash never leaves
+        # a half written short behind
+        with atomic_output(job["output_path"]) as tmp_path:
+            video_with_backgrounds.write_videofile(
+                tmp_path,
+                audio=job["audio_path"],  # Pre-encoded narration, muxed as is
+                codec="libx264",
+                fps=profile["fps"],
+                preset=profile["preset"],
+                bitrate=profile["bitrate"],
+                threads=job["threads"])
+        for clip in subtitle_clips:
+            clip.close()
+    stats = cache.stats()
+    print(f"+--> {len(jobs)} videos rendered from {stats['open_readers']} "
+          f"clip readers ({stats['requests']} clip uses)")
+    print("|")
+    cache.close()
 
 
 class VideoEditor:
-    def __init__(self, base_path, json_path):
+    def __init__(self, base_path, json_path, cache_path=None):
+        """
+        :param cache_path: Folder of the frame hash index and preview
+                           proxies shared by several articles, base_path by
+                           default.
+        """
         # Sentence Splitter
         self.base_path = base_path
         self.json_file_path = json_path
         with open(self.json_file_path, 'r') as file:
             self.fun_facts = json.load(file)
         self.final_output_path = f"{self.base_path}/final_videos"
-        if os.path.exists(self.final_output_path):
-            shutil.rmtree(self.final_output_path)
-        os.makedirs(self.final_output_path)
+        self.preview_output_path = f"{self.base_path}/preview_videos"
+        # Clip hashes recorded by VideoProcessor
+        self.cache_path = cache_path or base_path
+        self.hash_index = FrameHashIndex(
+            f"{self.cache_path}/frame_hashes.json")
         print("+--> Ready to edit video ")
         print("|")
 
@@ -56,29 +145,56 @@ class VideoEditor:
             for f in os.listdir(audio_folder) if f.endswith(".wav")]
         print(audio_files)
         # Load the audio file
-        self.audio = AudioFileClip(audio_files[0])
+        self.audio = mpy.AudioFileClip(audio_files[0])
         self.audio_duration = self.audio.duration
         self.section_duration = self.audio_duration/len(self.sections)
 
-    def pick_random_clip(self, clips, nb_clips):
-        if nb_clips <= len(clips):
-            return random.sample(clips, nb_clips)
+    def pick_random_clip(self, clips, nb_clips, used_hashes=None):
+        """
+        Pick nb_clips clips, skipping clips that look like one already
+        picked or like one of used_hashes (clips of other sections).
+        Duplicates are only used when there are not enough distinct clips.
+        """
+        used_hashes = list(used_hashes or [])
+        candidates = random.sample(clips, len(clips))
+        unique = []
+        for clip in candidates:
+            clip_hash = self.hash_index.clip_hash(clip)
+            if not self.hash_index.is_duplicate(clip_hash, used_hashes):
+                unique.append(clip)
+                if clip_hash is not None:
+                    used_hashes.append(clip_hash)
+        if not unique:
+            unique = candidates
+        if nb_clips <= len(unique):
+            return unique[:nb_clips]
         else:
-            result = clips.copy()
+            result = unique.copy()
             while len(result) < nb_clips:
-                result.append(random.choice(clips))
+                result.append(random.choice(unique))
             return result
 
-    def video_2_shors(self):
-        for s_id, s in enumerate(self.sections):
-            clips = self.clips[str(s_id)]
-            for c_path in clips:
-                self.change_format(c_path)
-
+    def video_2_shors(self, mode="final"):
+        if mode == "preview":
+            # Preview renders read proxies, which are already 9:16, a final
+            # render_edl formats the clips it uses
+            return
+        self.format_clips(c_path for s_id, s in enumerate(self.sections)
+                          for c_path in self.clips[str(s_id)])
+
+    def format_clips(self, clip_paths):
+        """change_format the clips that aren't 9:16 yet."""
+        probe = ClipReaderCache()
+        with metrics.stage("format_clips"):
+            for c_path in dict.fromkeys(clip_paths):
+                if not is_short_format(probe.info(c_path)["video_size"]):
+                    self.change_format(c_path)
+
+    @profiled()
     def change_format(self, clip_path, bg_color=(0, 0, 0)):
 
         output_path = clip_path
-        clip = VideoFileClip(clip_path)
+        clip = mpy.VideoFileClip(clip_path)
         # Get dimensions
         original_width = clip.w
         original_height = clip.h
@@ -91,7 +207,7 @@ class VideoEditor:
             target_height += 1
 
         # Create background clip with the target dimensions
-        bg_clip = ColorClip(size=(original_width, target_height), 
+        bg_clip = mpy.ColorClip(size=(original_width, target_height), 
                             color=bg_color,
                             duration=clip.duration)
 
@@ -99,7 +215,7 @@ class VideoEditor:
         positioned_clip = clip.set_position("center")
 
         # Composite the clips
-        formatted_clip = CompositeVideoClip([bg_clip, positioned_clip])
+        formatted_clip = mpy.CompositeVideoClip([bg_clip, positioned_clip])
 
         formatted_clip.write_videofile(
             output_path,
@@ -137,74 +253,122 @@ class VideoEditor:
     def create_subtitle_clips(self, subtitles, video_size):
         subtitle_clips = []
         for start_time, end_time, text in subtitles:
-            subtitle_clip = TextClip("Your Subtitle", fontsize=24, color='white', font="DejaVu-Sans").set_duration(end_time - start_time).set_start(start_time)
+            subtitle_clip = mpy.TextClip("Your Subtitle", fontsize=24, color='white', font="DejaVu-Sans").set_duration(end_time - start_time).set_start(start_time)
             subtitle_clips.append(subtitle_clip)
         return subtitle_clips
 
-    def edit_video(self, fact_id, nb_videos, clip_lenght, num_subtitle_sections):
-
-        for s_id, s in enumerate(self.sections):
-            c = self.pick_random_clip(self.clips[str(s_id)], nb_videos)
-            self.clips[str(s_id)] = c
-
-        section_duration = self.audio_duration/len(self.sections)
-
-        self.generate_subtitle_text(fact_id, num_subtitle_sections)
-
-        for vid_id in range(nb_videos):
-            final_video_files = []
+    @profiled()
+    def edit_video(self, fact_id, nb_videos, num_subtitle_sections,
+                   max_workers=None, timing="equal", mode="final"):
+        """
+        Plan and render nb_videos shorts for the fact, the clips are cut to
+        the section durations (see TimelinePlanner).
+        :param timing: How the narration is split between the script
+                       sections, see TimelinePlanner.section_durations.
+        :param mode: 'final' or 'preview', see render_edl.
+        """
+
+        with metrics.stage("edit_plan", fact_id):
+            used_hashes = []
             for s_id, s in enumerate(self.sections):
-                current_lenght = 0
-                while current_lenght < section_duration:
-                    final_video_files.append(self.clips[str(s_id)][vid_id])
-                    current_lenght += clip_lenght
-            selected_clips = [
-                VideoFileClip(clip).without_audio()
-                for clip in final_video_files]
-            final_video = concatenate_videoclips(selected_clips,
-                                                 method="chain")
-            final_video = final_video.set_audio(self.audio)
-            
-
-            # Get video dimensions
-            video_width, video_height = final_video.size
-
-            # Create a sequence of subtitle clips (just black bars)
-            subtitle_clips = []
-
-            for start, end, _ in self.subtitles:
-                duration = end - start
-                # Create a black bar at the bottom as a subtitle background
-                bar_height = 40
-                subtitle_bg = (ColorClip(size=(video_width, bar_height), 
-                                        color=(0, 0, 0))
-                            .set_opacity(0.8)  # Semi-transparent
-                            .set_position((0, video_height-bar_height))  # Bottom of the video
-                            .set_start(start)
-                            .set_duration(duration))
-                subtitle_clips.append(subtitle_bg)
-
-            # First, create the video with subtitle backgrounds
-            video_with_backgrounds = CompositeVideoClip([final_video] + subtitle_clips)
-
-            # Process the original video file without creating an intermediate file
-            final_video_with_subtitles = video_with_backgrounds.copy()
-
-
- 
-
-            final_video_with_subtitles.write_videofile(
-                f"{self.final_output_path}/short_{vid_id}.mp4",
-                codec="libx264", 
-                audio_codec="aac",  # Explicitly set audio codec
-                fps=24,
-                bitrate="8000k",    # Set a reasonable bitrate for quality
-                audio_bitrate="192k")
-            for clip in subtitle_clips:
-                clip.close()
-            for clip in selected_clips:
-                clip.close()
-            final_video.close()
+                c = self.pick_random_clip(self.clips[str(s_id)], nb_videos,
+                                          used_hashes)
+                self.clips[str(s_id)] = c
+                used_hashes.extend(h for h in map(self.hash_index.clip_hash, c)
+                                   if h is not None)
+
+            fact = self.fun_facts["fun_facts"][fact_id]
+            planner = TimelinePlanner()
+            section_durations = planner.section_durations(
+                self.audio_duration, self.sections, timing,
+                fact.get("audio_section_durations"))
+            probe = ClipReaderCache()
+
+            self.generate_subtitle_text(fact_id, num_subtitle_sections)
+
+            edl_folder = self.recreate_edl_folder(fact_id)
+            with open(f"{edl_folder}/subtitles.json", "w", encoding="utf-8") as f:
+                json.dump(self.subtitles, f, ensure_ascii=False)
+            for vid_id in range(nb_videos):
+                section_clips = [[self.clips[str(s_id)][vid_id]]
+                                 for s_id, s in enumerate(self.sections)]
+                clip_durations = {
+                    clips[0]: probe.duration(clips[0])
+                    for clips in section_clips}
+                edl = planner.plan(section_clips, clip_durations,
+                                   section_durations)
+                planner.save_edl(edl, f"{edl_folder}/edl_{vid_id}.json")
+
+        self.render_edl(fact_id, mode, max_workers)
+
+    def recreate_edl_folder(self, fact_id):
+        edl_folder = f"{self.base_path}/{fact_id}/edl"
+        if os.path.exists(edl_folder):
+            shutil.rmtree(edl_folder)
+        os.makedirs(edl_folder)
+        return edl_folder
+
+    def render_edl(self, fact_id, mode="final", max_workers=None):
+        """
+        Render the shorts from the edit decisions saved by edit_video.
+        'preview' reads low resolution proxies and encodes fast and small
+        into preview_videos; 'final' renders the same cuts at full quality
+        into final_videos, without planning anything again (the clips
+        left unformatted by a preview are formatted to 9:16 first).
+        """
+        profile = RENDER_PROFILES[mode]
+        output_path = (self.preview_output_path if mode == "preview"
+                       else self.final_output_path)
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+        os.makedirs(output_path)
+
+        edl_folder = f"{self.base_path}/{fact_id}/edl"
+        planner = TimelinePlanner()
+        with open(f"{edl_folder}/subtitles.json", "r", encoding="utf-8") as f:
+            subtitles = json.load(f)
+        edl_files = sorted(f for f in os.listdir(edl_folder)
+                           if f.startswith("edl_"))
+
+        edls = {edl_file: planner.load_edl(f"{edl_folder}/{edl_file}")
+                for edl_file in edl_files}
+        if mode == "final":
+            # After a preview the clips may not be formatted yet
+            self.format_clips(cut.clip for edl in edls.values()
+                              for cut in edl)
+
+        scheduler = RenderScheduler(max_workers)
+        audio_path = scheduler.prepare_audio(self.audio, output_path,
+                                             profile["audio_bitrate"])
+        proxies = ProxyCache(self.cache_path) if mode == "preview" else None
+        probe = ClipReaderCache()
+        reference_width = None
+        jobs = []
+        for edl_file in edl_files:
+            vid_id = edl_file[len("edl_"):-len(".json")]
+            edl = edls[edl_file]
+            if reference_width is None:
+                # Width of the full resolution clips, 9:16 once formatted
+                reference_width = probe.info(edl[0].clip)["video_size"][0]
+            jobs.append({
+                "edl": edl,
+                "sources": (proxies.get_all(cut.clip for cut in edl)
+                            if proxies else {}),
+                "profile": profile,
+                "reference_width": reference_width,
+                "audio_path": audio_path,
+                "subtitles": subtitles,
+                "output_path": f"{output_path}/short_{vid_id}.mp4"
+            })
+        try:
+            with metrics.stage("render", fact_id, mode=mode,
+                               shorts=len(jobs)) as record:
+                scheduler.run(render_shorts, jobs)
+                record["bytes"] = sum(os.path.getsize(job["output_path"])
+                                      for job in jobs
+                                      if os.path.exists(job["output_path"]))
+        finally:
+            scheduler.cleanup(output_path)
 
 """
 
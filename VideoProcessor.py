@@ -1,18 +1,30 @@
 import os
-import cv2  # type: ignore
 import json
-import ollama  # type: ignore
 import base64
 import re
 import logging
 from contextlib import contextmanager
 import random
 import shutil
-import ffmpeg  # type: ignore
-import moondream as md  # type: ignore
-from PIL import Image  # type: ignore
 import numpy as np  # type: ignore
 
+from FrameHashIndex import FrameHashIndex
+from FramePreFilter import FramePreFilter
+from EmbeddingIndex import EmbeddingIndex
+from ClipLibrary import ClipLibrary
+from StructuredLLM import StructuredLLM, VideoMatch
+from StructuredLLM import read_stream, first_word, chat_tokens
+from ModelSessions import ModelSessions
+from Backends import make_backend
+from PipelineMetrics import metrics
+from Profiler import profiled
+from LazyImport import lazy_import
+
+# Imported on first use, see LazyImport
+cv2 = lazy_import("cv2")
+ffmpeg = lazy_import("ffmpeg")
+Image = lazy_import("PIL.Image")
+
 
 @contextmanager
 def suppress_logging():
@@ -23,9 +35,23 @@ def suppress_logging():
     finally:
         logging.disable(logging.NOTSET)  # Re-enable logging
 
+# Generation limits per stage. The vision prompts expect a single word, the
+# answer is streamed and dropped as soon as that word is complete.
+GENERATION_LIMITS = {
+    "match_sentences": {"num_predict": 64},
+    "llava": {"num_predict": 4, "stop": ["\n", ".", ","]},
+    "moondream": {"max_tokens": 4},
+}
+
 
 class VideoProcessor:
-    def __init__(self, base_path, json_path, prompt_file_path):
+    def __init__(self, base_path, json_path, prompt_file_path,
+                 prefilter_thresholds=None, library_path=None, sessions=None,
+                 generation_limits=None, backends=None, cache_path=None):
+        """
+        :param cache_path: Folder of the frame hash index and clip library
+                           shared by several articles, base_path by default.
+        """
         with open(prompt_file_path, 'r') as file:
             self.prompts = json.load(file)
         # Sentence Splitter
@@ -35,6 +61,31 @@ class VideoProcessor:
             self.fun_facts = json.load(file)
         self.sent_video_matches = []
         self.sentences = []
+        self.shots = {}
+        # One frame per shot segment of each video, kept by detect_shots
+        # for the segment frames of every section, see convert_videos2clips
+        self.shot_samples = {}
+        self.cache_path = cache_path or base_path
+        self.hash_index = FrameHashIndex(
+            f"{self.cache_path}/frame_hashes.json")
+        self.prefilter = FramePreFilter(prefilter_thresholds)
+        # Ollama calls, shared with the other stages when given
+        self.sessions = sessions or ModelSessions(
+            client=make_backend("llm", backends))
+        # "backends" entry of config.json, see Backends.make_backend
+        self.backends = backends
+        self.embeddings = EmbeddingIndex(client=self.sessions)
+        self.llm = StructuredLLM(self.sessions)
+        self.limits = {stage: dict(options, **(generation_limits or {}).get(
+            stage, {})) for stage, options in GENERATION_LIMITS.items()}
+        # Shared by all articles: in the cache folder, or else next to the
+        # article output folders
+        if library_path is None and cache_path is not None:
+            library_path = f"{cache_path}/clip_library"
+        elif library_path is None:
+            library_path = os.path.join(
+                os.path.dirname(os.path.abspath(base_path)), "clip_library")
+        self.library = ClipLibrary(library_path)
 
         print("+--> Ready to process videos")
         print("|")
@@ -46,7 +97,14 @@ class VideoProcessor:
         else:
             return prompt.format(**var_dict)
 
-    def match_sentence_video(self, fact_key, video_match):
+    def match_sentence_video(self, fact_key, video_match, method="embedding"):
+        """
+        Pick the video_match best videos for each script section.
+        :param method: 'embedding' ranks the video titles and descriptions
+                       by cosine similarity with the section (one batch of
+                       embeddings, deterministic), 'llm' asks llama3.2 to
+                       pick indices for every section.
+        """
         video_titles = self.fun_facts["fun_facts"][fact_key]["video_titles"]
         self.sent_video_matches = []
 
@@ -57,38 +115,13 @@ class VideoProcessor:
         if len(self.sentences) == 0:
             self.sentences = self.fun_facts["fun_facts"][fact_key]["video_script_sections"]
 
-        for sent_id, sentence in enumerate(self.sentences):
-            prompt = self.get_pompt("match_sentences",
-                                    {"sentence": sentence,
-                                     "video_titles": video_titles,
-                                     "video_match": video_match})
-            print(f"   +-- Script section: {sent_id}")
-            print("   |")
-            with suppress_logging():
-                response = ollama.chat(
-                    model="llama3.2:3B",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": (
-                                prompt),
-                        }
-                    ],
-                )
-            print("   |")
-            # Extract the indices from the response
-            response_text = response["message"]["content"]
-            match = re.search(r"\[([\d,\s]+)\]", response_text)
-            if match:
-                indices_str = match.group(1)
-                indices = [int(idx) for idx in indices_str.split(",")]
-                print(f"   +-- Extracted indices: {indices}")
-                print("   |")
+        with metrics.stage("match_videos", fact_key, method=method):
+            if method == "embedding":
+                matches = self.match_sentences_embedding(fact_key, video_match)
             else:
-                indices = random.sample(range(len(video_titles)), video_match)
-                print(f"   +-- No indices found in the response. Random selection: {indices}")   # noqa: E501
-                print("   |")
-            self.sent_video_matches.append((sentence, indices))
+                matches = self.match_sentences_llm(video_titles, video_match)
+            for sentence, indices in zip(self.sentences, matches):
+                self.sent_video_matches.append((sentence, indices))
         video_id = {}
         for s_id in range(len(self.sent_video_matches)):
             vid_idx = self.sent_video_matches[s_id][1]
@@ -104,100 +137,403 @@ class VideoProcessor:
         print("+--+")
         print("|")
 
+    def match_sentences_embedding(self, fact_key, video_match):
+        fact = self.fun_facts["fun_facts"][fact_key]
+        descriptions = fact.get("video_descriptions",
+                                [""] * len(fact["video_titles"]))
+        documents = [
+            f"{re.sub(r'^[0-9]+ - ', '', title)}\n{description or ''}"
+            for title, description in zip(fact["video_titles"], descriptions)]
+        indices, similarities = self.embeddings.top_k(self.sentences,
+                                                      documents, video_match)
+        matches = []
+        for sent_id, (idx, sim) in enumerate(zip(indices, similarities)):
+            print(f"   +-- Script section: {sent_id}")
+            print(f"   +-- Closest videos: {idx.tolist()} "
+                  f"(similarity {np.round(sim, 2).tolist()})")
+            print("   |")
+            matches.append([int(i) for i in idx])
+        return matches
+
+    def match_sentences_llm(self, video_titles, video_match):
+        matches = []
+        for sent_id, sentence in enumerate(self.sentences):
+            prompt = self.get_pompt("match_sentences",
+                                    {"sentence": sentence,
+                                     "video_titles": video_titles,
+                                     "video_match": video_match})
+            print(f"   +-- Script section: {sent_id}")
+            print("   |")
+            with suppress_logging():
+                match = self.llm.generate("llama3.2:3B", prompt, VideoMatch,
+                                          self.limits["match_sentences"])
+            print("   |")
+            # Keep the valid indices, in the order given by the model
+            indices = [idx for idx in dict.fromkeys(match.indices)
+                       if 0 <= idx < len(video_titles)][:video_match]
+            print(f"   +-- Extracted indices: {indices}")
+            print("   |")
+            matches.append(indices)
+        return matches
+
     def reduce_resolution(self, frame, factor):
         height, width = frame.shape[:2]
         new_width = int(width * factor)
         new_height = int(height * factor)
         return cv2.resize(frame, (new_width, new_height))
 
-    def extract_center_frames(self, fact_key, video_path, interval_seconds, factor):
-        # Open the video file
-        # nvideo_path = f"{self.base_path}/{fact_key}/downloads/{video_name}"
+    def detect_shots(self, video_path, max_shot_seconds, analysis_fps=4,
+                     min_shot_seconds=1.0, min_cut_diff=12.0,
+                     sample_factor=None):
+        """
+        Split the video into shots in a single decode pass.
+        Analysed frames are reduced to 32x18 grayscale thumbnails and a cut
+        is placed where the difference between two consecutive thumbnails
+        stands out from the typical difference of the video.
+        :param max_shot_seconds: Longer shots are split in equal parts.
+        :param analysis_fps: Number of frames per second compared.
+        :param min_shot_seconds: Shorter shots are merged with the previous.
+        :param min_cut_diff: Smallest mean pixel difference (0-255) of a cut.
+        :param sample_factor: Also keep the analysed frame closest to the
+                              middle of each segment, reduced by this factor
+                              (JPEG encoded), in shot_samples, so the
+                              segment frames don't need another decode.
+        :return: List of (start_frame, end_frame) segments.
+        """
+        kept_factor = self.shot_samples.get(video_path, (None, None))[0]
+        if video_path in self.shots and sample_factor in (None, kept_factor):
+            return self.shots[video_path]
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             print("Error: Could not open video.")
-            print(f"----> extract_center_frames ----> {video_path}")
+            print(f"----> detect_shots ----> {video_path}")
             return []
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        step = max(1, int(round(fps / analysis_fps)))
+
+        thumbnails = []
+        thumbnail_idx = []
+        samples = {}
+        frame_idx = 0
+        while True:
+            if frame_idx % step == 0:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                thumbnails.append(cv2.resize(gray, (32, 18),
+                                             interpolation=cv2.INTER_AREA))
+                thumbnail_idx.append(frame_idx)
+                if sample_factor is not None:
+                    samples[frame_idx] = cv2.imencode(
+                        ".jpg", self.reduce_resolution(frame, sample_factor))[1]
+            elif not cap.grab():
+                break
+            frame_idx += 1
+        cap.release()
+        total_frames = frame_idx
+        metrics.add("frames_decoded", len(thumbnails))
+
+        cuts = []
+        if len(thumbnails) > 1:
+            thumbs = np.stack(thumbnails).astype(np.float32)
+            diffs = np.abs(np.diff(thumbs, axis=0)).mean(axis=(1, 2))
+            median = np.median(diffs)
+            mad = np.median(np.abs(diffs - median))
+            threshold = max(min_cut_diff, median + 6 * mad)
+            cut_ids = np.nonzero(diffs > threshold)[0] + 1
+            cuts = [thumbnail_idx[i] for i in cut_ids]
+
+        # Drop cuts that would create too short shots
+        min_frames = int(fps * min_shot_seconds)
+        boundaries = [0]
+        for cut in cuts:
+            if cut - boundaries[-1] >= min_frames:
+                boundaries.append(cut)
+        if total_frames - boundaries[-1] < min_frames and len(boundaries) > 1:
+            boundaries.pop()
+        boundaries.append(total_frames)
+
+        # Split long shots so each segment still gets its own sample
+        max_frames = max(1, int(fps * max_shot_seconds))
+        segments = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            nb_parts = int(np.ceil((end - start) / max_frames))
+            part = (end - start) / max(1, nb_parts)
+            for i in range(nb_parts):
+                segments.append((start + int(i * part),
+                                 start + int((i + 1) * part)))
+        print(f"{len(cuts)} shot cuts, {len(segments)} segments")
+        self.shots[video_path] = segments
+        if sample_factor is not None:
+            # Only the frame of each segment, the others were temporary
+            kept = {}
+            for start, end in segments:
+                middle = (start + end) // 2
+                sampled = [i for i in samples if start <= i < end]
+                if sampled:
+                    best = min(sampled, key=lambda i: abs(i - middle))
+                    kept[best] = samples[best]
+            self.shot_samples[video_path] = (sample_factor, kept)
+        return segments
+
+    def open_segments(self, video_path, interval_seconds, segmentation,
+                      factor=None):
+        """
+        Open the video and split it into segments.
+        :param segmentation: 'fixed' for windows of interval_seconds,
+                             'shots' for the shots found by detect_shots
+                             (split to at most interval_seconds).
+        :param factor: Resolution of the segment frames, the 'shots' pass
+                       keeps its frames at this resolution.
+        :return: (capture, segments, total_frames, fps, samples) or None,
+                 samples are the frames kept by detect_shots (or None).
+        """
+        samples = None
+        if segmentation == "shots":
+            segments = self.detect_shots(video_path, interval_seconds,
+                                         sample_factor=factor)
+            if not segments:
+                return None
+            samples = self.shot_samples.get(video_path, (None, None))[1]
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print("Error: Could not open video.")
+            print(f"----> open_segments ----> {video_path}")
+            return None
 
         # Get video properties
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-        # Calculate the frame interval (number of frames in `interval_seconds`)
-        frame_interval = int(fps * interval_seconds)
-
-        # Create output directory if it doesn't exist
-        output_dir = f"{self.base_path}/{fact_key}/frames/{video_path[-10:-4]}"
-        if os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
-        os.makedirs(output_dir)
-
-        frames_info = []
-        current_frame_idx = 0
-
-        while current_frame_idx < total_frames:
-            # Calculate the middle frame of the current 10-second window
-            middle_frame_idx = current_frame_idx + frame_interval // 2
-
-            # Ensure the middle frame does not exceed total number of frames
-            if middle_frame_idx >= total_frames:
-                break
-
+        if segmentation == "shots":
+            total_frames = segments[-1][1]
+        else:
+            # Calculate the frame interval (number of frames in `interval_seconds`)
+            frame_interval = int(fps * interval_seconds)
+            segments = [(start, start + frame_interval)
+                        for start in range(0, total_frames, frame_interval)]
+        return cap, segments, total_frames, fps, samples
+
+    def save_segment_frame(self, cap, output_dir, segment, factor, total_frames,
+                           samples=None):
+        """
+        Save the middle frame of a segment.
+        :param samples: Frames kept by detect_shots, the one closest to the
+                        middle of the segment is used instead of seeking.
+        :return: The frame info, or None if the frame can't be read.
+        """
+        clip_start, clip_end = segment
+        # Calculate the middle frame of the current segment
+        middle_frame_idx = (clip_start + clip_end) // 2
+
+        # Ensure the middle frame does not exceed total number of frames
+        if middle_frame_idx >= total_frames:
+            return None
+
+        sampled = [i for i in samples or () if clip_start <= i < clip_end]
+        if sampled:
+            middle_frame_idx = min(sampled,
+                                   key=lambda i: abs(i - middle_frame_idx))
+            frame = cv2.imdecode(samples[middle_frame_idx], cv2.IMREAD_COLOR)
+        else:
             # Set the video capture to the middle frame
             cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame_idx)
             ret, frame = cap.read()
-            frame = self.reduce_resolution(frame, factor)
 
             if not ret:
-                break
+                return None
+            metrics.add("frames_decoded")
+            frame = self.reduce_resolution(frame, factor)
 
-            # Save the frame as an image
-            frame_filename = f"frame_{middle_frame_idx}.jpg"
-            frame_path = os.path.join(output_dir, frame_filename)
+        # Save the frame as an image
+        frame_filename = f"frame_{middle_frame_idx}.jpg"
+        frame_path = os.path.join(output_dir, frame_filename)
+        if sampled:
+            with open(frame_path, "wb") as file:
+                file.write(samples[middle_frame_idx].tobytes())
+        else:
             cv2.imwrite(frame_path, frame)
 
-            # Append frame info to the list
-            frames_info.append({
-                "frame_path": frame_path,
-                "clip_start": current_frame_idx,
-                "clip_end": current_frame_idx + frame_interval
-            })
+        return {
+            "frame_path": frame_path,
+            "phash": self.hash_index.dhash(frame),
+            "rejected": self.prefilter.check(frame),
+            "clip_start": clip_start,
+            "clip_end": clip_end
+        }
+
+    @profiled()
+    def extract_center_frames(self, fact_key, video_path, interval_seconds, factor,
+                              segmentation="fixed"):
+        """
+        Save the middle frame of each segment of the video.
+        :param segmentation: See open_segments.
+        """
+        # nvideo_path = f"{self.base_path}/{fact_key}/downloads/{video_name}"
+        opened = self.open_segments(video_path, interval_seconds, segmentation,
+                                    factor)
+        if opened is None:
+            return []
+        cap, segments, total_frames, fps, samples = opened
 
-            # Move to the next 10-second window
-            current_frame_idx += frame_interval
+        # Create output directory if it doesn't exist
+        output_dir = f"{self.base_path}/{fact_key}/frames/{video_path[-10:-4]}"
+        self.recreate_folder(output_dir)
+
+        frames_info = []
+        for segment in segments:
+            f_i = self.save_segment_frame(cap, output_dir, segment, factor,
+                                          total_frames, samples)
+            if f_i is None:
+                break
+            # Append frame info to the list
+            frames_info.append(f_i)
 
         # Release the video capture object
         cap.release()
         self.frames_info = frames_info
+        self.segments = [(f_i["clip_start"], f_i["clip_end"])
+                         for f_i in frames_info]
         self.total_frames = total_frames
         self.fps = fps
 
-    def evaluate_frame_with_moondream(self, model,  prompt):
-
-        # Process frames and get responses
-        responses = []
-        for f_i in self.frames_info:
-            image = Image.open(f_i["frame_path"])
-            encoded_image = model.encode_image(image)
-            answer = model.query(encoded_image,
-                                 prompt)["answer"].lower().strip()
+    def score_frame_with_moondream(self, model, frame_path, prompt):
+        image = Image.open(frame_path)
+        encoded_image = model.encode_image(image)
+        tokens = model.query(encoded_image, prompt, stream=True,
+                             settings=self.limits["moondream"])["answer"]
+        word, answer = read_stream(tokens,
+                                   lambda t: first_word(t, ("yes", "no")))
+        answer = word or answer.lower().strip()
+        print(answer)
+        if answer == "yes":
+            return 1
+        elif answer == "no":
+            return 0
+        else:
+            print("answer not formatted correctly")
             print(answer)
-            if answer == "yes":
-                responses.append(1)
-            elif answer == "no":
-                responses.append(0)
-            else:
-                print("answer not formatted correctly")
-                print(answer)
-                responses.append(0)
+            return 0
+
+    def score_frame(self, model, f_i, prompt):
+        """
+        Score one sampled frame, skipping the model for pre-filtered frames
+        and reusing the score of near-duplicate frames seen before
+        (re-uploads, compilations).
+        :return: (score, True if the vision model was called)
+        """
+        if f_i["rejected"]:
+            # Black, blurred or title card frame: not worth a model call
+            return 0, False
+        score = self.hash_index.lookup_score(f_i["phash"], prompt)
+        if score is not None:
+            return score, False
+        score = self.score_frame_with_moondream(model, f_i["frame_path"],
+                                                prompt)
+        self.hash_index.add_score(f_i["phash"], prompt, score)
+        return score, True
+
+    def set_response_array(self, frames_info, responses):
         # Generate the response array
         response_array = np.zeros(self.total_frames, dtype=int)
-        for i, f_i in enumerate(self.frames_info):
+        for i, f_i in enumerate(frames_info):
             start = f_i["clip_start"]
             end = f_i["clip_end"]
             response_array[start:end] = responses[i]
         self.response_array = response_array
 
+    @profiled()
+    def evaluate_frame_with_moondream(self, model,  prompt):
+
+        # Process frames and get responses
+        responses = []
+        calls = 0
+        for f_i in self.frames_info:
+            score, called = self.score_frame(model, f_i, prompt)
+            responses.append(score)
+            calls += called
+        print(f"{calls} model calls for {len(self.frames_info)} frames")
+        self.set_response_array(self.frames_info, responses)
+
+    def evaluate_frames_adaptive(self, fact_key, video_path, model, prompt,
+                                 interval_seconds, factor, segmentation="fixed",
+                                 max_calls=20, coarse_step=4):
+        """
+        Coarse to fine alternative to extract_center_frames followed by
+        evaluate_frame_with_moondream. One segment out of coarse_step is
+        scored first, then unscored segments next to a relevant one are
+        scored, growing around relevant parts (and finding where the
+        scores change) until max_calls vision model calls are spent.
+        Unscored segments are relevant only if the closest scored
+        segments on both sides are. Sets the same frames_info, segments
+        and response_array as the uniform path.
+        """
+        opened = self.open_segments(video_path, interval_seconds, segmentation,
+                                    factor)
+        if opened is None:
+            self.frames_info, self.segments = [], []
+            return
+        cap, segments, total_frames, fps, samples = opened
+        output_dir = f"{self.base_path}/{fact_key}/frames/{video_path[-10:-4]}"
+        self.recreate_folder(output_dir)
+
+        nb_segments = len(segments)
+        scores = [None] * nb_segments
+        frames = [None] * nb_segments
+        calls = 0
+
+        def sample(i):
+            nonlocal calls
+            f_i = self.save_segment_frame(cap, output_dir, segments[i],
+                                          factor, total_frames, samples)
+            if f_i is None:
+                scores[i] = 0
+                return
+            scores[i], called = self.score_frame(model, f_i, prompt)
+            frames[i] = f_i
+            calls += called
+
+        coarse = list(range(0, nb_segments, coarse_step))
+        if nb_segments and coarse[-1] != nb_segments - 1:
+            coarse.append(nb_segments - 1)
+        for i in coarse:
+            if calls >= max_calls:
+                break
+            sample(i)
+
+        while calls < max_calls:
+            candidates = [
+                i for i in range(nb_segments) if scores[i] is None and (
+                    (i > 0 and scores[i - 1] == 1) or
+                    (i < nb_segments - 1 and scores[i + 1] == 1))]
+            if not candidates:
+                break
+            for i in candidates:
+                if calls >= max_calls:
+                    break
+                sample(i)
+        cap.release()
+
+        # Fill the segments left unscored from their scored neighbours
+        scored = [i for i in range(nb_segments) if scores[i] is not None]
+        for i in range(nb_segments):
+            if scores[i] is None:
+                left = [j for j in scored if j < i]
+                right = [j for j in scored if j > i]
+                scores[i] = int(bool(left) and bool(right) and
+                                scores[left[-1]] == 1 and
+                                scores[right[0]] == 1)
+        print(f"{calls} model calls, {len(scored)}/{nb_segments} segments sampled")
+
+        self.frames_info = [f_i for f_i in frames if f_i is not None]
+        self.segments = segments
+        self.total_frames = total_frames
+        self.fps = fps
+        self.set_response_array(
+            [{"clip_start": start, "clip_end": end} for start, end in segments],
+            scores)
+
     def apply_color_filter(self, frame, color):
         """
         Apply a red or green filter to the frame, setting other channels to 0.
@@ -222,6 +558,7 @@ class VideoProcessor:
 
         return filtered_frame
 
+    @profiled()
     def process_video_with_filters(self, fact_key, video_path):
         """
         Process the video and apply color filters based on the response array.
@@ -257,6 +594,7 @@ class VideoProcessor:
             ret, frame = cap.read()
             if not ret:
                 break
+            metrics.add("frames_decoded")
 
             # Apply the corresponding color filter based on the response array
             if frame_idx < len(self.response_array):
@@ -274,9 +612,16 @@ class VideoProcessor:
         cap.release()
         out.release()
 
-    def extract_good_clips(self, sect, fact_key, video_path, clips_length):
+    @profiled()
+    def extract_good_clips(self, sect, fact_key, video_path, clips_length,
+                           segments=None, library_entry=None):
         """
         Extract and save only the sections of the video where more than half the frames are labeled as 'good'.
+        :param segments: (start_frame, end_frame) sections to consider,
+                         e.g. shots. Defaults to windows of clips_length.
+        :param library_entry: {"vector": ..., "meta": {...}} describing what
+                              the clips were selected for; when given, each
+                              clip is also added to the clip library.
         :param video_path: Path to the input video.
         :param output_clips_dir: Directory to save the good clips.
         :param response_array: Array of 1s (good) and 0s (bad) for each frame.
@@ -306,10 +651,19 @@ class VideoProcessor:
             shutil.rmtree(output_video_folder)
         os.makedirs(output_video_folder)
 
-        # Process each clip-length section of the video
+        if segments is None:
+            segments = [(start, start + frames_per_clip)
+                        for start in range(0, total_frames, frames_per_clip)]
+
+        # Hash of the frame sampled in each segment, to spot duplicate clips
+        segment_hashes = {f_i["clip_start"]: f_i["phash"]
+                          for f_i in self.frames_info}
+
+        # Process each section of the video, cut to at most clips_length
         clip_idx = 0
-        for start_frame in range(0, total_frames, frames_per_clip):
-            end_frame = min(start_frame + frames_per_clip, total_frames)
+        for start_frame, end_frame in segments:
+            end_frame = min(end_frame, start_frame + frames_per_clip,
+                            total_frames)
             section = self.response_array[start_frame:end_frame]
             # Check if more than half of the frames in the section are labeled as 'good'
             if np.sum(section) > (len(section) / 2):
@@ -324,15 +678,34 @@ class VideoProcessor:
                     ret, frame = cap.read()
                     if not ret:
                         break
+                    metrics.add("frames_decoded")
                     out.write(frame)
                 out.release()
+                if start_frame in segment_hashes:
+                    self.hash_index.add_clip(clip_path,
+                                             segment_hashes[start_frame])
+                if library_entry is not None:
+                    self.library.insert(
+                        library_entry["vector"], clip_path,
+                        dict(library_entry["meta"],
+                             source_video=video_path,
+                             start=round(start_frame / self.fps, 2),
+                             end=round(end_frame / self.fps, 2)))
                 clip_idx += 1
         # Release the video capture object
         cap.release()
 
-    def convert_videos2clips(self, fact_id, interval_seconds, factor, model_path):
+    def convert_videos2clips(self, fact_id, interval_seconds, factor, model_path,
+                             segmentation="shots", sampling="uniform",
+                             max_calls=20):
+        """
+        Cut the relevant clips of every downloaded video for each section.
+        :param sampling: 'uniform' scores every segment, 'adaptive' scores
+                         a coarse grid and refines around relevant parts
+                         with at most max_calls model calls per video.
+        """
         # Initialize the model
-        model = md.vl(model=model_path)
+        model = make_backend("vision", self.backends, model_path=model_path)
         if len(self.sentences) == 0:
             self.sentences = self.fun_facts["fun_facts"][fact_id]["video_script_sections"]
 
@@ -346,19 +719,70 @@ class VideoProcessor:
             print(" ")
             ky = keywords[str(i)]
             prompt = self.get_pompt("moondreamer_prompt", {"keywords": ky})
+            library_entry = {
+                "vector": self.section_vector(i, ky),
+                "meta": {"fact": fact_id, "section": self.sentences[i],
+                         "keywords": [k.strip() for k in ky]}}
             # for vid_id in video_ids[str(i)]:
             for video_name in video_paths:
                 # video_name = video_paths[vid_id]
                 print(video_name)
-                print("extracting frames")
-                self.extract_center_frames(fact_id, video_name,
-                                           interval_seconds, factor)
-                print("evaluate with moondream")
-                self.evaluate_frame_with_moondream(model,  prompt)
-                print("extract good clips")
-                self.process_video_with_filters(fact_id, video_name)
-                self.extract_good_clips(str(i), fact_id, video_name,
-                                        interval_seconds)
+                with metrics.stage("video2clips", fact_id, video=video_name, section=i):
+                    if sampling == "adaptive":
+                        print("evaluate with moondream (adaptive)")
+                        self.evaluate_frames_adaptive(fact_id, video_name, model,
+                                                      prompt, interval_seconds,
+                                                      factor, segmentation,
+                                                      max_calls)
+                    else:
+                        print("extracting frames")
+                        self.extract_center_frames(fact_id, video_name,
+                                                   interval_seconds, factor,
+                                                   segmentation)
+                        print("evaluate with moondream")
+                        self.evaluate_frame_with_moondream(model,  prompt)
+                    print("extract good clips")
+                    self.process_video_with_filters(fact_id, video_name)
+                    self.extract_good_clips(str(i), fact_id, video_name,
+                                            interval_seconds, self.segments,
+                                            library_entry)
+        # Only needed while the sections go through the same videos
+        self.shot_samples = {}
+        self.hash_index.save()
+        self.prefilter.report()
+
+    def section_vector(self, sect_id, keywords):
+        """Embedding of a script section and its keywords."""
+        text = f"{self.sentences[sect_id]}\n{', '.join(k.strip() for k in keywords)}"
+        return self.embeddings.embed([text])[0]
+
+    def reuse_library_clips(self, fact_id, min_clips=2, min_similarity=0.8):
+        """
+        Copy the library clips closest to each script section into
+        clips/{section}/library, before searching and downloading videos.
+        :return: Number of sections with at least min_clips clips.
+        """
+        if len(self.sentences) == 0:
+            self.sentences = self.fun_facts["fun_facts"][fact_id]["video_script_sections"]
+        keywords = self.fun_facts["fun_facts"][fact_id]["keywords_sections"]
+        print("+--> Looking for footage in the clip library")
+        print("|")
+        with metrics.stage("library_reuse", fact_id):
+            covered = 0
+            for i, _ in enumerate(self.sentences):
+                matches = self.library.search(
+                    self.section_vector(i, keywords[str(i)]),
+                    k=min_clips, min_similarity=min_similarity)
+                folder = f"{self.base_path}/{fact_id}/clips/{i}/library"
+                self.recreate_folder(folder)
+                for clip_idx, (similarity, meta) in enumerate(matches):
+                    shutil.copyfile(meta["clip_path"],
+                                    f"{folder}/clip_{clip_idx}.mp4")
+                metrics.add("cache_hits", len(matches))
+                print(f"   +-- Section {i}: {len(matches)} clips reused")
+                covered += len(matches) >= min_clips
+        print("|")
+        return covered
 
     def evaluate_frame_with_llava(self, frame, prompt):
         print("------------------> evaluate frame")
@@ -374,19 +798,22 @@ class VideoProcessor:
         try:
             # Make the API call to Ollama with base64 encoded image
             with suppress_logging():
-                res = ollama.chat(
+                chunks = self.sessions.chat(
                     model="llava",
                     messages=[{
                         'role': 'user',
                         'content': prompt,
                         'images': [image_data]
-                    }]
+                    }],
+                    options=self.limits["llava"],
+                    stream=True
                 )
-                print(" ")
-                print(res)
-                print(" ")
+                # Stop the generation once the first word is complete
+                word, response = read_stream(
+                    chat_tokens(chunks),
+                    lambda t: first_word(t, ("good", "bad")))
                 # Get the response and clean it
-                response = res['message']['content'].lower().strip()
+                response = word or response.lower().strip()
                 print(response)
                 # Convert to boolean based on exact match
                 if response == 'good':
@@ -431,6 +858,7 @@ class VideoProcessor:
         cap.set(cv2.CAP_PROP_POS_FRAMES, random_frame_index)
         # Read the frame
         ret, frame = cap.read()
+        metrics.add("frames_decoded")
         timestamp = random_frame_index // fps
         frame_path = f"{frames_folder_path}/sent_{sent_id}_clip_{clip_id}_frame_{timestamp}.png"   # noqa: E501
         frame = self.reduce_resolution(frame, factor)
@@ -456,57 +884,60 @@ class VideoProcessor:
                 self.sent_video_matches.append((sentence, indices))
         if len(self.sentences) == 0:
             self.sentences = self.fun_facts["fun_facts"][fact_key]["video_script_sections"]
-        for sent, vid_ids in self.sent_video_matches:
-            print(f"   +--> Extracting for section: {sent_id}")
-            print("   |")
-            print("   +--+")
-            print("      |")
-            for vid_id in vid_ids:
-                print(f"      +--> Extracting from video id: {vid_id}")
+        with metrics.stage("extract_clips", fact_key):
+            for sent, vid_ids in self.sent_video_matches:
+                print(f"   +--> Extracting for section: {sent_id}")
+                print("   |")
+                print("   +--+")
                 print("      |")
-                video_path = video_paths[vid_id]
-                clip_found = False
-                for t in range(max_nb_trials):
-                    timestamp, frame = self.get_frame(video_path, factor,
-                                                      frames_folder_path,
-                                                      sent_id,
-                                                      clip_id)
-                    print("      +--+")
-                    print("         |")
-                    print(f"         +-- Evaluating frame: {timestamp}")
-                    print("         |")
-
-                    prompt = self.get_pompt("eval_frame",
-                                            {"sent": self.sentences[int(sent)]})
-                    print(prompt)
-                    is_good_fit = self.evaluate_frame_with_llava(frame, prompt)
-                    print("         |")
-                    if is_good_fit:
-                        print("         +-- Good fit, extracting clip.")
+                for vid_id in vid_ids:
+                    print(f"      +--> Extracting from video id: {vid_id}")
+                    print("      |")
+                    video_path = video_paths[vid_id]
+                    clip_found = False
+                    for t in range(max_nb_trials):
+                        timestamp, frame = self.get_frame(video_path, factor,
+                                                          frames_folder_path,
+                                                          sent_id,
+                                                          clip_id)
+                        print("      +--+")
                         print("         |")
-                        clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}.mp4"  # noqa: E501
-                        self.cut_video_clip(video_path, timestamp, clip_path, offset)   # noqa: E501
-                        clip_id += 1
-                        clip_found = True
-                    else:
-                        print("         +-- Bad fit, trying again.")
+                        print(f"         +-- Evaluating frame: {timestamp}")
                         print("         |")
-                if not clip_found:
-                    print(f"         +-- good fit not found after {max_nb_trials} trials. Getting a random clip")  # noqa: E501
-                    print("         |")
-                    timestamp, frame = self.get_frame(video_path, factor,
-                                                      frames_folder_path,
-                                                      sent_id,
-                                                      clip_id)
-                    clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}_rand.mp4"  # noqa: E501
-                    self.cut_video_clip(video_path, timestamp, clip_path, offset)  # noqa: E501
-                    print("      +--+")
-                    print("      |")
-            sent_id += 1
-            print("   +--+")
-            print("   |")
+
+                        prompt = self.get_pompt("eval_frame",
+                                                {"sent": self.sentences[int(sent)]})
+                        print(prompt)
+                        is_good_fit = (self.prefilter.check(frame) is None and
+                                       self.evaluate_frame_with_llava(frame, prompt))
+                        print("         |")
+                        if is_good_fit:
+                            print("         +-- Good fit, extracting clip.")
+                            print("         |")
+                            clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}.mp4"  # noqa: E501
+                            self.cut_video_clip(video_path, timestamp, clip_path, offset)   # noqa: E501
+                            clip_id += 1
+                            clip_found = True
+                        else:
+                            print("         +-- Bad fit, trying again.")
+                            print("         |")
+                    if not clip_found:
+                        print(f"         +-- good fit not found after {max_nb_trials} trials. Getting a random clip")  # noqa: E501
+                        print("         |")
+                        timestamp, frame = self.get_frame(video_path, factor,
+                                                          frames_folder_path,
+                                                          sent_id,
+                                                          clip_id)
+                        clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}_rand.mp4"  # noqa: E501
+                        self.cut_video_clip(video_path, timestamp, clip_path, offset)  # noqa: E501
+                        print("      +--+")
+                        print("      |")
+                sent_id += 1
+                print("   +--+")
+                print("   |")
         print("+--+")
         print("|")
+        self.prefilter.report()
 
     def extract_clips(self, fact_key, factor, max_nb_trials, offset):
         print("+--> Exctracting clips")
@@ -520,55 +951,58 @@ class VideoProcessor:
         sent_id = 0
         print("+--+")
         print("   |")
-        for sent, vid_ids in self.sent_video_matches:
-            print(f"   +--> Extracting for section: {sent_id}")
-            print("   |")
-            print("   +--+")
-            print("      |")
-            for vid_id in vid_ids:
-                print(f"      +--> Extracting from video id: {vid_id}")
+        with metrics.stage("extract_clips", fact_key):
+            for sent, vid_ids in self.sent_video_matches:
+                print(f"   +--> Extracting for section: {sent_id}")
+                print("   |")
+                print("   +--+")
                 print("      |")
-                find_clip = True
-                find_trial = 0
-                while find_clip:
-                    video_path = video_paths[vid_id]
-                    timestamp, frame = self.get_frame(video_path, factor,
-                                                      frames_folder_path,
-                                                      sent_id,
-                                                      clip_id)
-                    print("      +--+")
-                    print("         |")
-                    print(f"         +-- Evaluating frame: {timestamp}")
-                    print("         |")
-                    prompt = self.get_pompt("eval_frame",
-                                            {"sent": sent})
-                    is_good_fit = self.evaluate_frame_with_llava(frame, prompt)
-                    print("         |")
-                    if is_good_fit:
-                        print("         +-- Good fit, extracting clip.")
-                        print("         |")
-                        clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}.mp4"  # noqa: E501
-                        self.cut_video_clip(video_path, timestamp, clip_path, offset)  # noqa: E501
-                        clip_id += 1
-                        find_clip = False
-                    elif find_trial > max_nb_trials:
-                        print(f"         +-- good fit not found after {find_trial} trials. Getting a random clip")  # noqa: E501
-                        print("         |")
+                for vid_id in vid_ids:
+                    print(f"      +--> Extracting from video id: {vid_id}")
+                    print("      |")
+                    find_clip = True
+                    find_trial = 0
+                    while find_clip:
+                        video_path = video_paths[vid_id]
                         timestamp, frame = self.get_frame(video_path, factor,
                                                           frames_folder_path,
                                                           sent_id,
                                                           clip_id)
-                        clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}.mp4"  # noqa: E501
-                        self.cut_video_clip(video_path, timestamp, clip_path, offset)  # noqa: E501
-                        find_clip = False
-                    else:
-                        print("         +-- Bad fit, trying again.")
+                        print("      +--+")
                         print("         |")
-                    find_trial += 1
-                    print("      +--+")
-                    print("      |")
-            sent_id += 1
-            print("   +--+")
-            print("   |")
+                        print(f"         +-- Evaluating frame: {timestamp}")
+                        print("         |")
+                        prompt = self.get_pompt("eval_frame",
+                                                {"sent": sent})
+                        is_good_fit = (self.prefilter.check(frame) is None and
+                                       self.evaluate_frame_with_llava(frame, prompt))
+                        print("         |")
+                        if is_good_fit:
+                            print("         +-- Good fit, extracting clip.")
+                            print("         |")
+                            clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}.mp4"  # noqa: E501
+                            self.cut_video_clip(video_path, timestamp, clip_path, offset)  # noqa: E501
+                            clip_id += 1
+                            find_clip = False
+                        elif find_trial > max_nb_trials:
+                            print(f"         +-- good fit not found after {find_trial} trials. Getting a random clip")  # noqa: E501
+                            print("         |")
+                            timestamp, frame = self.get_frame(video_path, factor,
+                                                              frames_folder_path,
+                                                              sent_id,
+                                                              clip_id)
+                            clip_path = f"{clips_folder_path}/sent_{sent_id}_clip_{clip_id}.mp4"  # noqa: E501
+                            self.cut_video_clip(video_path, timestamp, clip_path, offset)  # noqa: E501
+                            find_clip = False
+                        else:
+                            print("         +-- Bad fit, trying again.")
+                            print("         |")
+                        find_trial += 1
+                        print("      +--+")
+                        print("      |")
+                sent_id += 1
+                print("   +--+")
+                print("   |")
         print("+--+")
         print("|")
+        self.prefilter.report()
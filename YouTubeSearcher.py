@@ -1,36 +1,27 @@
-from yt_dlp import YoutubeDL  # type: ignore
 from typing import Dict
-import time
 from functools import lru_cache
 import os
 import json
 import shutil
 
+from PipelineMetrics import metrics
+from Backends import make_backend
+
 
 class YouTubeSearcher:
-    def __init__(self, basepath, json_file):
-        """Initialize YouTubeSearch with default options"""
-        self.ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,  # Don't download videos
-        }
+    def __init__(self, basepath, json_file, backends=None):
+        """
+        Initialize YouTubeSearch with default options
+        :param backends: "backends" entry of config.json, selects the video
+                         source (see Backends.make_backend).
+        """
         self.basepath = basepath
         self.json_file_path = f"{basepath}/{json_file}"
         self.data = self.load_json(self.json_file_path)
-        self.last_request_time = 0
-        self.min_interval = 1  # Minimum seconds between requests
+        self.source = make_backend("video_source", backends)
         print("+--> Ready search youtube videos")
         print("|")
 
-    def _rate_limit(self):
-        """Simple rate limiting"""
-        current_time = time.time()
-        time_passed = current_time - self.last_request_time
-        if time_passed < self.min_interval:
-            time.sleep(self.min_interval - time_passed)
-        self.last_request_time = time.time()
-
     def load_json(self, file_path):
         """Load the JSON file."""
         with open(file_path, 'r') as file:
@@ -51,34 +42,8 @@ class YouTubeSearcher:
         Returns:
             List[Dict]: List of video information dictionaries
         """
-        self._rate_limit()
-
         try:
-            with YoutubeDL(self.ydl_opts) as ydl:
-                # Construct search URL
-                search_results = ydl.extract_info(
-                    f"ytsearch{max_results}:{search_query}",
-                    download=False
-                )
-
-                videos = []
-                if search_results.get('entries'):
-                    for entry in search_results['entries']:
-                        video = {
-                            'title': entry.get('title', 'No title'),
-                            'video_id': entry.get('id', 'No ID'),
-                            'description': entry.get('description', 'No desc'),
-                            'duration': entry.get('duration', 0),
-                            'view_count': entry.get('view_count', 0),
-                            'url': f"https://www.youtube.com/watch?v={entry.get('id')}",  # noqa: E501
-                            'thumbnail': entry.get('thumbnail', ''),
-                            'channel': entry.get('channel', 'Unknown channel'),
-                            'upload_date': entry.get('upload_date', 'No date')
-                        }
-                        videos.append(video)
-
-                return videos
-
+            return self.source.search(search_query, max_results)
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             return []
@@ -92,9 +57,7 @@ class YouTubeSearcher:
             Dict: Detailed video information
         """
         try:
-            with YoutubeDL(self.ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=False)
-                return info
+            return self.source.details(video_url)
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             return {}
@@ -108,22 +71,11 @@ class YouTubeSearcher:
         Returns:
             str: Path to the downloaded video file
         """
-        # Ensure the output directory exists
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Configure yt_dlp options for downloading
-        download_opts = {
-            'format': 'best',  # Download the best quality available
-            'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-        }
-
         try:
-            with YoutubeDL(download_opts) as ydl:
-                # Download the video
-                info = ydl.extract_info(video_url, download=True)
-                file_path = ydl.prepare_filename(info)
+            with metrics.stage("download_video", url=video_url) as record:
+                file_path = self.source.download(video_url, output_dir)
+                if os.path.exists(file_path):
+                    record["bytes"] = os.path.getsize(file_path)
                 return file_path
         except Exception as e:
             print(f"   | Download error for the video: {str(e)}")
@@ -137,10 +89,11 @@ class YouTubeSearcher:
         try:
             # Iterate over each query in "fact1"
             for query in fact_queries:
-                search_results = self.search_videos(
-                    search_query=query,
-                    max_results=max_results  # Get the first X videos
-                )
+                with metrics.stage("youtube_search", fact, query=query):
+                    search_results = self.search_videos(
+                        search_query=query,
+                        max_results=max_results  # Get the first X videos
+                    )
 
                 # Check if the video is already in the list and add it if not
                 for video in search_results:
@@ -194,17 +147,20 @@ class YouTubeSearcher:
         ok = 0
         video_names = []
         video_files = []
+        video_descriptions = []
         for video in unique_videos:
             duration = round(video['duration']/60, 2)
             if duration < max_duration:
                 file_path = self.download_video(video['url'], download_folder)
                 video_files.append(file_path)
                 video_names.append(f"{ok} - {video['title']}")
+                video_descriptions.append(video['description'] or "")
                 ok += 1
             else:
                 rej += 1
         self.data["fun_facts"][fact_key]["video_titles"] = video_names
         self.data["fun_facts"][fact_key]["video_paths"] = video_files
+        self.data["fun_facts"][fact_key]["video_descriptions"] = video_descriptions
         # Save results to a JSON file
         with open(self.json_file_path, "w", encoding="utf-8") as f:
             json.dump(self.data, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,86 @@
+"""
+Reformatting of the clips to 9:16 and rendering of a short, with MoviePy
+and ffmpeg, over a synthetic narration.
+"""
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from media import SECTIONS  # noqa: E402
+
+# Encoding is slow, keep to the smaller sizes
+RESOLUTIONS = ("240p", "480p")
+CLIP_SECONDS = 4
+# About the speech of SECTIONS, shorter than the clips put together
+NARRATION_SECONDS = 10
+
+
+@pytest.fixture
+def editor(workspace):
+    from VideoEditor import VideoEditor
+
+    base_path = str(workspace / "outputs")
+    return VideoEditor(base_path, f"{base_path}/fun_facts.json")
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_change_format(benchmark, media, editor, workspace, resolution):
+    source, frames = media.video(resolution, CLIP_SECONDS)
+    clip_path = str(workspace / "clip.mp4")
+
+    def copy_clip():
+        # change_format overwrites the clip
+        shutil.copyfile(source, clip_path)
+        return (clip_path,), {}
+
+    benchmark.pedantic(editor.change_format, setup=copy_clip, rounds=3)
+    benchmark.extra_info.update(resolution=resolution, seconds=CLIP_SECONDS,
+                                frames=frames,
+                                output_bytes=os.path.getsize(clip_path))
+
+
+@pytest.mark.parametrize("mode", ("preview", "final"))
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_render_short(benchmark, media, workspace, resolution, mode):
+    from moviepy.editor import AudioFileClip  # type: ignore
+    from ClipReaderCache import ClipReaderCache
+    from RenderScheduler import RenderScheduler
+    from TimelinePlanner import TimelinePlanner
+    from VideoEditor import RENDER_PROFILES, render_shorts
+
+    output_folder = workspace / "final_videos"
+    output_folder.mkdir()
+    audio = AudioFileClip(media.narration(NARRATION_SECONDS))
+    scheduler = RenderScheduler(max_workers=1)
+    profile = RENDER_PROFILES[mode]
+    audio_path = scheduler.prepare_audio(audio, str(output_folder),
+                                         profile["audio_bitrate"])
+
+    clips = [media.video(resolution, CLIP_SECONDS, seed=seed)[0]
+             for seed in range(len(SECTIONS))]
+    probe = ClipReaderCache()
+    planner = TimelinePlanner()
+    edl = planner.plan([[clip] for clip in clips],
+                       {clip: probe.duration(clip) for clip in clips},
+                       planner.section_durations(audio.duration, SECTIONS))
+    reference_width = probe.info(clips[0])["video_size"][0]
+    probe.close()
+    job = {
+        "edl": edl,
+        "sources": {},
+        "profile": profile,
+        "reference_width": reference_width,
+        "audio_path": audio_path,
+        "subtitles": [(0, audio.duration, "")],
+        "output_path": str(output_folder / "short_0.mp4"),
+    }
+    scheduler.split_jobs([job])
+
+    benchmark.pedantic(render_shorts, args=([job],), rounds=2)
+    benchmark.extra_info.update(
+        resolution=resolution, mode=mode, seconds=round(audio.duration, 2),
+        cuts=len(edl), output_bytes=os.path.getsize(job["output_path"]))
+    audio.close()
@@ -0,0 +1,54 @@
+"""
+Throughput of the html extraction: lxml HtmlExtractor against the
+BeautifulSoup implementation, over a folder of saved html pages (e.g. the
+article_cache folder filled by DocumentProcessor.get_fun_facts_batch).
+
+    python benchmarks/bench_html_extraction.py data/outputs/article_cache 5
+"""
+import os
+import sys
+import glob
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DocumentProcessor import DocumentProcessor  # noqa: E402
+from HtmlExtractor import HtmlExtractor  # noqa: E402
+from TextCleaner import TextCleaner  # noqa: E402
+
+
+def run(name, extract, pages, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        texts = [extract(html) for html in pages]
+    seconds = (time.perf_counter() - start) / repeats
+    megabytes = sum(len(html) for html in pages) / 1e6
+    print(f"{name}: {len(pages) / seconds:.1f} pages/s, "
+          f"{megabytes / seconds:.2f} MB/s")
+    return texts, seconds
+
+
+def main(folder, repeats=3):
+    pages = []
+    for path in sorted(glob.glob(f"{folder}/*.html")):
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            pages.append(file.read())
+    if not pages:
+        sys.exit(f"No .html page in {folder}")
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / 1e6:.1f} MB")
+    # The extraction methods don't use the config, skip loading it
+    processor = object.__new__(DocumentProcessor)
+    extractor = HtmlExtractor()
+    cleaner = TextCleaner()
+    soup_texts, soup_seconds = run(
+        "BeautifulSoup", lambda html: cleaner.clean(
+            processor.extract_text_soup(html)), pages, repeats)
+    lxml_texts, lxml_seconds = run(
+        "lxml", lambda html: "\n".join(cleaner.clean_lines(
+            extractor.iter_lines(html))), pages, repeats)
+    same = sum(a == b for a, b in zip(soup_texts, lxml_texts))
+    print(f"speed-up: x{soup_seconds / lxml_seconds:.1f}, "
+          f"same text for {same}/{len(pages)} pages")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -0,0 +1,65 @@
+"""
+LLM wall time to prepare one fact: per-call mode (generate_queries_script +
+get_script_sentences, i.e. 2 + num_parts calls) against the fused mode
+(generate_fact_assets, 1 call). Needs a running Ollama with the models.
+The LLM time comes from the ModelSessions records, which streamed calls
+only write once their stream is consumed.
+
+    python benchmarks/bench_llm_fusion.py data/inputs/config.json fact1 3
+"""
+import os
+import sys
+import json
+import copy
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DocumentProcessor import DocumentProcessor  # noqa: E402
+from ModelSessions import ModelSessions  # noqa: E402
+from Backends import make_backend  # noqa: E402
+
+
+def run(config_path, fun_facts, json_file_path, mode, fact_id, num_parts):
+    # Fresh sessions, its records are the calls of this run only
+    with open(config_path, 'r') as file:
+        backends = json.load(file).get("backends")
+    sessions = ModelSessions(client=make_backend("llm", backends))
+    processor = DocumentProcessor(config_path, sessions)
+    processor.fun_facts = copy.deepcopy(fun_facts)
+    processor.json_file_path = json_file_path
+    start = time.perf_counter()
+    if mode == "per_call":
+        processor.generate_queries_script(fact_id, json_file_path)
+        processor.get_script_sentences(fact_id, num_parts)
+    else:
+        processor.generate_fact_assets(fact_id, num_parts)
+    total = time.perf_counter() - start
+    calls = [c for c in sessions.calls if c["kind"] != "preload"]
+    return {"mode": mode, "llm_calls": len(calls),
+            "llm_seconds": round(sum(c["wall"] for c in calls), 2),
+            "total_seconds": round(total, 2)}
+
+
+def main(config_path, fact_id="fact1", num_parts=3, repeats=1):
+    fun_facts = DocumentProcessor(config_path).fun_facts
+    # Both modes write the fact record, keep the real output file untouched
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for _ in range(repeats):
+            for mode in ("per_call", "fused"):
+                results.append(run(config_path, fun_facts,
+                                   f"{tmp}/fun_facts.json", mode, fact_id,
+                                   num_parts))
+                print(json.dumps(results[-1]))
+    for mode in ("per_call", "fused"):
+        seconds = [r["llm_seconds"] for r in results if r["mode"] == mode]
+        print(f"{mode}: {sum(seconds) / len(seconds):.2f}s of LLM calls "
+              f"on average over {len(seconds)} run(s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1],
+         sys.argv[2] if len(sys.argv) > 2 else "fact1",
+         int(sys.argv[3]) if len(sys.argv) > 3 else 3,
+         int(sys.argv[4]) if len(sys.argv) > 4 else 1)
@@ -0,0 +1,42 @@
+"""
+Import time of the pipeline modules, each in a fresh interpreter with
+python -X importtime. The heaviest imports go to extra_info, to spot a
+library that is imported eagerly again.
+"""
+import os
+import sys
+import subprocess
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("VideoProcessor", "VideoEditor", "AudioGenerator",
+           "DocumentProcessor", "YouTubeSearcher")
+TOP = 5
+
+
+def import_times(module):
+    """:return: {imported module: cumulative microseconds}"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", MODULES)
+def bench_import(benchmark, module):
+    times = benchmark.pedantic(import_times, args=(module,), rounds=3)
+    heaviest = sorted((name for name in times if name != module),
+                      key=times.get, reverse=True)[:TOP]
+    benchmark.extra_info.update(
+        module=module, import_us=times.get(module),
+        heaviest={name: times[name] for name in heaviest})
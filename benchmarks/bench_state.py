@@ -0,0 +1,70 @@
+"""
+JSON state updates: every stage reloads the fun facts file, updates its
+fact and writes the whole file back, and the frame hash index is saved
+after each video.
+"""
+import json
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from media import SECTIONS  # noqa: E402
+
+
+def fun_facts(nb_facts, nb_videos=10):
+    """Fun facts state of nb_facts fully processed facts."""
+    facts = {}
+    for i in range(nb_facts):
+        facts[f"fact{i}"] = {
+            "fact": f"Synthetic fact number {i}, with a few words.",
+            "youtube_queries": [f"query {q} of fact {i}" for q in range(10)],
+            "video_script": [" ".join(SECTIONS)],
+            "video_script_clean": [" ".join(SECTIONS)],
+            "video_script_sections": SECTIONS,
+            "keywords_sections": {str(s): ["subject", "detail", "surprise"]
+                                  for s in range(len(SECTIONS))},
+            "video_titles": [f"Video {v} of fact {i}"
+                             for v in range(nb_videos)],
+            "video_paths": [f"outputs/fact{i}/downloads/video_{v:04}.mp4"
+                            for v in range(nb_videos)],
+            "best_video_idx": {str(s): [0, 1]
+                               for s in range(len(SECTIONS))},
+            "audio_section_durations": [4.2, 3.8, 5.1],
+        }
+    return {"fun_facts": facts}
+
+
+@pytest.mark.parametrize("nb_facts", (10, 100, 1000))
+def bench_fun_facts_update(benchmark, tmp_path, nb_facts):
+    path = tmp_path / "fun_facts.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fun_facts(nb_facts), f, indent=4, ensure_ascii=False)
+
+    def update():
+        # Same reads and writes as the pipeline stages
+        with open(path, "r") as f:
+            state = json.load(f)
+        state["fun_facts"]["fact0"]["best_video_idx"] = {"0": [1, 2]}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4, ensure_ascii=False)
+
+    benchmark(update)
+    benchmark.extra_info.update(nb_facts=nb_facts,
+                                file_bytes=path.stat().st_size)
+
+
+@pytest.mark.parametrize("nb_frames", (1000, 10000))
+def bench_frame_hash_index_save(benchmark, tmp_path, nb_frames):
+    import numpy as np  # type: ignore
+    from FrameHashIndex import FrameHashIndex
+
+    index = FrameHashIndex(str(tmp_path / "frame_hashes.json"))
+    rng = np.random.default_rng(0)
+    for value in rng.integers(0, 2 ** 63, nb_frames):
+        index.frames.append({"hash": f"{int(value):016x}",
+                             "scores": {"prompt": int(value) % 2}})
+    benchmark(index.save)
+    benchmark.extra_info.update(
+        nb_frames=nb_frames,
+        file_bytes=(tmp_path / "frame_hashes.json").stat().st_size)
@@ -0,0 +1,67 @@
+"""
+Frame extraction, frame scoring (stubbed vision model) and clip extraction
+of VideoProcessor.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from media import RESOLUTIONS, DURATIONS  # noqa: E402
+from Backends import StubVision  # noqa: E402
+
+INTERVAL = 1   # Seconds between sampled frames
+FACTOR = 0.5   # Resolution of the saved frames
+PROMPT = "Does this frame show subject, detail? Answer yes or no."
+
+
+def scored(processor, path):
+    processor.extract_center_frames("fact1", path, INTERVAL, FACTOR)
+    processor.evaluate_frame_with_moondream(StubVision(), PROMPT)
+    return processor
+
+
+@pytest.mark.parametrize("seconds", DURATIONS)
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_extract_center_frames(benchmark, media, video_processor,
+                                resolution, seconds):
+    path, frames = media.video(resolution, seconds)
+    benchmark.extra_info.update(resolution=resolution, seconds=seconds,
+                                frames=frames)
+    benchmark(video_processor.extract_center_frames, "fact1", path,
+              INTERVAL, FACTOR)
+    benchmark.extra_info["sampled_frames"] = len(video_processor.frames_info)
+
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_score_frames(benchmark, media, video_processor, resolution):
+    from FrameHashIndex import FrameHashIndex
+
+    path, frames = media.video(resolution, DURATIONS[-1])
+    video_processor.extract_center_frames("fact1", path, INTERVAL, FACTOR)
+    model = StubVision()
+
+    def forget_scores():
+        # Otherwise every frame after the first round is a cache hit
+        video_processor.hash_index = FrameHashIndex(
+            f"{video_processor.base_path}/no_index.json")
+
+    benchmark.pedantic(video_processor.evaluate_frame_with_moondream,
+                       args=(model, PROMPT), setup=forget_scores, rounds=5)
+    benchmark.extra_info.update(
+        resolution=resolution, seconds=DURATIONS[-1],
+        sampled_frames=len(video_processor.frames_info),
+        model_calls=model.calls)
+
+
+@pytest.mark.parametrize("seconds", DURATIONS)
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def bench_extract_good_clips(benchmark, media, video_processor, resolution,
+                             seconds):
+    path, frames = media.video(resolution, seconds)
+    scored(video_processor, path)
+    benchmark.extra_info.update(
+        resolution=resolution, seconds=seconds, frames=frames,
+        good_frames=int(video_processor.response_array.sum()))
+    benchmark.pedantic(video_processor.extract_good_clips,
+                       args=("0", "fact1", path, INTERVAL,
+                             video_processor.segments), rounds=3)
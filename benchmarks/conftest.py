@@ -0,0 +1,92 @@
+"""
+Benchmark suite of the media stages, on synthetic videos and narrations
+with the stub model backends of Backends.py, so the numbers only depend
+on the pipeline code, OpenCV, MoviePy and ffmpeg.
+Needs pytest-benchmark:
+
+    python -m pytest benchmarks --benchmark-json=bench.json
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare \
+        --benchmark-compare-fail=median:15%
+
+The JSON results hold the timings of every benchmark, the machine and the
+commit, plus the media parameters in extra_info (resolution, seconds,
+frames...), so runs can be compared over time.
+"""
+import os
+import sys
+import json
+
+import pytest
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+from media import RESOLUTIONS, SECTIONS  # noqa: E402
+from SyntheticMedia import (  # noqa: E402
+    write_synthetic_video, write_synthetic_wav)
+from Backends import StubLLM  # noqa: E402
+
+
+class MediaFiles:
+    def __init__(self, folder):
+        """Synthetic media, written once per session and reused."""
+        self.folder = folder
+        self.files = {}
+
+    def video(self, resolution, seconds, seed=0):
+        """:return: (path, number of frames)"""
+        width, height = RESOLUTIONS[resolution]
+        path = os.path.join(self.folder,
+                            f"video_{resolution}_{seconds:03}s_{seed}.mp4")
+        if path not in self.files:
+            self.files[path] = write_synthetic_video(path, width, height,
+                                                     seconds, shot_seconds=2,
+                                                     seed=seed)
+        return path, self.files[path]
+
+    def narration(self, seconds):
+        path = os.path.join(self.folder, f"narration_{seconds:03}s.wav")
+        if path not in self.files:
+            write_synthetic_wav(path, seconds)
+            self.files[path] = seconds
+        return path
+
+
+@pytest.fixture(scope="session")
+def media(tmp_path_factory):
+    return MediaFiles(str(tmp_path_factory.mktemp("media")))
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    """Output folder of one article, with its fun facts and prompts."""
+    base_path = tmp_path / "outputs"
+    base_path.mkdir()
+    fun_facts = {"fun_facts": {"fact1": {
+        "fact": "A synthetic fact.",
+        "video_script_sections": SECTIONS,
+        "keywords_sections": {str(i): ["subject", "detail"]
+                              for i in range(len(SECTIONS))},
+        "video_titles": [f"Video {i}" for i in range(10)],
+        "video_paths": [],
+    }}}
+    with open(base_path / "fun_facts.json", "w", encoding="utf-8") as file:
+        json.dump(fun_facts, file)
+    prompts = {"moondreamer_prompt": "Does this frame show {keywords}? "
+                                     "Answer yes or no."}
+    with open(tmp_path / "prompts.json", "w", encoding="utf-8") as file:
+        json.dump(prompts, file)
+    return tmp_path
+
+
+@pytest.fixture
+def video_processor(workspace):
+    """VideoProcessor on the workspace, with the stub LLM."""
+    from ModelSessions import ModelSessions
+    from VideoProcessor import VideoProcessor
+
+    return VideoProcessor(str(workspace / "outputs"), "fun_facts.json",
+                          str(workspace / "prompts.json"),
+                          library_path=str(workspace / "clip_library"),
+                          sessions=ModelSessions(client=StubLLM()))
@@ -0,0 +1,18 @@
+"""
+Parameters of the synthetic media of the benchmarks, written with the
+SyntheticMedia writers of the stub backends.
+"""
+RESOLUTIONS = {
+    "240p": (426, 240),
+    "480p": (854, 480),
+    "720p": (1280, 720),
+}
+# Video lengths (seconds)
+DURATIONS = (4, 16)
+# Script of the synthetic fact
+SECTIONS = [
+    "The first section of the script talks about the subject.",
+    "The second section explains why it is surprising.",
+    "The last section wraps up with a memorable detail.",
+]
+
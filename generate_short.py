@@ -3,76 +3,133 @@ from YouTubeSearcher import YouTubeSearcher
 from VideoProcessor import VideoProcessor
 from VideoEditor import VideoEditor
 from AudioGenerator import AudioGenerator
+from ModelSessions import ModelSessions
+from PipelineMetrics import metrics, metrics_file
+from Profiler import profiler
+from Backends import make_backend
+from JobQueue import TransientError
 import os
 import json
+import glob
 
-cofig_path = "data/inputs/config.json"
 
-with open(cofig_path, 'r') as file:
-    config = json.load(file)
+def generate_short(config, cofig_path, sessions, speaker_id="p314",
+                   nb_final_shorts=3):
+    """
+    Article of config["article_url"] --> nb_final_shorts shorts of the
+    fact config["fact_id"], in {output_path}/final_videos, or in
+    preview_videos with config "render_mode": "preview" (fast low
+    resolution renders, see VideoEditor.render_edl).
+    :param cofig_path: Config file read by DocumentProcessor.
+    :param sessions: ModelSessions shared by the stages (and the shorts).
+    :return: Paths of the shorts.
+    :raise TransientError: When none of the videos could be downloaded,
+                           worth retrying later.
+    :raise Exception: DocumentProcessor.fetch_error when the article couldn't
+                      be fetched, see JobQueue.is_transient.
+    """
+    output_path = config["output_path"]
+    output_file = config['output_file']
+    prompt_file = config["prompts_file"]
+    fact_id = config["fact_id"]
+    max_duration = config["max_duration"]
+    video_sections = config["video_sections"]
+    # One LLM call for queries, script, sections and keywords
+    fused_generation = config.get("fused_generation", True)
+    # Real models or deterministic stubs, e.g. "stub" or {"vision": "stub"}
+    backends = config.get("backends")
+    render_mode = config.get("render_mode", "final")
+    # Frame hashes, clip library and proxies reused by the next articles
+    cache_path = config.get("cache_path")
 
-output_path = config["output_path"]
-output_file = config['output_file']
-prompt_file = config["prompts_file"]
-article_url = config["article_url"]
-fact_id = config["fact_id"]
-max_duration = config["max_duration"]
-video_sections = config["video_sections"]
-video_match_per_section = config["video_match_per_section"]
-factor = config["factor"]
-max_nb_trials = config["max_nb_trials"]
-offset = config["offset"]
-interval_seconds = 10
+    output_file_path = f"{output_path}/{output_file}"
+    ########################################
+    #                                      #
+    #      Step1: article --> script       #
+    #                                      #
+    ########################################
+    processor = DocumentProcessor(cofig_path, sessions)
+    if processor.get_fun_facts() is None:
+        raise processor.fetch_error
+    if fused_generation:
+        processor.generate_fact_assets(fact_id, video_sections)
+    else:
+        processor.generate_queries_script(fact_id, output_file_path)
+        processor.get_script_sentences(fact_id, video_sections)
+    # Free the RAM for the speech synthesis
+    sessions.release()
 
-os.makedirs(output_path, exist_ok=True)
+    ########################################
+    #                                      #
+    #       Step2: script --> audio        #
+    #                                      #
+    ########################################
+    ag = AudioGenerator(output_path, output_file, backends)
+    ag.generate_audio(fact_id, speaker_id)
 
-output_file_path = f"{output_path}/{output_file}"
-########################################
-#                                      #
-#      Step1: article --> script       #
-#                                      #
-########################################
-processor = DocumentProcessor(prompt_file, output_file_path)
-processor.get_fun_facts(article_url, output_file_path)
-processor.generate_queries_script(fact_id, output_file_path)
-processor.get_script_sentences(fact_id, video_sections)
+    ########################################
+    #                                      #
+    #   Step2: script --> download videos  #
+    #                                      #
+    ########################################
+    vp = VideoProcessor(output_path, output_file, prompt_file,
+                        sessions=sessions,
+                        generation_limits=config.get("generation_limits"),
+                        backends=backends, cache_path=cache_path)
+    factor = 0.2
+    interval_seconds = 20
+    model_path = "/home/tests/vision_models/moondream-2b-int8.mf"
+    # Footage kept from previous articles, no download if it's enough
+    covered_sections = vp.reuse_library_clips(fact_id)
+    if covered_sections < video_sections:
+        yt = YouTubeSearcher(output_path, output_file, backends)
+        yt.download_fact_videos(fact_id, max_duration)
+        video_paths = yt.data["fun_facts"][fact_id]["video_paths"]
+        if not any(video_paths):
+            raise TransientError(f"No video downloaded for {fact_id}")
 
-########################################
-#                                      #
-#       Step2: script --> audio        #
-#                                      #
-########################################
-speaker_id = "p314"
-ag = AudioGenerator(output_path, output_file)
-ag.generate_audio(fact_id, speaker_id)"
+        ########################################
+        #                                      #
+        #   Step3: download videos -->  clips  #
+        #                                      #
+        ########################################
+        vp = VideoProcessor(output_path, output_file, prompt_file,
+                            sessions=sessions,
+                            generation_limits=config.get("generation_limits"),
+                            backends=backends, cache_path=cache_path)
+        vp.convert_videos2clips(fact_id, interval_seconds, factor, model_path)
 
-########################################
-#                                      #
-#   Step2: script --> download videos  #
-#                                      #
-########################################
-yt = YouTubeSearcher(output_path, output_file)
-yt.download_fact_videos(fact_id, max_duration)
+    ########################################
+    #                                      #
+    #     Step4: edit clips -->  shorts    #
+    #                                      #
+    ########################################
+    num_sections = 6
+    vd = VideoEditor(output_path, output_file_path, cache_path)
+    vd.get_video_audio_files(fact_id)
+    vd.video_2_shors(render_mode)
+    vd.edit_video(fact_id, nb_final_shorts, num_sections, mode=render_mode)
+    output_folder = (vd.preview_output_path if render_mode == "preview"
+                     else vd.final_output_path)
+    return sorted(glob.glob(f"{output_folder}/short_*.mp4"))
 
-########################################
-#                                      #
-#   Step3: download videos -->  clips  #
-#                                      #
-########################################
-vp = VideoProcessor(output_path, output_file, prompt_file)
-factor = 0.2
-interval_seconds = 20
-model_path = "/home/tests/vision_models/moondream-2b-int8.mf"
-vp.convert_videos2clips(fact_id, interval_seconds, factor, model_path)
 
-########################################
-#                                      #
-#     Step4: edit clips -->  shorts    #
-#                                      #
-########################################
-nb_final_shorts = 3
-num_sections = 6
-vd = VideoEditor(output_path, output_file_path)
-vd.get_video_audio_files(fact_id)
-vd.video_2_shors()
-vd.edit_video(fact_id, nb_final_shorts, interval_seconds, num_sections)
+if __name__ == "__main__":
+    cofig_path = "data/inputs/config.json"
+
+    with open(cofig_path, 'r') as file:
+        config = json.load(file)
+
+    output_path = config["output_path"]
+    os.makedirs(output_path, exist_ok=True)
+    metrics.open(metrics_file(config))
+    # Opt-in cProfile / tracemalloc / stack sampling of the hot sections
+    profiler.configure(config.get("profiling"), f"{output_path}/profiles")
+    # One Ollama session for all the stages, so model loads are tracked
+    # together
+    sessions = ModelSessions(client=make_backend("llm", config.get("backends")),
+                             keep_alive=config.get("keep_alive", "5m"))
+
+    generate_short(config, cofig_path, sessions)
+    sessions.print_report()
+    metrics.print_summary()
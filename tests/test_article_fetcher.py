@@ -0,0 +1,75 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ArticleFetcher import ArticleFetcher
+
+
+class Site(BaseHTTPRequestHandler):
+    hits = {}
+
+    def do_GET(self):
+        Site.hits[self.path] = Site.hits.get(self.path, 0) + 1
+        if self.path == "/flaky" and Site.hits[self.path] == 1:
+            return self.answer(503, b"busy")
+        if self.path == "/missing":
+            return self.answer(404, b"")
+        if self.path == "/feed.xml":
+            port = self.server.server_port
+            body = ("<rss><channel><link>http://site</link>"
+                    f"<item><link>http://127.0.0.1:{port}/a</link></item>"
+                    f"<item><link>http://127.0.0.1:{port}/b</link></item>"
+                    "</channel></rss>")
+            return self.answer(200, body.encode())
+        etag = f'"{self.path}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.answer(304, b"", etag)
+        self.answer(200, f"<html><p>{self.path}</p></html>".encode(), etag)
+
+    def answer(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    Site.hits = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Site)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_fetch_all_uses_conditional_get(site, tmp_path):
+    fetcher = ArticleFetcher(str(tmp_path), backoff=0)
+    urls = [f"{site}/a", f"{site}/b", f"{site}/missing"]
+    pages = dict(fetcher.fetch_all(urls))
+    assert pages[f"{site}/a"] == "<html><p>/a</p></html>"
+    assert pages[f"{site}/missing"] is None
+
+    again = ArticleFetcher(str(tmp_path), backoff=0)
+    assert dict(again.fetch_all(urls[:2])) == {
+        url: pages[url] for url in urls[:2]}
+    assert again.stats == {"downloaded": 0, "not_modified": 2, "failed": 0}
+
+
+def test_retries_server_errors(site, tmp_path):
+    fetcher = ArticleFetcher(str(tmp_path), backoff=0)
+    assert fetcher.fetch(f"{site}/flaky") == "<html><p>/flaky</p></html>"
+    assert Site.hits["/flaky"] == 2
+
+
+def test_feed_urls(site, tmp_path):
+    fetcher = ArticleFetcher(str(tmp_path))
+    assert fetcher.feed_urls(f"{site}/feed.xml") == [f"{site}/a", f"{site}/b"]
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text("# articles\nhttp://x/1\n\nhttp://x/2\n")
+    assert fetcher.feed_urls(str(url_file)) == ["http://x/1", "http://x/2"]
@@ -0,0 +1,54 @@
+import wave
+
+import cv2  # type: ignore
+import pytest
+
+from Backends import make_backend, StubLLM, StubVision, StubTTS
+from Backends import StubVideoSource, LLMBackend, VisionBackend
+from Backends import TTSBackend, VideoSourceBackend
+from StructuredLLM import StructuredLLM, FactAssets, YoutubeQueries
+
+
+def test_make_backend_from_config():
+    assert isinstance(make_backend("vision", "stub", model_path="m.mf"),
+                      StubVision)
+    llm = make_backend("llm", {"llm": {"name": "stub", "latency": 0}})
+    assert isinstance(llm, StubLLM) and llm.latency == 0
+    with pytest.raises(ValueError):
+        make_backend("tts", {"tts": "unknown"})
+    assert isinstance(StubLLM(), LLMBackend)
+    assert isinstance(StubVision(), VisionBackend)
+    assert isinstance(StubTTS(), TTSBackend)
+    assert isinstance(StubVideoSource(), VideoSourceBackend)
+
+
+def test_stub_llm_answers_follow_the_schema():
+    llm = StructuredLLM(StubLLM(latency=0))
+    constraints = {"sections": {"minItems": 4, "maxItems": 4}}
+    assets = llm.generate("llama3.2:3B", "A fact", FactAssets,
+                          constraints=constraints)
+    assert len(assets.sections) == 4
+    assert all(s.narration and s.keywords for s in assets.sections)
+    # Deterministic
+    again = llm.generate("llama3.2:3B", "A fact", FactAssets,
+                         constraints=constraints)
+    assert again == assets
+    queries = llm.generate_items("llama3.2:3B", "A fact", YoutubeQueries,
+                                 "queries", 2)
+    assert len(queries) == 2
+
+
+def test_stub_media_backends(tmp_path):
+    wav_path = str(tmp_path / "speech.wav")
+    StubTTS(latency=0).tts_to_file("five words of stub speech",
+                                   file_path=wav_path)
+    with wave.open(wav_path) as file:
+        assert file.getnframes() / file.getframerate() == pytest.approx(2)
+
+    source = StubVideoSource(latency=0, seconds=2, width=160, height=96)
+    results = source.search("a query", max_results=3)
+    assert results == source.search("a query", max_results=3)
+    path = source.download(results[0]["url"], str(tmp_path / "downloads"))
+    cap = cv2.VideoCapture(path)
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 48
+    cap.release()
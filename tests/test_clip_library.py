@@ -0,0 +1,107 @@
+import multiprocessing
+
+import numpy as np  # type: ignore
+
+from ClipLibrary import ClipLibrary
+
+
+def clip_file(tmp_path, name, content=None):
+    path = tmp_path / name
+    path.write_bytes(content or name.encode() * 10)
+    return str(path)
+
+
+def unit_vectors(nb, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((nb, dim))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_insert_search_and_reload(tmp_path):
+    library = ClipLibrary(str(tmp_path / "library"))
+    vectors = unit_vectors(20)
+    for i, vector in enumerate(vectors):
+        assert library.insert(vector, clip_file(tmp_path, f"c{i}.mp4"),
+                              {"section": f"s{i}"}) == i
+    matches = library.search(vectors[7], k=3)
+    assert matches[0][1]["section"] == "s7"
+    assert matches[0][0] > 0.99
+    assert [m[0] for m in matches] == sorted((m[0] for m in matches),
+                                             reverse=True)
+
+    again = ClipLibrary(str(tmp_path / "library"))
+    assert len(again) == 20
+    assert again.search(vectors[7], k=1)[0][1]["section"] == "s7"
+    assert again.buckets == library.buckets
+
+
+def test_same_clip_is_inserted_once(tmp_path):
+    library = ClipLibrary(str(tmp_path / "library"))
+    vector = unit_vectors(1)[0]
+    first = library.insert(vector, clip_file(tmp_path, "a.mp4", b"same"),
+                           {})
+    # A rerun extracts the same clip again, under another name
+    second = library.insert(vector, clip_file(tmp_path, "b.mp4", b"same"),
+                            {})
+    assert first == second and len(library) == 1
+    assert len(ClipLibrary(str(tmp_path / "library"))) == 1
+
+
+def test_lsh_buckets_hold_close_vectors(tmp_path):
+    library = ClipLibrary(str(tmp_path / "library"), nb_planes=8)
+    vector = unit_vectors(1)[0]
+    close = vector + 0.01 * unit_vectors(1, seed=1)[0]
+    library.insert(vector, clip_file(tmp_path, "a.mp4"), {})
+    library.insert(close, clip_file(tmp_path, "b.mp4"), {})
+    library.insert(-vector, clip_file(tmp_path, "c.mp4"), {})
+    assert len(library.buckets) == 2
+    assert sorted(library.candidates(vector.astype(np.float32), 1)) == [0, 1]
+
+
+def test_interrupted_insert_is_dropped_on_load(tmp_path):
+    library = ClipLibrary(str(tmp_path / "library"))
+    vectors = unit_vectors(3)
+    for i in range(2):
+        library.insert(vectors[i], clip_file(tmp_path, f"c{i}.mp4"), {})
+    # Crash between the vector and the metadata writes
+    with open(library.vectors_path, "ab") as f:
+        f.write(vectors[2].astype(np.float32).tobytes())
+    with open(library.meta_path, "a", encoding="utf-8") as f:
+        f.write('{"cut": ')
+
+    again = ClipLibrary(str(tmp_path / "library"))
+    assert len(again) == 2
+    clip_id = again.insert(vectors[2], clip_file(tmp_path, "c2.mp4"),
+                           {"section": "last"})
+    assert clip_id == 2
+    reloaded = ClipLibrary(str(tmp_path / "library"))
+    assert reloaded.search(vectors[2], k=1)[0][1]["section"] == "last"
+
+
+def insert_clips(library_path, folder, worker, nb_clips):
+    library = ClipLibrary(library_path)
+    vectors = unit_vectors(nb_clips, seed=worker + 1)
+    for i, vector in enumerate(vectors):
+        path = f"{folder}/w{worker}_{i}.mp4"
+        with open(path, "wb") as file:
+            file.write(f"clip {worker} {i}".encode())
+        library.insert(vector, path, {"worker": worker, "i": i})
+
+
+def test_processes_share_a_library(tmp_path):
+    library_path = str(tmp_path / "library")
+    workers = [multiprocessing.Process(
+        target=insert_clips, args=(library_path, str(tmp_path), w, 25))
+        for w in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    library = ClipLibrary(library_path)
+    assert len(library) == 75
+    assert len({m["clip_path"] for m in library.meta}) == 75
+    # Each vector row belongs to its metadata row
+    for w in range(3):
+        for i, vector in enumerate(unit_vectors(25, seed=w + 1)):
+            meta = library.search(vector, k=1)[0][1]
+            assert (meta["worker"], meta["i"]) == (w, i)
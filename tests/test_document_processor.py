@@ -0,0 +1,121 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from Backends import StubLLM
+from DocumentProcessor import DocumentProcessor
+from JobQueue import JobQueue, main
+from ModelSessions import ModelSessions
+
+ARTICLE = ("<html><body><article>" + "".join(
+    f"<p>Octopuses have three hearts and blue blood, fact number {i} of "
+    f"this article explains why their nervous system is so unusual.</p>"
+    for i in range(6)) + "</article></body></html>")
+
+
+class Site(BaseHTTPRequestHandler):
+    # (path, status) of the requests served
+    served = []
+
+    def do_GET(self):
+        if self.path not in ("/a", "/b"):
+            return self.answer(404, b"")
+        etag = f'"{self.path}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.answer(304, b"", etag)
+        self.answer(200, ARTICLE.replace("Octopuses", self.path).encode(),
+                    etag)
+
+    def answer(self, status, body, etag=None):
+        self.served.append((self.path, status))
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    Site.served.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Site)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    prompts = {"extract_fun_facts": "List fun facts of: {article_text}"}
+    (tmp_path / "prompts.json").write_text(json.dumps(prompts))
+    config = {"output_file": str(tmp_path / "fun_facts.json"),
+              "prompts_file": str(tmp_path / "prompts.json"),
+              "log_file": str(tmp_path / "log.jsonl"),
+              "backends": "stub"}
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_process_article_makes_one_call_per_fact(site, config_path,
+                                                 tmp_path):
+    llm = StubLLM(latency=0)
+    processor = DocumentProcessor(config_path, ModelSessions(client=llm))
+    output_file = str(tmp_path / "article.json")
+    result = processor.process_article(f"{site}/a", output_file, num_parts=2)
+    facts = result["fun_facts"]
+    assert len(facts) == 3
+    # The fun facts, then queries, script and keywords of each fact at once
+    assert llm.calls == 1 + len(facts)
+    for fact in facts.values():
+        assert fact["youtube_queries"]
+        assert len(fact["video_script_sections"]) == 2
+        assert sorted(fact["keywords_sections"]) == ["0", "1"]
+    with open(output_file, encoding="utf-8") as file:
+        assert json.load(file) == result
+    assert processor.process_article(f"{site}/missing", output_file) is None
+
+
+def test_batch_caches_the_pages_and_skips_the_failed_ones(site, config_path,
+                                                          tmp_path):
+    processor = DocumentProcessor(
+        config_path, ModelSessions(client=StubLLM(latency=0)))
+    feed = [f"{site}/a", f"{site}/b", f"{site}/missing"]
+    results = processor.get_fun_facts_batch(feed)
+    assert sorted(results) == feed[:2]
+    for article_url, result in results.items():
+        assert result["article_url"] == article_url
+        assert sorted(result["fun_facts"]) == ["fact1", "fact2", "fact3"]
+    with open(tmp_path / "articles_fun_facts.json", encoding="utf-8") as file:
+        assert json.load(file) == results
+
+    # The second run revalidates the cached pages
+    Site.served.clear()
+    assert processor.get_fun_facts_batch(feed) == results
+    assert sorted(Site.served) == [("/a", 304), ("/b", 304),
+                                   ("/missing", 404)]
+
+
+def test_enqueue_feed_queues_the_articles_with_fun_facts(site, config_path,
+                                                         tmp_path):
+    (tmp_path / "urls.txt").write_text(f"{site}/a\n{site}/missing\n")
+    with open(config_path, encoding="utf-8") as file:
+        config = json.load(file)
+    config.update(output_path=str(tmp_path / "outputs"),
+                  job_queue={"path": str(tmp_path / "jobs.sqlite")})
+    with open(config_path, "w", encoding="utf-8") as file:
+        json.dump(config, file)
+    main(["--config", config_path, "enqueue-feed",
+          str(tmp_path / "urls.txt"), "--fact-id", "fact2"])
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    jobs = queue.jobs()
+    queue.close()
+    assert [(job["article_url"], job["fact_id"]) for job in jobs] == [
+        (f"{site}/a", "fact2")]
@@ -0,0 +1,40 @@
+import numpy as np  # type: ignore
+
+from EmbeddingIndex import EmbeddingIndex
+
+VECTORS = {
+    "cat": [1.0, 0.0, 0.0],
+    "kitten": [0.9, 0.1, 0.0],
+    "tiger": [0.7, 0.7, 0.0],
+    "car": [0.0, 0.0, 1.0],
+    "truck": [0.0, 0.1, 0.9],
+}
+
+
+class FakeClient:
+    def __init__(self):
+        self.inputs = []
+
+    def embed(self, model, input):
+        self.inputs.append(list(input))
+        return {"embeddings": [VECTORS[text] for text in input]}
+
+
+def test_top_k_orders_by_similarity():
+    client = FakeClient()
+    index = EmbeddingIndex(client=client)
+    documents = ["car", "tiger", "kitten", "truck"]
+    indices, similarities = index.top_k(["cat", "car"], documents, 2)
+    assert indices.tolist() == [[2, 1], [0, 3]]
+    assert np.all(np.diff(similarities, axis=1) <= 0)
+    assert similarities[1, 0] == np.float32(1.0)
+    # k larger than the documents, and the embeddings come from the cache
+    indices, _ = index.top_k(["truck"], documents, 10)
+    assert indices.tolist() == [[3, 0, 1, 2]]
+    assert client.inputs == [["cat", "car"], ["tiger", "kitten", "truck"]]
+
+
+def test_ties_keep_the_document_order():
+    index = EmbeddingIndex(client=FakeClient())
+    indices, _ = index.top_k(["car"], ["cat", "kitten", "car", "cat"], 3)
+    assert indices.tolist() == [[2, 0, 1]]
@@ -0,0 +1,48 @@
+import numpy as np  # type: ignore
+
+from FrameHashIndex import FrameHashIndex
+
+
+def frame(seed, height=72, width=128):
+    small = np.random.default_rng(seed).random((9, 16, 3)) * 255
+    return small.astype(np.uint8).repeat(height // 9, axis=0).repeat(
+        width // 16, axis=1)
+
+
+def test_near_duplicates_hit_and_other_frames_miss(tmp_path):
+    index = FrameHashIndex(str(tmp_path / "frame_hashes.json"))
+    original = frame(0)
+    index.add_score(index.dhash(original), "a cat", 1)
+    # Re-encoded copy: brighter and a little noise
+    noise = np.random.default_rng(1).integers(-3, 4, original.shape)
+    copy = np.clip(original.astype(int) + 10 + noise, 0, 255).astype(np.uint8)
+    assert index.lookup_score(index.dhash(copy), "a cat") == 1
+    assert index.reused == 1
+    # Known frame, but not scored for this prompt
+    assert index.lookup_score(index.dhash(copy), "a dog") is None
+    other = index.dhash(frame(2))
+    assert index.lookup_score(other, "a cat") is None
+    assert index.is_duplicate(index.dhash(copy), [index.dhash(original)])
+    assert not index.is_duplicate(other, [index.dhash(original)])
+    assert not index.is_duplicate(other, [])
+
+
+def test_save_keeps_the_frames_of_other_jobs(tmp_path):
+    index_path = str(tmp_path / "cache" / "frame_hashes.json")
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"clip")
+    first = FrameHashIndex(index_path)
+    second = FrameHashIndex(index_path)
+    first.add_score("00000000000000ff", "a cat", 0.9)
+    first.add_clip(str(clip), "00000000000000ff")
+    first.save()
+    second.add_score("ffffffff00000000", "a dog", 0.4)
+    second.add_score("00000000000000ff", "a dog", 0.1)
+    second.save()
+
+    merged = FrameHashIndex(index_path)
+    assert len(merged.frames) == 2
+    assert merged.lookup_score("00000000000000ff", "a cat") == 0.9
+    assert merged.lookup_score("00000000000000ff", "a dog") == 0.1
+    assert merged.lookup_score("ffffffff00000000", "a dog") == 0.4
+    assert merged.clip_hash(str(clip)) == "00000000000000ff"
@@ -0,0 +1,38 @@
+import numpy as np
+
+from FramePreFilter import FramePreFilter
+
+
+def blocks_frame(seed=0):
+    """A 'busy' frame: random 10px blocks of colour."""
+    rng = np.random.default_rng(seed)
+    small = (rng.random((36, 64, 3)) * 255).astype(np.uint8)
+    return small.repeat(10, axis=0).repeat(10, axis=1)
+
+
+def test_keeps_busy_frames():
+    prefilter = FramePreFilter()
+    assert prefilter.check(blocks_frame()) is None
+
+
+def test_rejects_black_and_flat_frames():
+    prefilter = FramePreFilter()
+    assert prefilter.check(np.zeros((360, 640, 3), np.uint8)) == "dark"
+    ramp = np.tile(np.linspace(100, 140, 640), (360, 1)).astype(np.uint8)
+    assert prefilter.check(ramp) == "flat"
+
+
+def test_rejects_title_cards():
+    prefilter = FramePreFilter()
+    card = np.full((360, 640, 3), 30, np.uint8)
+    for x in range(120, 520, 40):
+        card[160:200, x:x + 20] = 255
+    assert prefilter.check(card) == "title_card"
+
+
+def test_thresholds_are_configurable_and_counted():
+    prefilter = FramePreFilter({"min_luma": 200})
+    assert prefilter.check(blocks_frame()) == "dark"
+    assert prefilter.check(blocks_frame(1)) == "dark"
+    assert prefilter.report() == 2
+    assert prefilter.checked == 2
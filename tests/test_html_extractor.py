@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("lxml")
+from HtmlExtractor import HtmlExtractor  # noqa: E402
+
+PAGE = """<html><head><script>var x = 1;</script></head><body>
+<nav><a>Home</a></nav>
+<div class="sidebar"><p>Trending</p></div>
+<div id="post-body"><p>First <b>bold</b> words</p><!-- note -->
+<div class="share">Share this</div><p>Second</p> tail</div>
+<footer>Copyright</footer></body></html>"""
+
+
+def test_main_content_without_unwanted_elements():
+    text = HtmlExtractor().extract(PAGE)
+    assert text.split("\n") == ["First", "bold", "words", "Second", "tail"]
+
+
+def test_article_wins_over_content_classes():
+    page = ("<html><body><div class='content'>outside</div>"
+            "<article><p>inside</p></article></body></html>")
+    assert HtmlExtractor().extract(page) == "inside"
+
+
+def test_body_fallback_and_empty_page():
+    assert HtmlExtractor().extract("<html><body><p>x</p></body></html>") == "x"
+    assert HtmlExtractor().extract("") == ""
@@ -0,0 +1,114 @@
+import pytest
+
+from JobQueue import JobQueue, JobWorker, TransientError, is_transient
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=3,
+                     backoff=0, max_backoff=0)
+    yield queue
+    queue.close()
+
+
+def test_jobs_run_by_priority_then_arrival(queue, tmp_path):
+    low = queue.enqueue("https://a.org/low")
+    high = queue.enqueue("https://a.org/high", priority=5)
+    second_low = queue.enqueue("https://a.org/low2")
+    # Another process sees the same queue
+    other = JobQueue(queue.path)
+    assert other.claim("w1")["id"] == high
+    assert queue.claim("w2")["id"] == low
+    assert other.claim("w1")["id"] == second_low
+    assert queue.claim("w2") is None
+    other.close()
+    assert queue.get(high)["status"] == "running"
+    assert queue.get(high)["worker"] == "w1"
+
+
+def test_worker_retries_transient_failures_only(queue):
+    flaky = queue.enqueue("https://a.org/flaky", nb_shorts=2)
+    broken = queue.enqueue("https://a.org/broken")
+    runs = []
+
+    def run(job):
+        runs.append(job["id"])
+        if job["id"] == broken:
+            raise KeyError("fact9")
+        if runs.count(flaky) < 3:
+            raise TransientError("No video downloaded")
+        return [f"short_{i}.mp4" for i in range(job["nb_shorts"])]
+
+    worker = JobWorker(queue, run, "w")
+    while worker.run_once() is not None:
+        pass
+    assert runs.count(broken) == 1
+    assert queue.get(broken)["status"] == "failed"
+    assert "KeyError" in queue.get(broken)["error"]
+    job = queue.get(flaky)
+    assert job["status"] == "done" and job["attempts"] == 3
+    assert job["shorts"] == ["short_0.mp4", "short_1.mp4"]
+
+    stats = queue.stats()
+    assert stats["jobs"]["done"] == 1 and stats["jobs"]["failed"] == 1
+    assert stats["shorts_window"] == 2
+    assert stats["shorts_per_hour"] == 2
+
+
+def test_backoff_and_attempt_limit(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2,
+                     backoff=60, max_backoff=90)
+    job_id = queue.enqueue("https://a.org")
+    queue.claim("w")
+    assert queue.fail(job_id, "timeout", transient=True) == "queued"
+    # Not before the backoff delay
+    assert queue.claim("w") is None
+    queue.db.execute("UPDATE jobs SET not_before = 0")
+    queue.claim("w")
+    assert queue.fail(job_id, "timeout", transient=True) == "failed"
+    assert is_transient(ConnectionError()) and not is_transient(ValueError())
+    queue.close()
+
+
+def test_stale_jobs_fail_after_the_last_attempt(queue):
+    job_id = queue.enqueue("https://a.org/crash")
+    for attempt in range(1, 4):
+        assert queue.claim("w")["attempts"] == attempt
+        # The worker died, the job is still running
+        assert queue.requeue_stale(-1) == (1 if attempt < 3 else 0)
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"].startswith("Stale")
+    assert queue.claim("w") is None
+
+
+def test_only_network_and_server_errors_are_transient():
+    import urllib.error
+
+    import requests  # type: ignore
+
+    def http_error(status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(f"{status}", response=response)
+
+    class DownloadError(Exception):
+        pass
+
+    assert is_transient(requests.ConnectionError())
+    assert is_transient(requests.Timeout())
+    assert is_transient(TimeoutError())
+    assert is_transient(urllib.error.URLError("refused"))
+    assert is_transient(http_error(503)) and is_transient(http_error(429))
+    assert not is_transient(http_error(404))
+    assert not is_transient(urllib.error.HTTPError("u", 404, "", {}, None))
+    assert not is_transient(ValueError("No article text in https://a.org"))
+    assert is_transient(DownloadError("HTTP Error 502: Bad Gateway"))
+    assert not is_transient(DownloadError("HTTP Error 403: Forbidden"))
+    assert not is_transient(DownloadError("Video unavailable"))
+
+
+def test_stats_without_finished_jobs(queue, capsys):
+    queue.enqueue("https://a.org/new")
+    assert queue.stats()["mean_job_seconds"] is None
+    queue.print_stats()
+    assert "n/a per job" in capsys.readouterr().out
@@ -0,0 +1,30 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from LazyImport import lazy_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE = ["VideoProcessor", "VideoEditor", "AudioGenerator",
+            "DocumentProcessor", "YouTubeSearcher"]
+HEAVY = ["ollama", "cv2", "moviepy", "ffmpeg", "PIL", "bs4", "TTS",
+         "moondream", "yt_dlp"]
+
+
+@pytest.mark.parametrize("module", PIPELINE)
+def test_pipeline_modules_import_no_heavy_library(module):
+    code = (f"import sys, {module}\n"
+            f"print(' '.join(m for m in {HEAVY!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_lazy_module_loads_on_first_attribute():
+    json = lazy_import("json")
+    assert "not loaded" in repr(json)
+    assert json.loads("[1]") == [1]
+    assert "(loaded)" in repr(json)
+    assert "dumps" in dir(json)
@@ -0,0 +1,66 @@
+import wave
+import threading
+
+import numpy as np  # type: ignore
+import pytest
+from PIL import Image  # type: ignore
+
+from Backends import make_backend, StubVision, ServerVision, ServerTTS
+from ModelServer import ModelServer, local_backends
+
+
+@pytest.fixture
+def server():
+    server = ModelServer({"port": 0, "max_concurrency": 2}, "stub")
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_server_backends_answer_like_the_local_models(server, tmp_path):
+    vision = make_backend("vision", {"vision": {"name": "server",
+                                                "url": server.url}},
+                          model_path="unused.mf")
+    assert isinstance(vision, ServerVision)
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray((rng.random((32, 48, 3)) * 255)
+                              .astype(np.uint8)) for _ in range(8)]
+    local = StubVision(latency=0)
+    for image in images:
+        expected = local.query(local.encode_image(image), "A prompt?")
+        answer = vision.query(vision.encode_image(image), "A prompt?",
+                              stream=True)["answer"]
+        assert "".join(answer) == expected["answer"]
+
+    tts = ServerTTS(server.url)
+    assert tts.speakers == ["p314"]
+    # Concurrent requests from several pipeline runs
+    paths = [str(tmp_path / f"speech_{i}.wav") for i in range(4)]
+    threads = [threading.Thread(target=tts.tts_to_file,
+                                args=("five words of stub speech",),
+                                kwargs={"file_path": path})
+               for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for path in paths:
+        with wave.open(path) as file:
+            assert file.getnframes() / file.getframerate() == \
+                pytest.approx(2)
+
+    report = tts.metrics()
+    assert report["requests"]["vision"]["requests"] == len(images)
+    assert report["requests"]["tts"]["requests"] == len(paths)
+    assert report["requests"]["tts"]["errors"] == 0
+    assert report["queued"] == 0 and report["running"] == 0
+
+
+def test_bad_requests_and_local_backends(server):
+    with pytest.raises(RuntimeError, match="400"):
+        ServerVision(server.url).request("/vision/query", {"prompt": "?"})
+    with pytest.raises(RuntimeError, match="404"):
+        ServerVision(server.url).request("/unknown")
+    assert local_backends({"vision": "server", "llm": "stub",
+                           "tts": {"name": "server", "url": "x"}}) == \
+        {"vision": "moondream", "llm": "stub", "tts": "coqui"}
@@ -0,0 +1,92 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ModelSessions import ModelSessions
+
+ollama = pytest.importorskip("ollama")
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    """Loads one model at a time, like Ollama on a small machine."""
+    loaded = None
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubOllama.requests.append((self.path, body))
+        load = 0
+        if body.get("keep_alive") == 0:
+            StubOllama.loaded = None
+        elif body["model"] != StubOllama.loaded:
+            StubOllama.loaded = body["model"]
+            load = 2_000_000_000
+        answer = {"model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                  "done": True, "load_duration": load,
+                  "prompt_eval_duration": 100_000_000,
+                  "eval_duration": 400_000_000}
+        if self.path == "/api/chat":
+            answer["message"] = {"role": "assistant", "content": "ok"}
+        else:
+            answer["response"] = ""
+        data = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sessions():
+    StubOllama.loaded = None
+    StubOllama.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield ModelSessions(host=f"http://127.0.0.1:{server.server_port}",
+                        keep_alive="10m")
+    server.shutdown()
+
+
+def ask(sessions, model):
+    return lambda: sessions.chat(model, [{"role": "user", "content": "hi"}])
+
+
+def test_calls_are_grouped_by_model(sessions):
+    calls = [(m, ask(sessions, m)) for m in ["a", "b", "a", "b", "a"]]
+    results = sessions.run_grouped(calls)
+    assert len(results) == 5
+    chats = [body["model"] for path, body in StubOllama.requests
+             if path == "/api/chat"]
+    assert chats == ["a", "a", "a", "b", "b"]
+    assert sessions.switches == 1
+
+
+def test_last_call_of_a_group_frees_the_model_and_preloads_next(sessions):
+    sessions.run_grouped([("a", ask(sessions, "a")),
+                          ("b", ask(sessions, "b"))], next_model="c")
+    assert "c" in sessions.preloads
+    sessions.preloads["c"].join()
+    # A model is only preloaded once the previous group is done
+    assert [(path, body["model"]) for path, body in StubOllama.requests] == [
+        ("/api/chat", "a"), ("/api/generate", "b"), ("/api/chat", "b"),
+        ("/api/generate", "c")]
+    keep_alive = {(path, body["model"]): body["keep_alive"]
+                  for path, body in StubOllama.requests}
+    assert keep_alive[("/api/chat", "a")] == 0
+    assert keep_alive[("/api/chat", "b")] == 0
+    assert keep_alive[("/api/generate", "c")] == "10m"
+
+
+def test_load_and_inference_times_are_recorded(sessions):
+    sessions.chat("a", [{"role": "user", "content": "hi"}])
+    sessions.chat("a", [{"role": "user", "content": "hi"}])
+    report = sessions.report()["a"]
+    assert report["calls"] == 2
+    assert report["load"] == pytest.approx(2.0)
+    assert report["inference"] == pytest.approx(1.0)
@@ -0,0 +1,47 @@
+from PassageSelector import PassageSelector, estimate_tokens
+
+FILLER = "This paragraph talks about the weather and other things in general."
+FACT = ("In 1994 he became the first German driver ever to win the world "
+        "title, a record that surprised everyone.")
+
+
+def article(nb_filler=40):
+    lines = [FILLER.replace("general", f"general {i}") for i in range(nb_filler)]
+    lines.insert(nb_filler // 2, FACT)
+    return "\n".join(lines)
+
+
+def test_keeps_fact_dense_passages_under_budget():
+    selector = PassageSelector(token_budget=60, passage_tokens=40)
+    text, stats = selector.select(article())
+    assert FACT in text
+    assert stats["prompt_tokens"] <= 60
+    assert stats["saved_tokens"] == stats["article_tokens"] - estimate_tokens(text)
+    assert stats["kept_passages"] < stats["passages"]
+
+
+def test_short_article_is_kept_whole_and_in_order():
+    text = article(4)
+    selected, stats = PassageSelector(token_budget=1000).select(text)
+    assert selected == text
+    assert stats["saved_tokens"] == 0
+
+
+def test_lines_over_budget_are_split_between_sentences():
+    # Three single line paragraphs of about 2300 tokens each
+    lines = [" ".join([FILLER] * 130) for _ in range(3)]
+    lines[1] = " ".join([FILLER] * 65 + [FACT] + [FILLER] * 65)
+    selector = PassageSelector()
+    text, stats = selector.select("\n".join(lines))
+    assert FACT in text
+    assert 0 < stats["prompt_tokens"] <= selector.token_budget
+    assert all(estimate_tokens(p) <= selector.passage_tokens
+               for p in selector.split_passages("\n".join(lines)))
+
+
+def test_best_passage_is_cut_to_fit_a_small_budget():
+    # No sentence boundary, passages larger than the budget
+    selector = PassageSelector(token_budget=20, passage_tokens=200)
+    text, stats = selector.select(" ".join(["word"] * 400))
+    assert text and stats["kept_passages"] == 1
+    assert stats["prompt_tokens"] <= 20
@@ -0,0 +1,60 @@
+import json
+import threading
+
+from PipelineMetrics import PipelineMetrics
+
+
+def test_stages_counters_and_buffered_jsonl(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = PipelineMetrics(str(path), flush_every=100)
+    with metrics.stage("extract", "fact1", bytes=10) as record:
+        metrics.add("model_calls")
+        with metrics.stage("decode"):
+            metrics.add("frames_decoded", 5)
+        record["cache_hits"] += 2
+    metrics.log("Test", "x" * 1000)
+    # Buffered: nothing written before the flush
+    assert not path.exists()
+    metrics.flush()
+    events = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [e["type"] for e in events] == ["stage", "stage", "log"]
+    extract = events[1]
+    assert extract["stage"] == "extract" and extract["fact_id"] == "fact1"
+    assert (extract["bytes"], extract["model_calls"], extract["frames_decoded"],
+            extract["cache_hits"]) == (10, 1, 5, 2)
+    assert len(events[2]["message"]) == 500
+
+
+def test_summary_and_open_later(tmp_path):
+    metrics = PipelineMetrics(flush_every=1)
+    for _ in range(3):
+        with metrics.stage("render"):
+            metrics.add("bytes", 100)
+    assert metrics.summary()["render"]["count"] == 3
+    assert metrics.summary()["render"]["bytes"] == 300
+    path = tmp_path / "later.jsonl"
+    metrics.open(str(path))
+    metrics.flush()
+    assert len(path.read_text().splitlines()) == 3
+
+
+def test_concurrent_stages_count_their_own_thread():
+    metrics = PipelineMetrics()
+    both_open = threading.Barrier(2)
+
+    def run(name, frames):
+        with metrics.stage(name) as record:
+            both_open.wait()
+            metrics.add("frames_decoded", frames)
+            both_open.wait()
+        return record
+
+    threads = [threading.Thread(target=run, args=(f"decode_{n}", n))
+               for n in (1, 10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = metrics.summary()
+    assert summary["decode_1"]["frames_decoded"] == 1
+    assert summary["decode_10"]["frames_decoded"] == 10
@@ -0,0 +1,52 @@
+import json
+import time
+import tracemalloc
+
+from Profiler import Profiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sections_write_profiles_and_collapsed_stacks(tmp_path):
+    profiler = Profiler()
+    profiler.configure({"enabled": True, "output_dir": str(tmp_path),
+                        "tracemalloc": True, "sample_interval": 0.001})
+    try:
+        with profiler.section("edit_video"):
+            busy(0.05)
+            for _ in range(2):
+                with profiler.section("change_format"):
+                    data = [0] * 100000
+                    busy(0.05)
+        profiler.write()
+    finally:
+        profiler.stop()
+        tracemalloc.stop()
+    del data
+
+    sections = json.loads((tmp_path / "sections.json").read_text())
+    assert sections["edit_video"]["calls"] == 1
+    assert sections["change_format"]["calls"] == 2
+    # The nested section allocated the list
+    assert sections["change_format"]["memory_peak"] > 100000 * 8 / 2
+    assert (tmp_path / "edit_video.prof").exists()
+    assert "busy" in (tmp_path / "change_format.txt").read_text()
+    lines = (tmp_path / "stacks.collapsed").read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("edit_video;") and int(count) > 0
+    assert any(line.split(" ")[0].endswith(":busy") for line in lines)
+
+
+def test_disabled_profiler_writes_nothing(tmp_path):
+    profiler = Profiler()
+    profiler.configure({"output_dir": str(tmp_path)})
+    with profiler.section("edit_video"):
+        pass
+    profiler.write()
+    assert not profiler.sections and not list(tmp_path.iterdir())
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+import cv2  # type: ignore
+import numpy as np  # type: ignore
+import pytest
+
+from ProxyCache import ProxyCache
+
+
+def write_video(path, seed, width=160, height=96, frames=24):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24,
+                             (width, height))
+    rng = np.random.default_rng(seed)
+    for _ in range(frames):
+        writer.write((rng.random((height, width, 3)) * 255).astype(np.uint8))
+    writer.release()
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None,
+                    reason="The proxies need the ffmpeg binary")
+def test_jobs_share_the_proxies_of_the_same_clips(tmp_path):
+    cache_path = str(tmp_path / "cache")
+    clips = []
+    # The same clip copied into the folders of two jobs
+    for job in ("job1", "job2"):
+        (tmp_path / job).mkdir()
+        clips.append(str(tmp_path / job / "clip_0.mp4"))
+    write_video(clips[0], 0)
+    shutil.copy(clips[0], clips[1])
+    other = str(tmp_path / "job2" / "clip_1.mp4")
+    write_video(other, 1)
+
+    first = ProxyCache(cache_path).get_all(clips[:1])
+    second = ProxyCache(cache_path).get_all([clips[1], other])
+    assert second[clips[1]] == first[clips[0]]
+    assert second[other] != first[clips[0]]
+    # No temporary file left behind
+    assert sorted(os.listdir(f"{cache_path}/proxies")) == sorted(
+        os.path.basename(p) for p in second.values())
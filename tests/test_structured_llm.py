@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from StructuredLLM import StructuredLLM, StructuredOutputError
+from StructuredLLM import VideoMatch, json_schema
+from StructuredLLM import FactAssets, ScriptSection, YoutubeQueries
+from StructuredLLM import first_word, json_items
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    def chat(self, **kwargs):
+        self.calls.append(kwargs)
+        return {"message": {"content": self.content}}
+
+
+def test_schema_from_dataclass():
+    schema = json_schema(FactAssets)
+    assert schema["required"] == ["youtube_queries", "sections"]
+    assert schema["properties"]["youtube_queries"] == {
+        "type": "array", "items": {"type": "string"}}
+    assert json_schema(VideoMatch)["properties"]["indices"]["items"] == {
+        "type": "integer"}
+
+
+def test_generate_single_call_typed_result():
+    client = FakeClient(json.dumps({"indices": [2, 0]}))
+    result = StructuredLLM(client).generate("m", "pick", VideoMatch)
+    assert result == VideoMatch(indices=[2, 0])
+    assert len(client.calls) == 1
+    assert client.calls[0]["format"] == json_schema(VideoMatch)
+    assert client.calls[0]["options"]["temperature"] == 0
+
+
+def test_invalid_answer_raises():
+    client = FakeClient("1. not json")
+    with pytest.raises(StructuredOutputError):
+        StructuredLLM(client).generate("m", "pick", VideoMatch)
+    assert len(client.calls) == 1
+
+
+def test_nested_result_and_constraints():
+    answer = {"youtube_queries": ["q"],
+              "sections": [{"visuals": "v", "narration": "n",
+                            "keywords": ["k"]}]}
+    client = FakeClient(json.dumps(answer))
+    result = StructuredLLM(client).generate(
+        "m", "script", FactAssets,
+        constraints={"sections": {"minItems": 1, "maxItems": 1}})
+    assert result.sections == [ScriptSection("v", "n", ["k"])]
+    sections = client.calls[0]["format"]["properties"]["sections"]
+    assert sections["maxItems"] == 1
+    assert sections["items"]["required"] == ["visuals", "narration",
+                                             "keywords"]
+
+
+def test_incremental_parsers():
+    partial = '{"queries": ["first", "sec'
+    assert json_items(partial, "queries") == ["first"]
+    assert json_items(partial + 'ond"]}', "queries") == ["first", "second"]
+    assert first_word("Ye", ("yes", "no")) is None
+    assert first_word("Yes.", ("yes", "no")) == "yes"
+    assert first_word("maybe ", ("yes", "no")) == ""
+
+
+class StreamingClient:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+
+    def chat(self, **kwargs):
+        assert kwargs["stream"]
+        for piece in self.pieces:
+            self.read += 1
+            yield {"message": {"content": piece}}
+
+
+def test_generate_items_stops_early():
+    pieces = ['{"queries": [', '"a", ', '"b", ', '"c", ', '"d"]}']
+    client = StreamingClient(pieces)
+    items = StructuredLLM(client).generate_items(
+        "m", "queries", YoutubeQueries, "queries", 2)
+    assert items == ["a", "b"]
+    assert client.read == 3
@@ -0,0 +1,31 @@
+from TextCleaner import TextCleaner
+
+LINES = [
+    "Michael Schumacher won seven Formula One world championships.",
+    "Print",
+    "Images of the 1994 season were printed in every newspaper.",
+    "Subscribe to our newsletter for more stories like this one.",
+    "Menu",
+    "Michael Schumacher won seven Formula One world championships.",
+    "A short line.",
+]
+
+
+def test_common_noise_short_and_repeated_lines():
+    text = TextCleaner().clean("\n".join(LINES), "https://time.com/a")
+    assert text.split("\n") == [LINES[0], LINES[2]]
+
+
+def test_domain_noise_only_applies_to_its_site():
+    cleaner = TextCleaner({"time.com": [r"newspaper"]})
+    britannica = list(cleaner.clean_lines(LINES, "https://www.britannica.com/x"))
+    assert britannica == [LINES[0]]
+    time_com = list(cleaner.clean_lines(LINES, "https://time.com/x"))
+    assert time_com == [LINES[0]]
+    assert len(cleaner.compiled) == 2
+
+
+def test_script_sentences():
+    script = '[Shot of a car]\n"First line." [cut] "Second [sic] line."'
+    assert TextCleaner().script_sentences(script) == ["First line.",
+                                                      "Second  line."]
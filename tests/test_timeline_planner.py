@@ -0,0 +1,61 @@
+import pytest
+
+from TimelinePlanner import Cut, TimelinePlanner
+
+
+def section_lengths(edl, nb_sections):
+    lengths = [0.0] * nb_sections
+    for cut in edl:
+        lengths[cut.section] += cut.t_out - cut.t_in
+    return lengths
+
+
+def test_equal_split_sums_to_audio():
+    planner = TimelinePlanner(fps=24)
+    durations = planner.section_durations(31.0, ["a", "b", "c"])
+    assert sum(durations) == pytest.approx(31.0)
+    # Inner boundaries sit on the frame grid
+    assert (durations[0] * 24) == pytest.approx(round(durations[0] * 24))
+
+
+def test_sentence_timing_follows_word_counts():
+    planner = TimelinePlanner()
+    durations = planner.section_durations(
+        30.0, ["one two", "one two three four"], timing="sentences")
+    assert durations[1] == pytest.approx(2 * durations[0], abs=0.05)
+
+
+def test_audio_timing_uses_measured_durations():
+    planner = TimelinePlanner()
+    durations = planner.section_durations(
+        10.0, ["a", "b"], timing="audio", durations=[4.0, 6.0])
+    assert durations == pytest.approx([4.0, 6.0])
+    with pytest.raises(ValueError):
+        planner.section_durations(10.0, ["a", "b", "c"], timing="audio",
+                                  durations=[4.0, 6.0])
+
+
+def test_plan_trims_overshoot_and_loops_short_clips():
+    planner = TimelinePlanner()
+    edl = planner.plan([["a.mp4"], ["b.mp4"]],
+                       {"a.mp4": 10.0, "b.mp4": 4.0},
+                       [7.5, 9.0])
+    assert edl[0] == Cut(0, "a.mp4", 0.0, 7.5)
+    assert section_lengths(edl, 2) == pytest.approx([7.5, 9.0])
+    assert [c.t_in for c in edl if c.section == 1] == [0.0, 0.0, 0.0]
+
+
+def test_plan_avoids_slivers():
+    planner = TimelinePlanner(min_cut=0.25)
+    edl = planner.plan([["a.mp4"]], {"a.mp4": 5.0}, [5.1])
+    assert all(c.t_out - c.t_in >= 0.25 for c in edl)
+    assert section_lengths(edl, 1) == pytest.approx([5.1])
+
+
+def test_edl_round_trip(tmp_path):
+    planner = TimelinePlanner()
+    edl = planner.plan([["a.mp4", "b.mp4"]],
+                       {"a.mp4": 3.0, "b.mp4": 2.0}, [8.0])
+    edl_path = tmp_path / "edl.json"
+    planner.save_edl(edl, edl_path)
+    assert planner.load_edl(edl_path) == edl
@@ -0,0 +1,92 @@
+import os
+import json
+import wave
+import shutil
+
+import cv2  # type: ignore
+import numpy as np  # type: ignore
+import pytest
+
+from ClipReaderCache import ClipReaderCache
+from TimelinePlanner import TimelinePlanner
+from VideoEditor import VideoEditor, is_short_format
+
+SECTIONS = ["First part.", "Second part."]
+
+
+def write_video(path, width=160, height=96, seconds=2, fps=24):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                             (width, height))
+    rng = np.random.default_rng(len(path))
+    for _ in range(seconds * fps):
+        writer.write((rng.random((height, width, 3)) * 255).astype(np.uint8))
+    writer.release()
+
+
+def write_wav(path, seconds, rate=16000):
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(b"\0\0" * int(seconds * rate))
+
+
+@pytest.fixture
+def editor(tmp_path):
+    fact = tmp_path / "fact1"
+    for s_id in range(len(SECTIONS)):
+        folder = fact / "clips" / str(s_id) / "video"
+        folder.mkdir(parents=True)
+        write_video(str(folder / "clip_0.mp4"))
+    (fact / "audio").mkdir()
+    write_wav(str(fact / "audio" / "audio.wav"), 3)
+    fun_facts = {"fun_facts": {"fact1": {
+        "video_script_sections": SECTIONS,
+        "video_script_clean": [" ".join(SECTIONS)]}}}
+    json_path = tmp_path / "fun_facts.json"
+    json_path.write_text(json.dumps(fun_facts))
+    editor = VideoEditor(str(tmp_path), str(json_path))
+    editor.get_video_audio_files("fact1")
+    return editor
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None,
+                    reason="The preview proxies need the ffmpeg binary")
+def test_final_render_after_preview_formats_the_clips(editor):
+    editor.video_2_shors("preview")
+    editor.edit_video("fact1", 1, num_subtitle_sections=2,
+                      max_workers=1, mode="preview")
+    probe = ClipReaderCache()
+    clips = [clip for s_id in range(len(SECTIONS))
+             for clip in editor.clips[str(s_id)]]
+    # Previews read the proxies, the clips are left as they were
+    assert not any(is_short_format(probe.info(c)["video_size"])
+                   for c in clips)
+    assert os.listdir(editor.preview_output_path) == ["short_0.mp4"]
+
+    editor.render_edl("fact1", "final", max_workers=1)
+    probe = ClipReaderCache()
+    assert all(is_short_format(probe.info(c)["video_size"]) for c in clips)
+    short = f"{editor.final_output_path}/short_0.mp4"
+    assert probe.info(short)["video_size"] == [160, 284]
+
+
+def test_audio_timing_cuts_the_sections_to_the_narration(editor):
+    fact = editor.fun_facts["fun_facts"]["fact1"]
+    fact["audio_section_durations"] = [1.0, 2.0]
+    editor.edit_video("fact1", 1, num_subtitle_sections=2, max_workers=1,
+                      timing="audio")
+    edl = TimelinePlanner().load_edl(
+        f"{editor.base_path}/fact1/edl/edl_0.json")
+    lengths = [sum(cut.t_out - cut.t_in for cut in edl
+                   if cut.section == s_id) for s_id in range(2)]
+    assert lengths == pytest.approx([1.0, 2.0], abs=1 / 24)
+    assert os.listdir(editor.final_output_path) == ["short_0.mp4"]
+
+
+def test_audio_timing_needs_one_duration_per_section(editor):
+    fact = editor.fun_facts["fun_facts"]["fact1"]
+    fact["audio_section_durations"] = [1.0, 1.0, 1.0]
+    with pytest.raises(ValueError):
+        editor.edit_video("fact1", 1, num_subtitle_sections=2,
+                          max_workers=1, timing="audio")
@@ -0,0 +1,87 @@
+import os
+import json
+
+import cv2  # type: ignore
+import numpy as np  # type: ignore
+import pytest
+
+from Backends import StubLLM
+from ModelSessions import ModelSessions
+from PipelineMetrics import metrics
+from VideoProcessor import VideoProcessor
+
+FPS = 24
+
+
+def write_shots(path, shots, width=64, height=36, shot_seconds=2):
+    """One still random texture per shot, a hard cut between shots."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS,
+                             (width, height))
+    rng = np.random.default_rng(0)
+    for _ in range(shots):
+        small = (rng.random((height // 4, width // 4, 3)) * 255)
+        frame = small.astype(np.uint8).repeat(4, axis=0).repeat(4, axis=1)
+        for _ in range(shot_seconds * FPS):
+            writer.write(frame)
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def processor(tmp_path):
+    base_path = tmp_path / "outputs"
+    base_path.mkdir()
+    (base_path / "fun_facts.json").write_text(json.dumps({"fun_facts": {}}))
+    (tmp_path / "prompts.json").write_text(json.dumps({}))
+    return VideoProcessor(str(base_path), "fun_facts.json",
+                          str(tmp_path / "prompts.json"),
+                          library_path=str(tmp_path / "clip_library"),
+                          sessions=ModelSessions(client=StubLLM(latency=0)))
+
+
+def test_detect_shots_finds_the_cuts(processor, tmp_path):
+    video_path = write_shots(str(tmp_path / "video_shots.mp4"), 3)
+    segments = processor.detect_shots(video_path, max_shot_seconds=10)
+    assert segments == [(0, 48), (48, 96), (96, 144)]
+    # Longer shots are split
+    processor.shots = {}
+    assert len(processor.detect_shots(video_path, max_shot_seconds=1)) == 6
+
+
+def test_shot_frames_come_from_the_detection_pass(processor, tmp_path):
+    video_path = write_shots(str(tmp_path / "video_shots.mp4"), 3)
+    with metrics.stage("test") as record:
+        # Once per script section, like convert_videos2clips
+        for _ in range(3):
+            processor.extract_center_frames("fact1", video_path, 10, 0.5,
+                                            segmentation="shots")
+    # The 4 frames per second of a single shot detection, nothing more
+    assert record["frames_decoded"] == 6 * 4
+    assert processor.segments == [(0, 48), (48, 96), (96, 144)]
+    for f_i in processor.frames_info:
+        assert os.path.exists(f_i["frame_path"])
+        assert cv2.imread(f_i["frame_path"]).shape == (18, 32, 3)
+    # Only the frame of each segment is kept
+    factor, samples = processor.shot_samples[video_path]
+    assert factor == 0.5 and sorted(samples) == [24, 72, 120]
+
+
+def test_adaptive_scoring_refines_around_the_relevant_part(processor,
+                                                           tmp_path):
+    # 20 segments of one second, only 7 to 10 show the subject
+    video_path = write_shots(str(tmp_path / "video_peaks.mp4"), 10)
+    sampled = []
+
+    def score_frame(model, f_i, prompt):
+        segment = f_i["clip_start"] // FPS
+        sampled.append(segment)
+        return int(7 <= segment <= 10), True
+    processor.score_frame = score_frame
+    processor.evaluate_frames_adaptive("fact1", video_path, None, "prompt",
+                                       1, 0.5, coarse_step=4)
+    # Coarse pass, then the neighbours of the relevant segments until the
+    # scores drop on both sides
+    assert sampled[:6] == [0, 4, 8, 12, 16, 19]
+    assert sorted(sampled[6:]) == [6, 7, 9, 10, 11]
+    relevant = processor.response_array.reshape(20, FPS).max(axis=1)
+    assert list(np.nonzero(relevant)[0]) == [7, 8, 9, 10]